@@ -113,15 +113,14 @@ class BaseExample:
                 "sensitive_features": fairlearn_sensitive_features,
                 "eval_method": fairlearn_eval_method,
             }
-            for fairlearn_epsilon_constraint in fairlearn_constraint_epsilons:
-                plot_generator.run_fairlearn_experiment(
-                    verbose=verbose,
-                    fairlearn_sensitive_feature_names=fairlearn_sensitive_feature_names,
-                    fairlearn_constraint_name=fairlearn_constraint_name,
-                    fairlearn_epsilon_constraint=fairlearn_epsilon_constraint,
-                    fairlearn_epsilon_eval=fairlearn_epsilon_eval,
-                    fairlearn_eval_kwargs=fairlearn_eval_kwargs,
-                )
+            plot_generator.run_fairlearn_sweep(
+                verbose=verbose,
+                fairlearn_sensitive_feature_names=fairlearn_sensitive_feature_names,
+                fairlearn_constraint_name=fairlearn_constraint_name,
+                fairlearn_epsilons_constraint=fairlearn_constraint_epsilons,
+                fairlearn_epsilon_eval=fairlearn_epsilon_eval,
+                fairlearn_eval_kwargs=fairlearn_eval_kwargs,
+            )
         # Run Seldonian experiment
         plot_generator.run_seldonian_experiment(verbose=verbose)
 
@@ -1,4 +1,5 @@
 import autograd.numpy as np
+import numpy as onp  # For ufunc methods that autograd does not wrap
 
 
 class SupervisedExperimentBaseline:
@@ -43,7 +44,12 @@ class RLExperimentBaseline(object):
                 actions,
                 behavior_action_probs
             )
-        is also required.
+        is also required. Batched variants that evaluate many episodes
+        (and optionally many thetas) at once are provided by
+        get_probs_from_episode_arrays() and get_importance_weights_from_episode_arrays().
+        Child classes can override the former with a vectorized implementation.
+        Ground truth evaluation of J_pi_new_IS constraints uses the latter
+        (see experiments.experiment_utils.precompute_IS_base_node_values()).
 
         :param model_name: The string name to give the model. This will be used 
             as the prefix for the directory in which the model's results are saved.
@@ -66,3 +72,69 @@ class RLExperimentBaseline(object):
         generated using the behavior policy. Must return the trained policy parameters.
         """
         raise NotImplementedError("Implement this method in a child class")
+
+    def get_probs_from_episode_arrays(
+        self, thetas, observations, actions, behavior_action_probs
+    ):
+        """Get the action probabilities of every timestep of many episodes
+        under one or more policy parameterizations. The episodes are
+        flattened into contiguous arrays, e.g., using
+        experiments.experiment_utils.stack_episodes().
+        This default implementation makes one call to
+        get_probs_from_observations_and_actions() per theta covering
+        all timesteps of all episodes. Override it in a child class
+        for a fully vectorized version.
+
+        :param thetas: A sequence of policy weights. Pass [theta]
+            for a single parameterization.
+        :param observations: Array of the observations at every timestep
+            of every episode
+        :param actions: Array of the actions at every timestep
+            of every episode
+        :param behavior_action_probs: Array of the action probabilities of the
+            behavior policy at every timestep of every episode
+
+        :return: Array of action probabilities of shape (len(thetas),len(actions))
+        """
+        return np.array(
+            [
+                self.get_probs_from_observations_and_actions(
+                    theta, observations, actions, behavior_action_probs
+                )
+                for theta in thetas
+            ]
+        )
+
+    def get_importance_weights_from_episode_arrays(
+        self, thetas, observations, actions, behavior_action_probs, episode_offsets
+    ):
+        """Get the importance weight, i.e., the product over timesteps of
+        pi_new/pi_behavior, of each episode under one or more policy
+        parameterizations.
+
+        :param thetas: A sequence of policy weights. Pass [theta]
+            for a single parameterization.
+        :param observations: Array of the observations at every timestep
+            of every episode
+        :param actions: Array of the actions at every timestep
+            of every episode
+        :param behavior_action_probs: Array of the action probabilities of the
+            behavior policy at every timestep of every episode
+        :param episode_offsets: Array of length n_episodes+1. The timesteps
+            of episode i are [episode_offsets[i],episode_offsets[i+1]).
+            Every episode must have at least one timestep.
+
+        :return: Array of importance weights of shape (len(thetas),n_episodes)
+        """
+        pi_news = self.get_probs_from_episode_arrays(
+            thetas, observations, actions, behavior_action_probs
+        )
+        ratios = onp.asarray(pi_news) / onp.asarray(behavior_action_probs)
+        # The product over the timesteps of each episode is the exp of the
+        # sum of the logs, which reduceat() takes for all episodes at once.
+        # A zero ratio gives log(0)=-inf and so a zero importance weight.
+        with onp.errstate(divide="ignore"):
+            log_ratios = onp.log(ratios)
+        return onp.exp(
+            onp.add.reduceat(log_ratios, onp.asarray(episode_offsets)[:-1], axis=1)
+        )
@@ -1,6 +1,5 @@
 import autograd.numpy as np
 import cma
-import cma
 from seldonian.utils.io_utils import cmaes_logger
 from seldonian.RL.Agents.Policies.SimglucosePolicyFixedArea import (
     SigmoidPolicyFixedArea,
@@ -18,6 +17,7 @@ class RLDiabetesUSAgentBaseline:
         bb_cfmax=25.0,
         cr_shrink_factor=np.sqrt(3),
         cf_shrink_factor=np.sqrt(3),
+        batch_objective=False,
     ):
         """Implements an RL baseline that uses importance sampling
         with unequal support (US) with a fixed area policy.
@@ -32,6 +32,10 @@ class RLDiabetesUSAgentBaseline:
             CR size of the box by for this fixed area policy
         :param cf_shrink_factor: Factor to shrink the bounding box
             CR size of the box by for this fixed area policy
+        :param batch_objective: If True, run CMA-ES with an explicit
+            ask/tell loop and evaluate each population of candidate
+            solutions in a single vectorized call
+            to primary_objective_fn_batch()
         """
         super().__init__()
         self.model_name = "diabetes_us"
@@ -45,6 +49,7 @@ class RLDiabetesUSAgentBaseline:
             cr_shrink_factor=cr_shrink_factor,
             cf_shrink_factor=cf_shrink_factor,
         )
+        self.batch_objective = batch_objective
 
     def set_new_params(self, new_params):
         """Set the parameters of the agent
@@ -63,6 +68,13 @@ class RLDiabetesUSAgentBaseline:
         """
         self.episodes = dataset.episodes
         n_eps = len(self.episodes)
+        # Cache the behavior policy actions and returns as arrays
+        # so the objective function does not have to loop over episodes.
+        # There is one action and one reward per episode.
+        behavior_actions = np.array([ep.actions[0] for ep in self.episodes])
+        self.cr_b = behavior_actions[:, 0]
+        self.cf_b = behavior_actions[:, 1]
+        self.behavior_returns = np.array([ep.rewards[0] for ep in self.episodes])
         theta_init = self.initial_solution
         crmin_init, crmax_init, cfmin_init, cfmax_init = self.policy.theta2crcf(
             theta_init
@@ -80,7 +92,12 @@ class RLDiabetesUSAgentBaseline:
         # minimize the primary objective function,
         # which is the expected return. So we want to minimize
         # the negative expected return
-        es.optimize(self.primary_objective_fn, callback=None)
+        if self.batch_objective:
+            while not es.stop():
+                thetas = es.ask()
+                es.tell(thetas, list(self.primary_objective_fn_batch(thetas)))
+        else:
+            es.optimize(self.primary_objective_fn, callback=None)
         solution = es.result.xbest
         crmin_sol, crmax_sol, cfmin_sol, cfmax_sol = self.policy.theta2crcf(solution)
         if (solution is None) or (not all(np.isfinite(solution))):
@@ -97,11 +114,37 @@ class RLDiabetesUSAgentBaseline:
         :return: the negative expected return of the history in self.episodes
         """
         crmin, crmax, cfmin, cfmax = self.policy.theta2crcf(theta)
-        returns_inside_theta_box = []
-        for ii, ep in enumerate(self.episodes):
-            cr_b, cf_b = ep.actions[0]  # behavior policy action
-            primary_return = ep.rewards[0]  # one reward per episode, so reward=return
-            if (crmin <= cr_b <= crmax) and (cfmin <= cf_b <= cfmax):
-                returns_inside_theta_box.append(primary_return)
-        f = np.mean(returns_inside_theta_box)
+        inside_theta_box = (
+            (crmin <= self.cr_b)
+            & (self.cr_b <= crmax)
+            & (cfmin <= self.cf_b)
+            & (self.cf_b <= cfmax)
+        )
+        f = np.mean(self.behavior_returns[inside_theta_box])
+        return -1.0 * f
+
+    def primary_objective_fn_batch(self, thetas):
+        """Vectorized version of primary_objective_fn()
+        that evaluates a whole population of model weights at once.
+
+        :param thetas: A sequence of model weights, e.g. the
+            candidate solutions returned by CMA-ES's ask()
+
+        :return: 1D array of the negative expected return for each theta
+        """
+        # theta2crcf() indexes theta[0] and theta[1],
+        # so passing the transpose returns one box edge per theta
+        crmin, crmax, cfmin, cfmax = self.policy.theta2crcf(np.array(thetas).T)
+        inside_theta_box = (
+            (np.reshape(crmin, (-1, 1)) <= self.cr_b)
+            & (self.cr_b <= np.reshape(crmax, (-1, 1)))
+            & (np.reshape(cfmin, (-1, 1)) <= self.cf_b)
+            & (self.cf_b <= np.reshape(cfmax, (-1, 1)))
+        )
+        n_inside = inside_theta_box.sum(axis=1)
+        # Same as np.mean() of an empty selection: nan if no episodes are in the box
+        with np.errstate(invalid="ignore", divide="ignore"):
+            f = inside_theta_box.dot(self.behavior_returns) / n_inside
+        # Without shrinking, every theta maps to the same box
+        f = np.broadcast_to(f, (len(thetas),))
         return -1.0 * f
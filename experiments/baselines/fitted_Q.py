@@ -1,4 +1,6 @@
 import autograd.numpy as np
+from scipy import sparse
+from seldonian.RL.Agents.Policies.Softmax import DiscreteSoftmax
 from .baselines import RLExperimentBaseline
 
 
@@ -66,11 +68,10 @@ class BaseFittedQBaseline(RLExperimentBaseline):
                 X, y = self.make_regression_dataset(transitions, make_X=True)
             else:
                 _, y = self.make_regression_dataset(transitions, make_X=False)
-            # Instantiate a new regressor in each iteration so it has no memory of the previous fit
-            self.regressor = self.instantiate_regressor()
-            self.regressor.fit(X, y)
+            self.fit_regressor(X, y)
             # Update Q function using results of the regression
             self.update_Q_weights()
+            self.n_iters_run = i + 1
             if self.stopping_criteria_met():
                 break
         return self.get_policy_params()
@@ -151,6 +152,17 @@ class BaseFittedQBaseline(RLExperimentBaseline):
         """
         raise NotImplementedError("Implement this method in a child class")
 
+    def fit_regressor(self, X, y):
+        """Fit the regressor to the features and labels
+        of the current fitted-Q iteration.
+
+        :param X: Features, as returned by make_X()
+        :param y: Labels (Q targets), as returned by make_y()
+        """
+        # Instantiate a new regressor in each iteration so it has no memory of the previous fit
+        self.regressor = self.instantiate_regressor()
+        self.regressor.fit(X, y)
+
     def instantiate_regressor(self):
         """Create the regressor object and return it.
         This should be an instance of the self.regressor_class class, instantiated with
@@ -181,6 +193,10 @@ class ExactTabularFittedQBaseline(BaseFittedQBaseline):
         num_iters=100,
         env_kwargs={"gamma": 1.0},
         regressor_kwargs={},
+        sparse_features=False,
+        closed_form=False,
+        greedy_stability_iters=1,
+        q_tol=None,
     ):
         """Implements fitted-Q RL baseline where the policy is a Q table.
         Uses the regressor weights to update the Q table. Works for parametric
@@ -193,6 +209,20 @@ class ExactTabularFittedQBaseline(BaseFittedQBaseline):
             "num_actions": int
             "terminal_obs": int (the terminal state)
 
+        :param sparse_features: If True, the one-hot feature matrix is built
+            as a scipy.sparse CSR matrix, which needs O(N) memory instead of
+            O(N*num_observations*num_actions). The regressor must accept
+            sparse input.
+        :param closed_form: If True, skip the regressor entirely. The least
+            squares fit on one-hot (observation,action) features is the mean
+            Q target of each (observation,action) pair, which is computed
+            directly with np.bincount.
+        :param greedy_stability_iters: Stop once the greedy action in every
+            observation has not changed for this many consecutive iterations.
+            None disables this stopping criterion.
+        :param q_tol: Stop once the largest absolute change of any Q table
+            entry between consecutive iterations is at most q_tol.
+            None (default) disables this stopping criterion.
         """
         super().__init__(
             model_name=model_name,
@@ -205,9 +235,24 @@ class ExactTabularFittedQBaseline(BaseFittedQBaseline):
         self.num_observations = env_kwargs["num_observations"]
         self.num_actions = env_kwargs["num_actions"]
         self.terminal_obs = env_kwargs["terminal_observation"]
+        self.sparse_features = sparse_features
+        self.closed_form = closed_form
+        self.greedy_stability_iters = greedy_stability_iters
+        self.q_tol = q_tol
 
     def reset_policy_params(self):
-        self.policy.set_new_params(np.zeros((self.num_observations, self.num_actions)))
+        """Set the Q table to all zeros and clear
+        the state tracked by the stopping criteria"""
+        self.set_new_params(np.zeros((self.num_observations, self.num_actions)))
+        self.last_q_table = None
+        self.last_greedy_actions = []
+        self.n_stable_iters = 0
+
+    def set_new_params(self, weights):
+        """Set the policy parameters and keep a cached view
+        of them as a (num_observations,num_actions) Q table"""
+        self.q_table = np.reshape(weights, (self.num_observations, self.num_actions))
+        return super().set_new_params(weights)
 
     def get_next_obs(self, observations, index):
         """Get the next observation, o', from a given transition. Sometimes this
@@ -225,8 +270,31 @@ class ExactTabularFittedQBaseline(BaseFittedQBaseline):
         return next_obs
 
     def make_X(self, observations, actions):
-        """Make the feature array that will be used to train the regressor."""
-        X = np.array(list(map(self.one_hot_encode, observations, actions)))
+        """Make the feature array that will be used to train the regressor.
+        Each row is the one-hot vector of an (observation,action) pair.
+
+        :return: X - a scipy.sparse CSR matrix if self.sparse_features is True,
+            otherwise a 2D numpy ndarray. If self.closed_form is True,
+            no regressor is trained, so the flat (observation,action)
+            indices are returned instead.
+        """
+        self.sa_indices = (
+            np.asarray(observations, dtype=int) * self.num_actions
+            + np.asarray(actions, dtype=int)
+        )
+        if self.closed_form:
+            return self.sa_indices
+
+        n_rows = len(self.sa_indices)
+        n_features = self.num_observations * self.num_actions
+        if self.sparse_features:
+            X = sparse.csr_matrix(
+                (np.ones(n_rows), self.sa_indices, np.arange(n_rows + 1)),
+                shape=(n_rows, n_features),
+            )
+        else:
+            X = np.zeros((n_rows, n_features))
+            X[np.arange(n_rows), self.sa_indices] = 1
         return X
 
     def one_hot_encode(self, o, a):
@@ -242,7 +310,73 @@ class ExactTabularFittedQBaseline(BaseFittedQBaseline):
         For evaluating the max_a' Q(s_t+1,a')
         term in the target.
         """
-        return max(self.policy.get_params()[obs])
+        return np.max(self.q_table[obs])
+
+    def get_probs_from_observations_and_actions(
+        self, theta, observations, actions, behavior_action_probs
+    ):
+        """
+        A wrapper for obtaining the action probabilities for each timestep a single episode.
+        When the policy is a DiscreteSoftmax over the Q table, the probabilities
+        are computed directly from the rows of the Q table that the episode visits.
+
+        :param theta: Weights of the new policy
+        :param observations: An array of the observations at each timestep in the episode
+        :param actions: An array of the actions at each timestep in the episode
+        :param behavior_action_probs: An array of the action probabilities of the behavior policy
+            at each timestep in the episode
+
+        :return: Action probabilities under the new policy (parameterized by theta)
+        """
+        self.set_new_params(theta)
+        if isinstance(self.policy, DiscreteSoftmax):
+            return self.get_probs_from_episode_arrays(
+                [theta], observations, actions, behavior_action_probs
+            )[0]
+        return self.policy.get_probs_from_observations_and_actions(
+            observations, actions, behavior_action_probs
+        )
+
+    def get_probs_from_episode_arrays(
+        self, thetas, observations, actions, behavior_action_probs
+    ):
+        """Get the action probabilities of every timestep of many episodes
+        under one or more Q tables in a single vectorized call when the policy
+        is a DiscreteSoftmax. Falls back on the parent class otherwise.
+
+        :param thetas: A sequence of Q tables (or flattened Q tables).
+            Pass [theta] for a single Q table.
+        :param observations: Array of the observations at every timestep
+            of every episode
+        :param actions: Array of the actions at every timestep
+            of every episode
+        :param behavior_action_probs: Array of the action probabilities of the
+            behavior policy at every timestep of every episode
+
+        :return: Array of action probabilities of shape (len(thetas),len(actions))
+        """
+        if not isinstance(self.policy, DiscreteSoftmax):
+            return super().get_probs_from_episode_arrays(
+                thetas, observations, actions, behavior_action_probs
+            )
+        q_tables = np.reshape(thetas, (-1, self.num_observations, self.num_actions))
+        observations = np.asarray(observations, dtype=int)
+        actions = np.asarray(actions, dtype=int)
+        # Softmax over the actions of only the visited observations
+        action_values = q_tables[:, observations, :]
+        action_values = action_values - np.max(action_values, axis=2, keepdims=True)
+        e_to_the_something_terms = np.exp(action_values)
+        denom = np.sum(e_to_the_something_terms, axis=2)
+        timesteps = np.arange(len(actions))
+        return e_to_the_something_terms[:, timesteps, actions] / denom
+
+    def make_y(self, rewards, next_observations):
+        """Make the label array that will be used to train the regressor.
+        Vectorized over all transitions using the cached Q table.
+        """
+        max_q = np.max(self.q_table, axis=1)
+        next_observations = np.asarray(next_observations, dtype=int)
+        return np.asarray(rewards, dtype=float) + self.gamma * max_q[next_observations]
 
     def instantiate_regressor(self):
         """Create the regressor object and return it.
@@ -254,6 +388,27 @@ class ExactTabularFittedQBaseline(BaseFittedQBaseline):
         regressor = self.regressor_class(fit_intercept=False)
         return regressor
 
+    def fit_regressor(self, X, y):
+        """Fit the regressor to the features and labels
+        of the current fitted-Q iteration. If self.closed_form is True,
+        compute the least squares solution directly: the mean
+        Q target of each (observation,action) pair. Pairs that never
+        appear in the data get a weight of 0, same as the minimum
+        norm least squares solution.
+
+        :param X: Features, as returned by make_X()
+        :param y: Labels (Q targets), as returned by make_y()
+        """
+        if not self.closed_form:
+            return super().fit_regressor(X, y)
+
+        n_features = self.num_observations * self.num_actions
+        sums = np.bincount(X, weights=y, minlength=n_features)
+        counts = np.bincount(X, minlength=n_features)
+        self.closed_form_weights = np.divide(
+            sums, counts, out=np.zeros(n_features), where=counts > 0
+        )
+
     def update_Q_weights(self):
         """Update Q function weights given results of the regressor."""
         fitted_weights = self.get_regressor_weights()
@@ -264,38 +419,45 @@ class ExactTabularFittedQBaseline(BaseFittedQBaseline):
         from the regressor, reshaping so they
         have same shape as Q table.
         """
-        native_weights = self.regressor.coef_
+        if self.closed_form:
+            native_weights = self.closed_form_weights
+        else:
+            native_weights = self.regressor.coef_
         return native_weights.reshape(self.num_observations, self.num_actions)
 
     def set_q_table(self, weights):
-        """Set the Q table parameters"""
+        """Set the Q table parameters, remembering the previous
+        Q table for the stopping criteria"""
+        self.last_q_table = self.q_table
         self.set_new_params(weights)
 
     def stopping_criteria_met(self):
-        """If the greedy actions in each observation
-        are not changing from iteration to iteration
-        then we can stop the algorithm and return the optimal solution.
-        Should keep track of last few greedy actions.
+        """Stop if the greedy actions in each observation
+        have not changed for self.greedy_stability_iters
+        consecutive iterations, or if no entry of the Q table changed
+        by more than self.q_tol since the last iteration.
+        Either criterion can be disabled by setting it to None.
         """
-        current_greedy_actions = np.array(
-            [
-                np.argmax(self.policy.get_params()[obs])
-                for obs in range(self.num_observations)
-            ]
-        )
+        current_greedy_actions = np.argmax(self.q_table, axis=1)
         if len(self.last_greedy_actions) == 0:
-            self.last_greedy_actions = current_greedy_actions
-            return False
-        if all(
-            [
-                current_greedy_actions[ii] == self.last_greedy_actions[ii]
-                for ii in range(len(current_greedy_actions))
-            ]
+            self.n_stable_iters = 0
+        elif np.array_equal(current_greedy_actions, self.last_greedy_actions):
+            self.n_stable_iters += 1
+        else:
+            self.n_stable_iters = 0
+        self.last_greedy_actions = current_greedy_actions
+
+        if (
+            self.greedy_stability_iters is not None
+            and self.n_stable_iters >= self.greedy_stability_iters
         ):
-            self.last_greedy_actions = current_greedy_actions
             return True
 
-        self.last_greedy_actions = current_greedy_actions
+        if self.q_tol is not None and self.last_q_table is not None:
+            max_q_change = np.max(np.abs(self.q_table - self.last_q_table))
+            if max_q_change <= self.q_tol:
+                return True
+
         return False
 
 
@@ -308,12 +470,21 @@ class ApproximateTabularFittedQBaseline(ExactTabularFittedQBaseline):
         num_iters=100,
         env_kwargs={"gamma": 1.0},
         regressor_kwargs={},
+        sparse_features=False,
+        greedy_stability_iters=1,
+        q_tol=None,
     ):
         """Implements fitted-Q RL baseline for a Q table,
         but uses the fitted regressor to approximate the Q values.
         Useful for nonparametric regressors. The features of the
         regression problem are the one-hot vectors
         of the (observation,action) pairs.
+
+        :param sparse_features: If True, the one-hot feature matrices
+            are built as scipy.sparse CSR matrices. The regressor must
+            accept sparse input.
+        :param greedy_stability_iters: See ExactTabularFittedQBaseline
+        :param q_tol: See ExactTabularFittedQBaseline
         """
         super().__init__(
             model_name=model_name,
@@ -322,6 +493,9 @@ class ApproximateTabularFittedQBaseline(ExactTabularFittedQBaseline):
             num_iters=num_iters,
             env_kwargs=env_kwargs,
             regressor_kwargs=regressor_kwargs,
+            sparse_features=sparse_features,
+            greedy_stability_iters=greedy_stability_iters,
+            q_tol=q_tol,
         )
 
     def instantiate_regressor(self):
@@ -338,10 +512,10 @@ class ApproximateTabularFittedQBaseline(ExactTabularFittedQBaseline):
         """Approximates Q table by passing each possible
         one-hot encoding of (observation,action) pairs
         through the regressor's forward pass."""
-        vecs = []
-        for i in range(self.num_observations * self.num_actions):
-            vec = np.zeros(self.num_observations * self.num_actions)
-            vec[i] = 1
-            vecs.append(vec)
+        n_features = self.num_observations * self.num_actions
+        if self.sparse_features:
+            vecs = sparse.identity(n_features, format="csr")
+        else:
+            vecs = np.eye(n_features)
         Q = self.regressor.predict(vecs)
         return Q.reshape(self.num_observations, self.num_actions)
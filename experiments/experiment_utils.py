@@ -1,7 +1,10 @@
 """ Utilities used in the rest of the library """
 
-import os, copy, pickle, math
+import os, copy, pickle, math, uuid
 import numpy as np
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 from seldonian.RL.RL_runner import (
     run_trial,
@@ -11,6 +14,9 @@ from seldonian.RL.RL_runner import (
 from seldonian.utils.stats_utils import weighted_sum_gamma
 from seldonian.dataset import SupervisedDataSet, RLDataSet, CustomDataSet
 from seldonian.utils.io_utils import load_pickle, save_pickle
+from seldonian.parse_tree.nodes import BaseNode, RLAltRewardBaseNode
+
+from .perf_eval_funcs import get_streaming_metric, get_batched_metric
 
 
 def generate_behavior_policy_episodes(
@@ -59,6 +65,220 @@ def generate_behavior_policy_episodes(
     return
 
 
+class MemmapArray(np.memmap):
+    """A read-only np.memmap of a .npy file that is pickled by
+    filename rather than by value, so that datasets backed by it can
+    be passed to worker processes without copying the data.
+    Indexing it returns plain numpy arrays. Other views of it,
+    e.g. its transpose, are pickled by value, since reopening the
+    file would give the whole array instead.
+    Create it with open_memmap_array().
+    """
+
+    def __array_finalize__(self, obj):
+        super().__array_finalize__(obj)
+        # The layout of the whole file, shared by all views of it
+        self._file_layout = getattr(obj, "_file_layout", None)
+
+    def __getitem__(self, key):
+        return np.asarray(super().__getitem__(key))
+
+    def _layout(self):
+        """The shape, strides, dtype and data address of this array"""
+        return (self.shape, self.strides, self.dtype, self.ctypes.data)
+
+    def __reduce__(self):
+        if self._file_layout is not None and self._layout() == self._file_layout:
+            return (open_memmap_array, (self.filename,))
+        return np.asarray(self).__reduce__()
+
+
+def open_memmap_array(filename):
+    """Memory-map a .npy file as a MemmapArray
+
+    :param filename: Path to a .npy file
+    :type filename: str
+
+    :return: The memory-mapped array
+    :rtype: MemmapArray
+    """
+    array = np.load(filename, mmap_mode="r").view(MemmapArray)
+    array._file_layout = array._layout()
+    return array
+
+
+def load_memmap_supervised_dataset(
+    features_filename, labels_filename, meta, sensitive_attrs_filename=None
+):
+    """Create a supervised dataset whose features, labels and
+    sensitive attributes stay on disk in .npy files
+    instead of being read into memory.
+
+    :param features_filename: Path to the .npy file of features
+    :type features_filename: str
+    :param labels_filename: Path to the .npy file of labels
+    :type labels_filename: str
+    :param meta: The metadata of the dataset
+    :param sensitive_attrs_filename: Path to the .npy file of
+        sensitive attributes, if any
+    :type sensitive_attrs_filename: str
+
+    :rtype: SupervisedDataSet
+    """
+    features = open_memmap_array(features_filename)
+    labels = open_memmap_array(labels_filename)
+    if sensitive_attrs_filename is not None:
+        sensitive_attrs = open_memmap_array(sensitive_attrs_filename)
+    else:
+        sensitive_attrs = []
+    return SupervisedDataSet(
+        features=features,
+        labels=labels,
+        sensitive_attrs=sensitive_attrs,
+        num_datapoints=len(labels),
+        meta=meta,
+    )
+
+
+def is_out_of_core(dataset):
+    """Whether a dataset's features are memory-mapped from disk
+
+    :param dataset: A seldonian dataset object
+    :rtype: bool
+    """
+    features = dataset.features
+    if type(features) == list:
+        return any(isinstance(x, np.memmap) for x in features)
+    return isinstance(features, np.memmap)
+
+
+class IndexedArray:
+    def __init__(self, base, indices):
+        """The rows of base selected by indices, which are only
+        read (gathered) from base when this array is indexed.
+        Used for trial datasets resampled from out-of-core datasets.
+
+        :param base: The array to select rows from, usually a MemmapArray
+        :param indices: Row indices into base
+        :type indices: 1D numpy.ndarray
+        """
+        self.base = base
+        self.indices = np.asarray(indices)
+
+    @property
+    def shape(self):
+        return (len(self.indices),) + tuple(self.base.shape[1:])
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, key):
+        indices = self.indices[key]
+        if np.ndim(indices) == 0:
+            return np.asarray(self.base[indices])
+        # Read the rows in file order, then restore the requested order
+        order = np.argsort(indices, kind="stable")
+        gathered = np.asarray(self.base[indices[order]])
+        rows = np.empty_like(gathered)
+        rows[order] = gathered
+        return rows
+
+    def __array__(self, dtype=None):
+        rows = self[:]
+        if dtype is not None:
+            rows = rows.astype(dtype)
+        return rows
+
+
+class IndexedData:
+    def __init__(self, base, indices):
+        """The samples of base selected by indices, for custom regime
+        data of arbitrary form (e.g., a list of strings). Samples are
+        only looked up in base when this view is indexed, so no copy
+        of the data is made until a slice of it is needed.
+
+        :param base: The data to select samples from, a list or array
+        :param indices: Sample indices into base
+        :type indices: 1D numpy.ndarray
+        """
+        self.base = base
+        self.indices = np.asarray(indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        for ii in self.indices:
+            yield self.base[ii]
+
+    def __getitem__(self, key):
+        indices = self.indices[key]
+        if np.ndim(indices) == 0:
+            return self.base[indices]
+        if isinstance(self.base, np.ndarray):
+            return self.base[indices]
+        # References to the original samples, not copies of them
+        return [self.base[ii] for ii in indices]
+
+
+class IndexedCustomDataSet:
+    def __init__(self, dataset, indices):
+        """A view of the samples of a custom regime dataset selected by
+        indices. Holds a reference to the original dataset and the
+        index array rather than a copy of the samples. Sensitive
+        attributes are gathered right away because they are arrays.
+
+        :param dataset: The original dataset
+        :type dataset: CustomDataSet
+        :param indices: Sample indices into dataset
+        :type indices: 1D numpy.ndarray
+        """
+        self.data = IndexedData(dataset.data, indices)
+        if isinstance(dataset.sensitive_attrs, np.ndarray):
+            self.sensitive_attrs = dataset.sensitive_attrs[self.data.indices]
+        else:
+            self.sensitive_attrs = []
+        self.num_datapoints = len(self.data)
+        self.meta = dataset.meta
+        self.regime = "custom"
+        self.sensitive_col_names = dataset.sensitive_col_names
+
+
+def make_indexed_dataset(dataset, indices):
+    """Make the dataset consisting of the rows of dataset
+    selected by indices. For out-of-core supervised datasets the
+    features are gathered lazily (see IndexedArray), while the
+    labels and sensitive attributes are gathered right away because
+    seldonian datasets require them to be arrays. Custom regime
+    datasets become an IndexedCustomDataSet view.
+
+    :param dataset: The out-of-core or custom regime dataset
+    :type dataset: SupervisedDataSet or CustomDataSet
+    :param indices: Row indices into dataset
+    :type indices: 1D numpy.ndarray
+
+    :rtype: SupervisedDataSet or IndexedCustomDataSet
+    """
+    if dataset.regime == "custom":
+        return IndexedCustomDataSet(dataset, indices)
+    if type(dataset.features) == list:
+        features = [IndexedArray(x, indices) for x in dataset.features]
+    else:
+        features = IndexedArray(dataset.features, indices)
+    labels = IndexedArray(dataset.labels, indices)[:]
+    if isinstance(dataset.sensitive_attrs, np.ndarray):
+        sensitive_attrs = IndexedArray(dataset.sensitive_attrs, indices)[:]
+    else:
+        sensitive_attrs = []
+    return SupervisedDataSet(
+        features=features,
+        labels=labels,
+        sensitive_attrs=sensitive_attrs,
+        num_datapoints=len(indices),
+        meta=dataset.meta,
+    )
+
+
 def load_resampled_datasets(spec, results_dir, trial_i, data_frac, verbose=False):
     """Utility function for supervised learning to generate the
     resampled datasets to use in each trial. Resamples (with replacement)
@@ -81,14 +301,16 @@ def load_resampled_datasets(spec, results_dir, trial_i, data_frac, verbose=False
     # Check if forced candidate/safety data
 
     if spec.candidate_dataset is not None:
-        resampled_cand_filename = os.path.join(
-            resampled_base_dir, f"trial_{trial_i}_candidate_dataset.pkl"
+        resampled_cand_dataset = load_resampled_dataset(
+            spec.candidate_dataset,
+            resampled_base_dir,
+            f"trial_{trial_i}_candidate_dataset",
         )
-        resampled_cand_dataset = load_pickle(resampled_cand_filename)
-        resampled_safety_filename = os.path.join(
-            resampled_base_dir, f"trial_{trial_i}_safety_dataset.pkl"
+        resampled_safety_dataset = load_resampled_dataset(
+            spec.safety_dataset,
+            resampled_base_dir,
+            f"trial_{trial_i}_safety_dataset",
         )
-        resampled_safety_dataset = load_pickle(resampled_safety_filename)
         resampled_datasets = {
             "candidate_dataset": resampled_cand_dataset,
             "safety_dataset": resampled_safety_dataset,
@@ -105,8 +327,9 @@ def load_resampled_datasets(spec, results_dir, trial_i, data_frac, verbose=False
             "safety_dataset": num_datapoints_safety,
         }
     else:
-        resampled_filename = os.path.join(resampled_base_dir, f"trial_{trial_i}.pkl")
-        resampled_dataset = load_pickle(resampled_filename)
+        resampled_dataset = load_resampled_dataset(
+            spec.dataset, resampled_base_dir, f"trial_{trial_i}"
+        )
         resampled_datasets = {"dataset": resampled_dataset}
         num_datapoints_tot = resampled_dataset.num_datapoints
         n_points = int(round(data_frac * num_datapoints_tot))
@@ -124,13 +347,59 @@ def load_resampled_datasets(spec, results_dir, trial_i, data_frac, verbose=False
         addl_resampled_filename = os.path.join(
             results_dir, "resampled_datasets", f"trial_{trial_i}_addl_datasets.pkl"
         )
-        additional_datasets = load_pickle(addl_resampled_filename)
+        additional_datasets = load_indexed_addl_datasets(
+            spec.additional_datasets, load_pickle(addl_resampled_filename)
+        )
     else:
         additional_datasets = {}
 
     return resampled_datasets, n_points_dict, additional_datasets
 
 
+def load_indexed_addl_datasets(orig_addl_datasets, resampled_addl_datasets):
+    """Replace the index arrays saved in place of resampled
+    additional datasets (custom regime) with views of the original
+    additional datasets. Resampled datasets that were pickled
+    in full are returned as is.
+
+    :param orig_addl_datasets: The additional datasets from the spec
+    :type orig_addl_datasets: dict
+    :param resampled_addl_datasets: The loaded resampled additional datasets
+    :type resampled_addl_datasets: dict
+    """
+    for constraint_str in resampled_addl_datasets:
+        for bn, this_dict in resampled_addl_datasets[constraint_str].items():
+            for key in ["dataset", "candidate_dataset", "safety_dataset"]:
+                if isinstance(this_dict.get(key), np.ndarray):
+                    this_dict[key] = make_indexed_dataset(
+                        orig_addl_datasets[constraint_str][bn][key], this_dict[key]
+                    )
+    return resampled_addl_datasets
+
+
+def load_resampled_dataset(orig_dataset, resampled_base_dir, basename):
+    """Load a single resampled dataset. Out-of-core and custom regime
+    datasets are resampled by saving only the row indices, in
+    basename_indices.npy, in which case the resampled dataset is made
+    from orig_dataset without copying its data (see make_indexed_dataset()).
+    Otherwise the resampled dataset was pickled to basename.pkl, as were
+    all resampled datasets in older versions. If both files exist,
+    the pickle is used, since the existing results were made with it.
+
+    :param orig_dataset: The dataset that was resampled
+    :param resampled_base_dir: The directory containing the resampled datasets
+    :type resampled_base_dir: str
+    :param basename: The file name of the resampled dataset without extension
+    :type basename: str
+    """
+    pickle_filename = os.path.join(resampled_base_dir, f"{basename}.pkl")
+    if os.path.exists(pickle_filename):
+        return load_pickle(pickle_filename)
+    indices_filename = os.path.join(resampled_base_dir, f"{basename}_indices.npy")
+    indices = np.load(indices_filename)
+    return make_indexed_dataset(orig_dataset, indices)
+
+
 def load_regenerated_episodes(
     results_dir, trial_i, data_frac, orig_meta, verbose=False
 ):
@@ -206,6 +475,48 @@ def prep_feat_labels(trial_dataset, n_points, include_sensitive_attrs=False):
     return features, labels
 
 
+def prep_merged_feat_labels(
+    cand_dataset, safety_dataset, n_points, include_sensitive_attrs=False
+):
+    """Utility function for preparing the first n_points features
+    and labels of the candidate dataset followed by the safety dataset,
+    for a given trial. Only the needed prefix of each dataset is copied.
+    If all n_points come from the candidate dataset, slices of it are
+    returned and nothing is copied.
+
+    :param cand_dataset: The Seldonian dataset object containing
+        the trial candidate data
+    :param safety_dataset: The Seldonian dataset object containing
+        the trial safety data
+    :param n_points: Number of points in this trial
+    :type n_points: int
+    :param include_sensitive_attrs: Whether to prep and return sensitive attributes
+        as well.
+    :type include_sensitive_attrs: bool
+    """
+    n_points_cand = min(n_points, cand_dataset.num_datapoints)
+    n_points_safety = n_points - n_points_cand
+    cand_data = prep_feat_labels(
+        cand_dataset, n_points_cand, include_sensitive_attrs=include_sensitive_attrs
+    )
+    if n_points_safety == 0:
+        return cand_data
+
+    safety_data = prep_feat_labels(
+        safety_dataset, n_points_safety, include_sensitive_attrs=include_sensitive_attrs
+    )
+    merged_data = []
+    for cand_arr, safety_arr in zip(cand_data, safety_data):
+        # features can be list of arrays or a single array
+        if type(cand_arr) == list:
+            merged_data.append(
+                [np.concatenate([x, y]) for x, y in zip(cand_arr, safety_arr)]
+            )
+        else:
+            merged_data.append(np.concatenate([cand_arr, safety_arr]))
+    return tuple(merged_data)
+
+
 def prep_feat_labels_for_baseline(
     spec, results_dir, trial_i, data_frac, datagen_method, verbose
 ):
@@ -226,34 +537,17 @@ def prep_feat_labels_for_baseline(
             spec, results_dir, trial_i, data_frac, verbose=verbose
         )
         # If there are separate resampled candidate and safety datasets,
-        # we merge them into a single dataset and then take the first n_points points
-        # from the merged dataset
+        # we take the first n_points points of the candidate dataset
+        # followed by the safety dataset, without merging the full datasets
         if "candidate_dataset" in trial_datasets:
-            trial_cand_dataset = trial_datasets["candidate_dataset"]
-            trial_safety_dataset = trial_datasets["safety_dataset"]
-            cand_features = trial_cand_dataset.features
-            cand_labels = trial_cand_dataset.labels
-            cand_sensitive_attrs = trial_cand_dataset.sensitive_attrs
-            safety_features = trial_safety_dataset.features
-            safety_labels = trial_safety_dataset.labels
-            safety_sensitive_attrs = trial_safety_dataset.sensitive_attrs
-            merged_features = np.vstack([cand_features, safety_features])
-            merged_labels = np.hstack([cand_labels, safety_labels])
-            merged_sensitive_attrs = np.vstack(
-                [cand_sensitive_attrs, safety_sensitive_attrs]
-            )
-
-            merged_trial_dataset = SupervisedDataSet(
-                features=merged_features,
-                labels=merged_labels,
-                sensitive_attrs=merged_sensitive_attrs,
-                num_datapoints=len(merged_labels),
-                meta=trial_cand_dataset.meta,
-            )
             n_points_cand = n_points_dict["candidate_dataset"]
             n_points_safety = n_points_dict["safety_dataset"]
             n_points_merged = n_points_cand + n_points_safety
-            features, labels = prep_feat_labels(merged_trial_dataset, n_points_merged)
+            features, labels = prep_merged_feat_labels(
+                trial_datasets["candidate_dataset"],
+                trial_datasets["safety_dataset"],
+                n_points_merged,
+            )
         else:
             trial_dataset = trial_datasets["dataset"]
             n_points = n_points_dict["dataset"]
@@ -295,38 +589,21 @@ def prep_data_for_fairlearn(
             spec, results_dir, trial_i, data_frac, verbose=verbose
         )
         # If there are separate resampled candidate and safety datasets,
-        # we merge them into a single dataset and then take the first n_points points
-        # from the merged dataset
+        # we take the first n_points points of the candidate dataset
+        # followed by the safety dataset, without merging the full datasets
         if "candidate_dataset" in trial_datasets:
             trial_cand_dataset = trial_datasets["candidate_dataset"]
-            trial_safety_dataset = trial_datasets["safety_dataset"]
-            cand_features = trial_cand_dataset.features
-            cand_labels = trial_cand_dataset.labels
-            cand_sensitive_attrs = trial_cand_dataset.sensitive_attrs
-            safety_features = trial_safety_dataset.features
-            safety_labels = trial_safety_dataset.labels
-            safety_sensitive_attrs = trial_safety_dataset.sensitive_attrs
-            merged_features = np.vstack([cand_features, safety_features])
-            merged_labels = np.hstack([cand_labels, safety_labels])
-            merged_sensitive_attrs = np.vstack(
-                [cand_sensitive_attrs, safety_sensitive_attrs]
-            )
-
-            merged_trial_dataset = SupervisedDataSet(
-                features=merged_features,
-                labels=merged_labels,
-                sensitive_attrs=merged_sensitive_attrs,
-                num_datapoints=len(merged_labels),
-                meta=trial_cand_dataset.meta,
-            )
             n_points_cand = n_points_dict["candidate_dataset"]
             n_points_safety = n_points_dict["safety_dataset"]
             n_points_merged = n_points_cand + n_points_safety
-            features, labels, sensitive_attrs = prep_feat_labels(
-                merged_trial_dataset, n_points_merged, include_sensitive_attrs=True
+            features, labels, sensitive_attrs = prep_merged_feat_labels(
+                trial_cand_dataset,
+                trial_datasets["safety_dataset"],
+                n_points_merged,
+                include_sensitive_attrs=True,
             )
             sensitive_col_indices = [
-                merged_trial_dataset.sensitive_col_names.index(col)
+                trial_cand_dataset.sensitive_col_names.index(col)
                 for col in fairlearn_sensitive_feature_names
             ]
 
@@ -354,6 +631,106 @@ def prep_data_for_fairlearn(
     return features, labels, fairlearn_sensitive_features
 
 
+def grouped_confusion_counts(y_true, y_pred, sensitive_features):
+    """Count true negatives, false positives, false negatives
+    and true positives for each group of the sensitive features
+    in a single np.bincount pass. Groups are the unique rows of
+    sensitive_features in sorted order, matching the group
+    order of Fairlearn's MetricFrame.by_group.
+
+    :param y_true: True binary class labels (0 or 1)
+    :type y_true: 1D array
+    :param y_pred: Predicted binary class labels (0 or 1 or bool)
+    :type y_pred: 1D array
+    :param sensitive_features: The sensitive feature values,
+        one row per data point
+    :type sensitive_features: 1D or 2D array
+
+    :return: Array of shape (n_groups,4) whose columns are
+        TN, FP, FN, TP
+    :rtype: numpy.ndarray
+    """
+    sensitive_features = np.asarray(sensitive_features)
+    if sensitive_features.ndim == 1:
+        sensitive_features = sensitive_features.reshape(-1, 1)
+    _, group_ids = np.unique(sensitive_features, axis=0, return_inverse=True)
+    group_ids = group_ids.ravel()
+    n_groups = group_ids.max() + 1
+    cell = 2 * np.asarray(y_true, dtype=int) + np.asarray(y_pred, dtype=int)
+    counts = np.bincount(4 * group_ids + cell, minlength=4 * n_groups)
+    return counts.reshape(n_groups, 4)
+
+
+def confusion_rates(counts):
+    """Positive rate, false positive rate and false negative rate
+    from confusion counts. Rates with a zero denominator are 0,
+    as in Fairlearn's metric functions.
+
+    :param counts: Array whose last axis holds TN, FP, FN, TP,
+        e.g. the output of grouped_confusion_counts()
+    :type counts: numpy.ndarray
+
+    :return: (PR, FPR, FNR), each with the shape of counts
+        without the last axis
+    """
+    counts = np.asarray(counts, dtype=float)
+    TN, FP, FN, TP = np.moveaxis(counts, -1, 0)
+
+    def safe_divide(num, denom):
+        return np.divide(num, denom, out=np.zeros_like(num), where=denom != 0)
+
+    PR = safe_divide(FP + TP, TN + FP + FN + TP)
+    FPR = safe_divide(FP, FP + TN)
+    FNR = safe_divide(FN, FN + TP)
+    return PR, FPR, FNR
+
+
+def combine_held_out_addl_datasets(held_out_addl_datasets):
+    """For each held out additional dataset that is split into
+    candidate and safety datasets, build the combined dataset
+    used for ground truth evaluation once, and store it under the
+    "combined_dataset" key so that trials only need to reference it.
+
+    :param held_out_addl_datasets: The held out additional datasets,
+        a nested dict: constraint string -> base node -> dict of datasets
+    :type held_out_addl_datasets: dict
+
+    :return: A copy of held_out_addl_datasets including the combined datasets
+    :rtype: dict
+    """
+    combined_addl_datasets = {}
+    for cstr in held_out_addl_datasets:
+        combined_addl_datasets[cstr] = {}
+        for bn in held_out_addl_datasets[cstr]:
+            this_dict = dict(held_out_addl_datasets[cstr][bn])
+            if (
+                "candidate_dataset" in this_dict
+                and "combined_dataset" not in this_dict
+            ):
+                this_dict["combined_dataset"] = (
+                    this_dict["candidate_dataset"] + this_dict["safety_dataset"]
+                )
+            combined_addl_datasets[cstr][bn] = this_dict
+    return combined_addl_datasets
+
+
+def get_held_out_addl_dataset(held_out_dict):
+    """Get the dataset to use for ground truth evaluation
+    from one entry of the held out additional datasets.
+
+    :param held_out_dict: The held out datasets for a single base node
+    :type held_out_dict: dict
+
+    :return: The dataset for evaluating the base node
+    """
+    if "combined_dataset" in held_out_dict:
+        return held_out_dict["combined_dataset"]
+    if "candidate_dataset" in held_out_dict:
+        # Combine the candidate and safety datasets into a single dataset for evaluation
+        return held_out_dict["candidate_dataset"] + held_out_dict["safety_dataset"]
+    return held_out_dict["dataset"]
+
+
 def prep_custom_data(trial_dataset, n_points, include_sensitive_attrs=False):
     """Utility function for preparing data and sensitive attributes
     for the custom regime for a given trial with n_points (given data frac)
@@ -365,7 +742,8 @@ def prep_custom_data(trial_dataset, n_points, include_sensitive_attrs=False):
         as well.
     :type include_sensitive_attrs: bool
     """
-    # Only use first n_points for this trial
+    # Only use first n_points for this trial. If the trial data
+    # are an IndexedData view this gathers references to just these samples
     data = trial_dataset.data[:n_points]
 
     if include_sensitive_attrs:
@@ -375,6 +753,21 @@ def prep_custom_data(trial_dataset, n_points, include_sensitive_attrs=False):
     return data
 
 
+def copy_spec_without_data(spec):
+    """Deep copy a spec object, except for its datasets, which
+    the copy shares with spec. Used when the datasets of the copy
+    are about to be replaced by the trial datasets anyway.
+
+    :param spec: A seldonian.spec.Spec object.
+    """
+    memo = {}
+    for attr in ["dataset", "candidate_dataset", "safety_dataset", "additional_datasets"]:
+        obj = getattr(spec, attr, None)
+        if obj is not None:
+            memo[id(obj)] = obj
+    return copy.deepcopy(spec, memo)
+
+
 def setup_SA_spec_for_exp(
     spec,
     regime,
@@ -416,8 +809,9 @@ def setup_SA_spec_for_exp(
                 f"Eval method {datagen_method} " f"not supported for regime={regime}"
             )
 
-        # Make a new spec object which we will modify
-        spec_for_exp = copy.deepcopy(spec)
+        # Make a new spec object which we will modify. The datasets are
+        # replaced below, so they are shared with spec rather than copied
+        spec_for_exp = copy_spec_without_data(spec)
 
         # Check if we have forced candidate/safety datasets
         if "candidate_dataset" in trial_datasets:
@@ -530,7 +924,7 @@ def setup_SA_spec_for_exp(
             # Make a new spec object from a copy of spec, where the
             # only thing that is different is the dataset
 
-            spec_for_exp = copy.deepcopy(spec)
+            spec_for_exp = copy_spec_without_data(spec)
             spec_for_exp.dataset = dataset_for_exp
         else:
             raise NotImplementedError(
@@ -550,8 +944,9 @@ def setup_SA_spec_for_exp(
                 f"Eval method {datagen_method} " f"not supported for regime={regime}"
             )
 
-        # Make a new spec object which we will modify
-        spec_for_exp = copy.deepcopy(spec)
+        # Make a new spec object which we will modify. The datasets are
+        # replaced below, so they are shared with spec rather than copied
+        spec_for_exp = copy_spec_without_data(spec)
 
         # Check if we have forced candidate/safety datasets
         if "candidate_dataset" in trial_datasets:
@@ -660,9 +1055,257 @@ def setup_SA_spec_for_exp(
     return spec_for_exp
 
 
-def generate_episodes_and_calc_J(**kwargs):
+class GroundTruthConstraintContext:
+    def __init__(self):
+        """Cache of the parts of ground truth constraint evaluation
+        that do not depend on the model weights. These are the
+        data dicts of the base nodes (e.g., the features and labels
+        masked to a sensitive group), keyed by (constraint string, base
+        node name). They are restored into each trial's parse trees
+        so that the masks are only applied once per process.
+
+        Only base nodes that use the default
+        BaseNode.calculate_data_forbound() are cached, because some custom
+        base nodes resample their data every time it is prepared.
+        """
+        self.data_dicts = {}
+
+    def restore(self, parse_tree):
+        """Put the cached data dicts into a parse tree
+        whose data was reset
+
+        :param parse_tree: The parse tree to evaluate
+        :type parse_tree: :py:class:`.ParseTree` object
+        """
+        for node_name in parse_tree.base_node_dict:
+            key = (parse_tree.constraint_str, node_name)
+            if key in self.data_dicts:
+                parse_tree.base_node_dict[node_name]["data_dict"] = self.data_dicts[
+                    key
+                ]
+
+    def save(self, parse_tree):
+        """Cache the data dicts of a parse tree that was just evaluated
+
+        :param parse_tree: The evaluated parse tree
+        :type parse_tree: :py:class:`.ParseTree` object
+        """
+        nodes = [parse_tree.root]
+        while nodes:
+            node = nodes.pop()
+            if node is None:
+                continue
+            if isinstance(node, BaseNode):
+                if (
+                    type(node).calculate_data_forbound
+                    is not BaseNode.calculate_data_forbound
+                ):
+                    continue
+                data_dict = parse_tree.base_node_dict[node.name]["data_dict"]
+                if data_dict is not None:
+                    self.data_dicts[(parse_tree.constraint_str, node.name)] = data_dict
+            else:
+                nodes.extend([node.left, node.right])
+
+
+_ground_truth_contexts = {}
+
+
+def register_ground_truth_context():
+    """Create a new, empty ground truth constraint context.
+    Call this in the parent process before starting any
+    worker processes so that forked workers share the same key.
+
+    :return: The key to pass to get_ground_truth_context()
+    :rtype: str
+    """
+    key = uuid.uuid4().hex
+    _ground_truth_contexts[key] = GroundTruthConstraintContext()
+    return key
+
+
+def get_ground_truth_context(key):
+    """Get the ground truth constraint context of this process
+    for a key from register_ground_truth_context(). A worker
+    process that does not have it yet (e.g., with the spawn start method)
+    gets a new, empty context that fills up as its trials run.
+
+    :param key: The key of the context, or None
+    :type key: str
+
+    :return: The context, or None if key is None
+    :rtype: GroundTruthConstraintContext
+    """
+    if key is None:
+        return None
+    if key not in _ground_truth_contexts:
+        _ground_truth_contexts[key] = GroundTruthConstraintContext()
+    return _ground_truth_contexts[key]
+
+
+def release_ground_truth_context(key):
+    """Drop the ground truth constraint context of a key from
+    register_ground_truth_context() once the experiment that
+    registered it has finished, freeing its cached data dicts
+
+    :param key: The key of the context
+    :type key: str
+    """
+    _ground_truth_contexts.pop(key, None)
+
+
+default_start_method = "spawn" if os.name == "nt" else "fork"
+
+# Imported once by the forkserver process, so that the
+# workers forked from it start with them already imported
+default_preload_modules = [
+    "numpy",
+    "sklearn",
+    "seldonian.seldonian_algorithm",
+    "experiments.experiments",
+]
+
+_start_method_config = {"start_method": None, "preload_modules": None}
+
+
+def set_start_method(start_method=None, preload_modules=None):
+    """Set how worker processes are started for the rest of this
+    process, e.g. set_start_method("forkserver") before running
+    experiments. See get_mp_context().
+
+    :param start_method: "fork", "spawn", "forkserver"
+        or None to restore the default
+    :type start_method: str
+    :param preload_modules: Modules for the forkserver to import
+    :type preload_modules: List(str)
+    """
+    if start_method is not None and start_method not in mp.get_all_start_methods():
+        raise ValueError(
+            f"start_method: {start_method} is not supported on this platform. "
+            f"Supported start methods are: {mp.get_all_start_methods()}"
+        )
+    _start_method_config["start_method"] = start_method
+    _start_method_config["preload_modules"] = preload_modules
+
+
+def get_mp_context(start_method=None, preload_modules=None):
+    """Get the multiprocessing context in which to start worker processes.
+
+    "fork" copies the parent process, which is fast but copies its whole
+    memory and is not safe if the parent runs threads, e.g. of torch or
+    OpenMP. "spawn" starts every worker from scratch, importing all modules
+    again. "forkserver" forks every worker from a single server process
+    that only imported preload_modules, which is both cheap and safe.
+
+    :param start_method: "fork", "spawn" or "forkserver". Defaults to the
+        method from set_start_method(), then to the
+        SELDONIAN_EXPERIMENTS_START_METHOD environment variable, then
+        to default_start_method ("fork", or "spawn" on Windows).
+    :type start_method: str
+    :param preload_modules: Modules for the forkserver to import.
+        Defaults to the modules from set_start_method(), then to
+        default_preload_modules.
+    :type preload_modules: List(str)
+    """
+    if start_method is None:
+        start_method = _start_method_config["start_method"]
+    if start_method is None:
+        start_method = os.environ.get(
+            "SELDONIAN_EXPERIMENTS_START_METHOD", default_start_method
+        )
+    if start_method not in mp.get_all_start_methods():
+        raise ValueError(
+            f"start_method: {start_method} is not supported on this platform. "
+            f"Supported start methods are: {mp.get_all_start_methods()}"
+        )
+    context = mp.get_context(start_method)
+    if start_method == "forkserver":
+        if preload_modules is None:
+            preload_modules = _start_method_config["preload_modules"]
+        if preload_modules is None:
+            preload_modules = default_preload_modules
+        # Only has an effect before the server has started.
+        # Modules that cannot be imported are skipped.
+        context.set_forkserver_preload(list(preload_modules))
+    return context
+
+
+_worker_shared_data = {}
+
+
+def attach_shared_data(key, shared_data):
+    """Initializer of worker processes: keep the data that all tasks
+    of a pool share, so that it is sent to each worker once
+    rather than with every task. See make_worker_pool().
+
+    :param key: The key of the pool
+    :type key: str
+    :param shared_data: (function, keyword arguments),
+        see run_with_shared_data()
+    """
+    _worker_shared_data[key] = shared_data
+
+
+def run_with_shared_data(key, *args):
+    """Run a task in a worker process of a pool from make_worker_pool():
+    call the function that was attached to the worker with args and
+    the keyword arguments that were attached with it
+
+    :param key: The key of the pool
+    :type key: str
+
+    :return: The return value of the function
+    """
+    function, shared_kwargs = _worker_shared_data[key]
+    return function(*args, **shared_kwargs)
+
+
+def make_worker_pool(
+    n_workers, function, shared_kwargs, start_method=None, preload_modules=None
+):
+    """Make a pool of worker processes that run function with
+    the same keyword arguments, e.g. the trials of an experiment.
+    The function and keyword arguments (which hold the spec and the
+    datasets) are attached to each worker once, when it starts,
+    and each task only sends its own arguments::
+
+        ex, key = make_worker_pool(n_workers, self.run_trial, trial_kwargs)
+        with ex:
+            future = ex.submit(run_with_shared_data, key, data_frac, trial_i)
+
+    :param n_workers: The number of worker processes
+    :type n_workers: int
+    :param function: The function the tasks run. Must be picklable,
+        e.g. a module-level function or a method of a picklable object
+    :param shared_kwargs: The keyword arguments of every task
+    :type shared_kwargs: dict
+    :param start_method: See get_mp_context()
+    :param preload_modules: See get_mp_context()
+
+    :return: (executor, key), where executor is a ProcessPoolExecutor
+        and key identifies the pool in run_with_shared_data()
+    """
+    key = uuid.uuid4().hex
+    executor = ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=get_mp_context(start_method, preload_modules),
+        initializer=attach_shared_data,
+        initargs=(key, (function, shared_kwargs)),
+    )
+    return executor, key
+
+
+def generate_episodes_and_calc_J(n_trial_workers=1, **kwargs):
     """Calculate the expected discounted return
-    by generating episodes
+    by generating episodes. Episodes are generated in parallel
+    if kwargs contains "n_workers_for_eval" > 1 (see run_eval_rollouts()).
+    If kwargs contains "eval_seed", each episode is generated with its own
+    seed derived from it, so the episodes do not depend on the number of workers.
+
+    :param n_trial_workers: The number of trials running in parallel,
+        which limits the number of rollout workers
+        (see eval_rollout_worker_budget())
+    :type n_trial_workers: int
 
     :return: (episodes, J), where episodes is the list
             of generated ground truth episodes and J is
@@ -673,19 +1316,29 @@ def generate_episodes_and_calc_J(**kwargs):
     model = kwargs["model"]
     new_params = model.policy.get_params()
 
-    # create env and agent
     hyperparameter_and_setting_dict = kwargs["hyperparameter_and_setting_dict"]
-    agent = create_agent_fromdict(hyperparameter_and_setting_dict)
     env = hyperparameter_and_setting_dict["env"]
 
-    # set agent's weights to the trained model weights
-    agent.set_new_params(new_params)
-
     # generate episodes
     num_episodes = kwargs["n_episodes_for_eval"]
-    episodes = run_trial_given_agent_and_env(
-        agent=agent, env=env, num_episodes=num_episodes
-    )
+    n_workers_for_eval = kwargs.get("n_workers_for_eval", 1)
+    eval_seed = kwargs.get("eval_seed")
+    if n_workers_for_eval > 1 or eval_seed is not None:
+        n_workers = eval_rollout_worker_budget(n_workers_for_eval, n_trial_workers)
+        episodes = run_eval_rollouts(
+            hyperparameter_and_setting_dict,
+            new_params,
+            num_episodes,
+            n_workers=n_workers,
+            seed=eval_seed,
+        )
+    else:
+        # create agent and set its weights to the trained model weights
+        agent = create_agent_fromdict(hyperparameter_and_setting_dict)
+        agent.set_new_params(new_params)
+        episodes = run_trial_given_agent_and_env(
+            agent=agent, env=env, num_episodes=num_episodes
+        )
 
     # Calculate J, the discounted sum of rewards
     returns = np.array([weighted_sum_gamma(ep.rewards, env.gamma) for ep in episodes])
@@ -693,16 +1346,204 @@ def generate_episodes_and_calc_J(**kwargs):
     return episodes, J
 
 
+def eval_rollout_worker_budget(n_workers_requested, n_trial_workers=1):
+    """Determine how many processes to use for generating evaluation
+    episodes within a single trial without oversubscribing the machine
+    when trials themselves already run in parallel.
+
+    :param n_workers_requested: The number of rollout workers asked for
+    :type n_workers_requested: int
+    :param n_trial_workers: The number of trials running in parallel
+    :type n_trial_workers: int
+
+    :return: The number of rollout workers to use, at least 1
+    :rtype: int
+    """
+    n_cpus = os.cpu_count() or 1
+    n_spare_cpus = n_cpus // max(1, n_trial_workers)
+    return max(1, min(n_workers_requested, n_spare_cpus))
+
+
+def run_episodes_with_seeds(hyperparameter_and_setting_dict, new_params, seeds):
+    """Generate one episode per seed using the agent specified in
+    hyperparameter_and_setting_dict with its weights set to new_params.
+    The global numpy random state, which the environments and agents
+    draw from, is seeded before each episode and restored afterwards,
+    so the random stream of the caller is not changed.
+    This is the function run by each worker in run_eval_rollouts().
+
+    :param hyperparameter_and_setting_dict: Contains the environment
+        and the agent
+    :type hyperparameter_and_setting_dict: dict
+    :param new_params: The policy weights
+    :param seeds: One integer seed per episode
+
+    :return: List of episodes
+    """
+    agent = create_agent_fromdict(hyperparameter_and_setting_dict)
+    agent.set_new_params(new_params)
+    env = hyperparameter_and_setting_dict["env"]
+    episodes = []
+    random_state = np.random.get_state()
+    try:
+        for seed in seeds:
+            np.random.seed(seed)
+            episodes.extend(
+                run_trial_given_agent_and_env(agent=agent, env=env, num_episodes=1)
+            )
+    finally:
+        np.random.set_state(random_state)
+    return episodes
+
+
+def run_eval_rollouts(
+    hyperparameter_and_setting_dict, new_params, num_episodes, n_workers=1, seed=None
+):
+    """Generate episodes with a new policy for ground truth evaluation,
+    fanning the episodes out over n_workers processes. Every episode
+    gets its own seed, so the result is the same for any n_workers.
+    The environment and agent in hyperparameter_and_setting_dict
+    must be pickleable when n_workers > 1.
+
+    :param hyperparameter_and_setting_dict: Contains the environment
+        and the agent
+    :type hyperparameter_and_setting_dict: dict
+    :param new_params: The policy weights
+    :param num_episodes: The number of episodes to generate
+    :type num_episodes: int
+    :param n_workers: The number of processes to use
+    :type n_workers: int
+    :param seed: Seed from which the per-episode seeds are derived.
+        If None, they are drawn from the global numpy random state.
+    :type seed: int
+
+    :return: List of episodes, in the order of the per-episode seeds
+    """
+    if seed is None:
+        episode_seeds = np.random.randint(0, 2**31 - 1, size=num_episodes)
+    else:
+        episode_seeds = np.random.SeedSequence(seed).generate_state(num_episodes)
+
+    if n_workers == 1:
+        return run_episodes_with_seeds(
+            hyperparameter_and_setting_dict, new_params, episode_seeds
+        )
+
+    seed_chunks = [
+        chunk for chunk in np.array_split(episode_seeds, n_workers) if len(chunk) > 0
+    ]
+    helper = partial(
+        run_episodes_with_seeds, hyperparameter_and_setting_dict, new_params
+    )
+    episodes = []
+    with ProcessPoolExecutor(
+        max_workers=len(seed_chunks), mp_context=get_mp_context()
+    ) as ex:
+        for episodes_this_chunk in ex.map(helper, seed_chunks):
+            episodes.extend(episodes_this_chunk)
+    return episodes
+
+
+def stack_episodes(episodes):
+    """Concatenate the per-timestep arrays of a list of episodes
+    into flat arrays, similar to the CSR sparse matrix format.
+    Useful for evaluating many episodes in a single vectorized call,
+    e.g., with an RL baseline's get_probs_from_episode_arrays() method.
+
+    :param episodes: List of seldonian.dataset.Episode objects
+
+    :return: A dictionary with keys "observations", "actions", "rewards"
+        and "action_probs" containing the concatenated arrays and
+        "episode_offsets", an array of length len(episodes)+1 such that the
+        timesteps of episode i are [episode_offsets[i],episode_offsets[i+1])
+    :rtype: dict
+    """
+    episode_lengths = [len(ep.actions) for ep in episodes]
+    episode_offsets = np.concatenate([[0], np.cumsum(episode_lengths)]).astype(int)
+    return {
+        "observations": np.concatenate([ep.observations for ep in episodes]),
+        "actions": np.concatenate([ep.actions for ep in episodes]),
+        "rewards": np.concatenate([ep.rewards for ep in episodes]),
+        "action_probs": np.concatenate([ep.action_probs for ep in episodes]),
+        "episode_offsets": episode_offsets,
+    }
+
+
+def precompute_IS_base_node_values(
+    parse_tree, model, theta, tree_dataset_dict, regime, branch="safety_test"
+):
+    """Compute the value of each J_pi_new_IS base node of a parse tree
+    from the importance weights of all of its episodes at once, using
+    the model's get_importance_weights_from_episode_arrays() method
+    (see experiments.baselines.baselines.RLExperimentBaseline).
+    The parse tree then uses these values instead of evaluating
+    the episodes one at a time. Call it after the parse tree's
+    base node dict was reset and before evaluate_constraint().
+
+    :param parse_tree: The parse tree to evaluate
+    :type parse_tree: :py:class:`.ParseTree` object
+    :param model: An RL baseline model with the batched API
+    :param theta: The model weights
+    :param tree_dataset_dict: The datasets of the base nodes, as passed
+        to parse_tree.evaluate_constraint()
+    :type tree_dataset_dict: dict
+    :param regime: The category of ML problem
+    :param branch: The branch to prepare the base node data for
+    """
+    nodes = [parse_tree.root]
+    while nodes:
+        node = nodes.pop()
+        if node is None:
+            continue
+        if not isinstance(node, BaseNode):
+            nodes.extend([node.left, node.right])
+            continue
+        node_dict = parse_tree.base_node_dict[node.name]
+        if node.measure_function_name != "J_pi_new_IS" or node_dict["value_computed"]:
+            continue
+        if node_dict["data_dict"] is None:
+            data_kwargs = {}
+            if isinstance(node, RLAltRewardBaseNode):
+                data_kwargs["alt_reward_number"] = node.alt_reward_number
+            node_dict["data_dict"] = node.calculate_data_forbound(
+                theta=theta,
+                dataset=tree_dataset_dict.get(node.name, tree_dataset_dict.get("all")),
+                model=model,
+                regime=regime,
+                branch=branch,
+                **data_kwargs,
+            )
+        episodes = node_dict["data_dict"]["episodes"]
+        if len(episodes) == 0:
+            # Leave it to the parse tree
+            continue
+        stacked = stack_episodes(episodes)
+        weights = model.get_importance_weights_from_episode_arrays(
+            [theta],
+            stacked["observations"],
+            stacked["actions"],
+            stacked["action_probs"],
+            stacked["episode_offsets"],
+        )[0]
+        node_dict["value"] = np.mean(
+            weights * np.asarray(node_dict["data_dict"]["weighted_returns"])
+        )
+        node_dict["value_computed"] = True
+
+
 def batch_predictions(model, solution, X_test, **kwargs):
     """Run model forward pass in batches.
 
     :param model: A model object with a .predict(theta,X) method
     :param solution: Model weights to set before making the forward pass
-    :param X_test: The features to batch up
+    :param X_test: The features to batch up. Can be the path
+        to a .npy file, in which case it is memory-mapped and
+        read from disk one batch at a time.
 
     :return: y_pred, the combined predictions in a flattened array
     """
     batch_size = kwargs["eval_batch_size"]
+    X_test = load_test_array(X_test)
     
     if type(X_test) == list:
         N_eval = len(X_test[0])
@@ -735,7 +1576,9 @@ def batch_predictions_custom_regime(model, solution, test_data, **kwargs):
 
     :param model: A model object with a .predict(theta,data) method
     :param solution: Model weights to set before making the forward pass
-    :param test_data: The input data to the model to batch up
+    :param test_data: The input data to the model to batch up.
+        Can be an IndexedData view, in which case only one batch
+        of samples is gathered at a time.
 
     :return: y_pred, the combined predictions in a flattened array
     """
@@ -756,6 +1599,77 @@ def batch_predictions_custom_regime(model, solution, test_data, **kwargs):
     return y_pred
 
 
+def load_test_array(arr):
+    """Open an array of test features or labels. A string is
+    treated as the path to a .npy file, which is memory-mapped
+    rather than read into memory.
+
+    :param arr: An array or the path to a .npy file
+
+    :return: The array, or a read-only MemmapArray
+    """
+    if isinstance(arr, str):
+        return open_memmap_array(arr)
+    return arr
+
+
+def streaming_perf_eval(model, solution, perf_eval_fn, X, y, **kwargs):
+    """Evaluate the performance of a model on the ground truth
+    test set one batch at a time. Each batch of features is read,
+    predicted and added to the accumulator for perf_eval_fn
+    (see perf_eval_funcs.get_streaming_metric()), then discarded,
+    so memory use scales with the batch size rather than the size
+    of the test set.
+
+    :param model: A model object with a .predict(theta,X) method
+    :param solution: Model weights to use for the predictions
+    :param perf_eval_fn: One of the functions in perf_eval_funcs
+    :param X: The test features, either an array or the path
+        to a .npy file which will be memory-mapped
+    :param y: The test labels, either an array or the path
+        to a .npy file which will be memory-mapped
+
+    :return: The value of perf_eval_fn over the whole test set
+    """
+    batch_size = kwargs["eval_batch_size"]
+    metric = get_streaming_metric(perf_eval_fn)
+    X = load_test_array(X)
+    y = load_test_array(y)
+
+    if type(X) == list:
+        N_eval = len(X[0])
+    else:
+        N_eval = len(X)
+
+    for batch_start in range(0, N_eval, batch_size):
+        batch_end = batch_start + batch_size
+        if type(X) == list:
+            X_batch = [np.asarray(x[batch_start:batch_end]) for x in X]
+        else:
+            X_batch = np.asarray(X[batch_start:batch_end])
+        y_pred_batch = model.predict(solution, X_batch)
+        metric.update(y_pred_batch, np.asarray(y[batch_start:batch_end]))
+    return metric.result()
+
+
+def batch_trial_performance(model, solutions, perf_eval_fn, X, y):
+    """Score the solutions of many trials on the same
+    test set with a single call to the batched version
+    of perf_eval_fn (see perf_eval_funcs.get_batched_metric()).
+
+    :param model: A model object with a .predict(theta,X) method
+    :param solutions: List of model weights, one per trial
+    :param perf_eval_fn: One of the functions in perf_eval_funcs
+    :param X: The test features
+    :param y: The test labels
+
+    :return: Array of the performance of each solution
+    """
+    batched_fn = get_batched_metric(perf_eval_fn)
+    y_preds = np.stack([model.predict(solution, X) for solution in solutions])
+    return batched_fn(y_preds, y)
+
+
 def make_batch_epoch_dict_fixedniter(niter, data_fracs, N_max, batch_size):
     """
     Convenience function for figuring out the number of epochs necessary
@@ -1,18 +1,16 @@
 """ Module for running Seldonian Experiments """
 
 import os
+import time
 from operator import itemgetter
 import autograd.numpy as np  # Thinly-wrapped version of Numpy
-from concurrent.futures import ProcessPoolExecutor
-import multiprocessing as mp
+from concurrent.futures import as_completed
 from tqdm import tqdm
-from functools import partial
 import copy
 
 import pandas as pd
-from sklearn.preprocessing import StandardScaler
-from sklearn.pipeline import make_pipeline
 from sklearn.linear_model import LogisticRegression
+from scipy.special import expit
 
 from seldonian.utils.io_utils import load_pickle
 from seldonian.dataset import SupervisedDataSet, RLDataSet
@@ -27,42 +25,48 @@ from seldonian.models.models import (
 
 from .experiment_utils import (
     batch_predictions,
+    copy_spec_without_data,
+    generate_episodes_and_calc_J,
     load_resampled_datasets,
     load_regenerated_episodes,
     prep_feat_labels,
     prep_feat_labels_for_baseline,
     prep_data_for_fairlearn,
+    grouped_confusion_counts,
+    confusion_rates,
+    register_ground_truth_context,
+    get_ground_truth_context,
+    release_ground_truth_context,
+    get_held_out_addl_dataset,
+    precompute_IS_base_node_values,
     setup_SA_spec_for_exp,
-    trial_arg_chunker,
+    streaming_perf_eval,
+    make_worker_pool,
+    run_with_shared_data,
 )
-
-try:
-    from fairlearn.reductions import ExponentiatedGradient
-    from fairlearn.metrics import (
-        MetricFrame,
-        selection_rate,
-        false_positive_rate,
-        true_positive_rate,
-        false_negative_rate,
-    )
-    from fairlearn.reductions import (
-        DemographicParity,
-        FalsePositiveRateParity,
-        EqualizedOdds,
-    )
-except ImportError:
-    print(
-        "\nWARNING: The module 'fairlearn' was not imported. "
-        "If you want to use the fairlearn baselines, then do:\n"
-        "pip install fairlearn==0.7.0\n"
-    )
+from .results import StreamingResultsStore, ImportanceWeightStore, save_run_info
 
 import warnings
 from seldonian.warnings.custom_warnings import *
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 
-context = mp.get_context("spawn" if os.name == "nt" else "fork")
+
+def import_fairlearn_reductions():
+    """Import fairlearn.reductions. fairlearn is only imported by the
+    fairlearn experiments, so that it is not needed (or loaded) otherwise.
+
+    :return: The fairlearn.reductions module
+    """
+    try:
+        from fairlearn import reductions
+    except ImportError as e:
+        raise ImportError(
+            "The module 'fairlearn' could not be imported. "
+            "If you want to use the fairlearn baselines, then do:\n"
+            "pip install fairlearn==0.7.0"
+        ) from e
+    return reductions
 
 
 class Experiment:
@@ -80,32 +84,140 @@ class Experiment:
         self.model_name = model_name
         self.results_dir = results_dir
 
+    def __getstate__(self):
+        # The results stores stay in the parent process
+        state = self.__dict__.copy()
+        state.pop("results_store", None)
+        state.pop("importance_weight_store", None)
+        return state
+
+    def open_results_store(self, **kwargs):
+        """Open the consolidated results file,
+        to which trial results are appended as they complete.
+        If given the keyword arguments of run_experiment(), rows of
+        trials outside of this run are dropped from it and the
+        description of this run is saved (see save_run_info()).
+        """
+        self.results_store = StreamingResultsStore(
+            self.results_dir,
+            self.model_name,
+            data_fracs=kwargs.get("data_fracs"),
+            n_trials=kwargs.get("n_trials"),
+        )
+        if kwargs:
+            save_run_info(self.results_dir, self.model_name, self.run_info(**kwargs))
+        return self.results_store
+
+    def run_info(self, **kwargs):
+        """Describe a run of this experiment given
+        the keyword arguments of run_experiment()
+
+        :rtype: dict
+        """
+        spec = kwargs["spec"]
+        parse_trees = spec.parse_trees
+        if kwargs["regime"] == "reinforcement_learning":
+            tot_data_size = kwargs["hyperparameter_and_setting_dict"]["num_episodes"]
+        else:
+            tot_data_size = spec.dataset.num_datapoints
+        return {
+            "data_fracs": [float(x) for x in kwargs["data_fracs"]],
+            "n_trials": int(kwargs["n_trials"]),
+            "n_workers": int(kwargs["n_workers"]),
+            "started": time.time(),
+            "constraint_strs": [pt.constraint_str for pt in parse_trees],
+            "deltas": [float(pt.delta) for pt in parse_trees],
+            "tot_data_size": int(tot_data_size),
+        }
+
+    def record_trial_result(self, result):
+        """Append the result returned by a trial to the
+        consolidated results file. Trials that were skipped
+        because they were already run return None.
+
+        :param result: The result row, see write_trial_result()
+        :type result: dict
+        """
+        if result:
+            self.results_store.add(result)
+
+    def run_trials(self, trial_method, trial_kwargs, **kwargs):
+        """Run trial_method(data_frac, trial_i, **trial_kwargs) for every
+        data fraction and trial, in a pool of worker processes if
+        n_workers > 1, and record each result as soon as its trial
+        completes (see record_trial_result()).
+
+        :param trial_method: The method that runs a single trial
+        :param trial_kwargs: The keyword arguments of each trial,
+            sent to each worker process once
+        :type trial_kwargs: dict
+        :param kwargs: The keyword arguments of run_experiment()
+        """
+        data_fracs = kwargs["data_fracs"]
+        n_trials = kwargs["n_trials"]
+        n_workers = kwargs["n_workers"]
+        data_fracs_vector = np.array([x for x in data_fracs for y in range(n_trials)])
+        trials_vector = np.array(
+            [x for y in range(len(data_fracs)) for x in range(n_trials)]
+        )
+
+        if n_workers == 1:
+            # run all trials synchronously
+            for data_frac, trial_i in zip(data_fracs_vector, trials_vector):
+                self.record_trial_result(
+                    trial_method(data_frac, trial_i, **trial_kwargs)
+                )
+        elif n_workers > 1:
+            # run trials asynchronously
+            ex, key = make_worker_pool(
+                n_workers,
+                trial_method,
+                trial_kwargs,
+                start_method=kwargs.get("start_method"),
+                preload_modules=kwargs.get("preload_modules"),
+            )
+            with ex:
+                futures = [
+                    ex.submit(run_with_shared_data, key, data_frac, trial_i)
+                    for data_frac, trial_i in zip(data_fracs_vector, trials_vector)
+                ]
+                # Record each result as soon as its trial completes
+                for future in tqdm(as_completed(futures), total=len(futures)):
+                    self.record_trial_result(future.result())
+        else:
+            raise ValueError(f"n_workers value of {n_workers} must be >=1 ")
+
     def aggregate_results(self, **kwargs):
-        """Group together the data in each
-        trial file into a single CSV file.
+        """Make sure the consolidated results file contains
+        every trial. Trial results are normally appended to it
+        as they complete (see record_trial_result()), so
+        only trial files that were written but never recorded,
+        e.g. by an interrupted run, are read here.
         """
-        d = os.path.join(self.results_dir, f"{self.model_name}_results")
-        os.makedirs(d, exist_ok=True)
-        res_fname = os.path.join(d, f"{self.model_name}_results.csv")
+        results_store = getattr(self, "results_store", None)
+        if results_store is None:
+            results_store = StreamingResultsStore(
+                self.results_dir,
+                self.model_name,
+                data_fracs=kwargs["data_fracs"],
+                n_trials=kwargs["n_trials"],
+            )
+            self.results_store = results_store
 
         d_trial = os.path.join(
             self.results_dir, f"{self.model_name}_results", "trial_data"
         )
-        df_list = []
-       
         for data_frac in kwargs["data_fracs"]:
             for trial_i in range(kwargs["n_trials"]):
+                if results_store.has_trial(data_frac, trial_i):
+                    continue
                 filename = os.path.join(
                     d_trial, f"data_frac_{data_frac:.4f}_trial_{trial_i}.csv"
                 )
-                df = pd.read_csv(filename)
-                df_list.append(df)
+                results_store.add_rows(pd.read_csv(filename))
 
-        res_df = pd.concat(df_list)
-        res_df.to_csv(res_fname, index=False)
-        
         if kwargs["verbose"]:
-            print(f"Saved {res_fname}")
+            print(f"Saved {results_store.filename}")
         return
 
     def write_trial_result(self, data, colnames, trial_dir, verbose=False):
@@ -124,6 +236,9 @@ class Experiment:
 
         :param verbose: if True, prints out saved filename
         :type verbose: bool
+
+        :return: The result row, with colnames as keys
+        :rtype: dict
         """
         res_df = pd.DataFrame([data])
         res_df.columns = colnames
@@ -136,7 +251,7 @@ class Experiment:
         res_df.to_csv(fname, index=False)
         if verbose:
             print(f"Saved {fname}")
-        return
+        return dict(zip(colnames, data))
 
 
 class BaselineExperiment(Experiment):
@@ -161,37 +276,13 @@ class BaselineExperiment(Experiment):
         partial_kwargs = {
             key: kwargs[key] for key in kwargs if key not in ["data_fracs", "n_trials"]
         }
+        partial_kwargs["ground_truth_context_key"] = register_ground_truth_context()
 
-        helper = partial(self.run_baseline_trial, **partial_kwargs)
-
-        data_fracs = kwargs["data_fracs"]
-        n_trials = kwargs["n_trials"]
-        n_workers = kwargs["n_workers"]
-
-        data_fracs_vec = np.array([x for x in data_fracs for y in range(n_trials)])
-        trials_vec = np.array(
-            [x for y in range(len(data_fracs)) for x in range(n_trials)]
-        )
-
-        if n_workers == 1:
-            # run all trials synchronously
-            for ii in range(len(data_fracs_vec)):
-                data_frac = data_fracs_vec[ii]
-                trial_i = trials_vec[ii]
-                helper(data_frac, trial_i)
-
-        elif n_workers > 1:
-            # run trials asynchronously
-            with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as ex:
-                results = tqdm(
-                    ex.map(helper, data_fracs_vec, trials_vec),
-                    total=len(data_fracs_vec),
-                )
-                for exc in results:
-                    if exc:
-                        print(exc)
-        else:
-            raise ValueError(f"value of {n_workers} must be >=1 ")
+        self.open_results_store(**kwargs)
+        try:
+            self.run_trials(self.run_baseline_trial, partial_kwargs, **kwargs)
+        finally:
+            release_ground_truth_context(partial_kwargs["ground_truth_context_key"])
 
         self.aggregate_results(**kwargs)
 
@@ -206,7 +297,7 @@ class BaselineExperiment(Experiment):
         :type trial_i: int
         """
 
-        spec = copy.deepcopy(kwargs["spec"])
+        spec = copy_spec_without_data(kwargs["spec"])
 
         dataset = spec.dataset
         regime = kwargs["regime"]
@@ -289,7 +380,10 @@ class BaselineExperiment(Experiment):
                 solution = baseline_model.train(features, labels, **train_kwargs)
 
                 # predict the probabilities (e.g. 0.85) not the labels (e.g., 1)
-                if hasattr(baseline_model, "eval_batch_size"):
+                if perf_eval_kwargs.get("streaming_eval", False):
+                    # predictions are made batch by batch at evaluation time
+                    y_pred = None
+                elif hasattr(baseline_model, "eval_batch_size"):
                     pred_kwargs["eval_batch_size"] = getattr(
                         baseline_model, "eval_batch_size"
                     )
@@ -350,13 +444,27 @@ class BaselineExperiment(Experiment):
             if verbose:
                 print("Solution was found. Calculating performance.\n")
             if regime == "supervised_learning":
-                performance = perf_eval_fn(y_pred, **perf_eval_kwargs)
+                if perf_eval_kwargs.get("streaming_eval", False):
+                    performance = streaming_perf_eval(
+                        model=baseline_model,
+                        solution=solution,
+                        perf_eval_fn=perf_eval_fn,
+                        **perf_eval_kwargs,
+                    )
+                else:
+                    performance = perf_eval_fn(y_pred, **perf_eval_kwargs)
             elif regime == "reinforcement_learning":
                 perf_eval_kwargs["model"] = baseline_model
                 perf_eval_kwargs["hyperparameter_and_setting_dict"] = kwargs[
                     "hyperparameter_and_setting_dict"
                 ]
-                episodes_for_eval, performance = perf_eval_fn(**perf_eval_kwargs)
+                if perf_eval_fn is generate_episodes_and_calc_J:
+                    # Size the rollout pool by the number of parallel trials
+                    episodes_for_eval, performance = perf_eval_fn(
+                        n_trial_workers=kwargs["n_workers"], **perf_eval_kwargs
+                    )
+                else:
+                    episodes_for_eval, performance = perf_eval_fn(**perf_eval_kwargs)
 
             if verbose:
                 print(f"Performance = {performance}\n")
@@ -371,17 +479,30 @@ class BaselineExperiment(Experiment):
                 # Need to put the newly generated episodes into the new dataset
                 constraint_eval_kwargs["episodes_for_eval"] = episodes_for_eval
                 constraint_eval_kwargs["performance"] = performance
-                dataset_for_eval = RLDataSet(
-                    episodes=episodes_for_eval, meta=dataset.meta
-                )
+                if constraint_eval_kwargs.get("on_policy", True):
+                    dataset_for_eval = RLDataSet(
+                        episodes=episodes_for_eval, meta=dataset.meta
+                    )
+                else:
+                    # Off-policy estimates from the behavior policy
+                    # episodes, like the Seldonian trials
+                    dataset_for_eval = dataset
 
             constraint_eval_kwargs["baseline_model"] = baseline_model
             constraint_eval_kwargs["dataset"] = dataset_for_eval
             constraint_eval_kwargs["regime"] = regime
             constraint_eval_kwargs["sub_regime"] = spec.sub_regime
             constraint_eval_kwargs["parse_trees"] = parse_trees
-            constraint_eval_kwargs["additional_datasets"] = spec.additional_datasets
+            # Like the Seldonian trials, evaluate on the held out additional
+            # datasets in constraint_eval_kwargs, which the plot generator
+            # validated and combined (see combine_held_out_addl_datasets()).
+            # They are only used if the spec has additional datasets.
+            if not spec.additional_datasets:
+                constraint_eval_kwargs["additional_datasets"] = {}
             constraint_eval_kwargs["verbose"] = verbose
+            constraint_eval_kwargs["ground_truth_context_key"] = kwargs.get(
+                "ground_truth_context_key"
+            )
 
             gvec = self.evaluate_constraint_functions(
                 solution=solution,
@@ -401,8 +522,9 @@ class BaselineExperiment(Experiment):
         # colnames = ["data_frac", "trial_i", "performance", "failed"]
         data = [data_frac, trial_i, performance, gvec]
         colnames = ["data_frac", "trial_i", "performance", "gvec"]
-        self.write_trial_result(data, colnames, d_trial, verbose=kwargs["verbose"])
-        return
+        return self.write_trial_result(
+            data, colnames, d_trial, verbose=kwargs["verbose"]
+        )
 
     def evaluate_constraint_functions(
         self, solution, constraint_eval_fns, constraint_eval_kwargs
@@ -432,7 +554,7 @@ class BaselineExperiment(Experiment):
         gvals = []
         if constraint_eval_fns == []:
             parse_trees = constraint_eval_kwargs["parse_trees"]
-            additional_datasets = constraint_eval_kwargs["additional_datasets"]
+            held_out_addl_datasets = constraint_eval_kwargs["additional_datasets"]
             regime = constraint_eval_kwargs["regime"]
             sub_regime = constraint_eval_kwargs["sub_regime"]
             backup_dataset_for_eval = constraint_eval_kwargs["dataset"]
@@ -442,32 +564,43 @@ class BaselineExperiment(Experiment):
             else:
                 batch_size_safety = None
 
+            # The theta-independent data only stay the same
+            # across trials when the ground truth dataset does
+            if regime == "supervised_learning":
+                ground_truth_context = get_ground_truth_context(
+                    constraint_eval_kwargs.get("ground_truth_context_key")
+                )
+            else:
+                ground_truth_context = None
+
             for parse_tree in parse_trees:
                 parse_tree.reset_base_node_dict(reset_data=True)
+                if ground_truth_context is not None:
+                    ground_truth_context.restore(parse_tree)
 
                 # handle additional datasets
-                if additional_datasets:
-                    held_out_addl_datasets = constraint_eval_kwargs[
-                        "additional_datasets"
-                    ]
+                if held_out_addl_datasets:
                     tree_dataset_dict = {}
                     cstr = parse_tree.constraint_str
 
                     for bn in held_out_addl_datasets[cstr]:
-                        if "candidate_dataset" in held_out_addl_datasets[cstr][bn]:
-                            # Combine the candidate and safety datasets into a single dataset for evaluation
-                            combined_dataset = (
-                                held_out_addl_datasets[cstr][bn]["candidate_dataset"]
-                                + held_out_addl_datasets[cstr][bn]["safety_dataset"]
-                            )
-                            tree_dataset_dict[bn] = combined_dataset
-                        else:
-                            tree_dataset_dict[bn] = held_out_addl_datasets[cstr][bn][
-                                "dataset"
-                            ]
+                        tree_dataset_dict[bn] = get_held_out_addl_dataset(
+                            held_out_addl_datasets[cstr][bn]
+                        )
                 else:
                     tree_dataset_dict = {"all": backup_dataset_for_eval}
 
+                if regime == "reinforcement_learning" and hasattr(
+                    baseline_model, "get_importance_weights_from_episode_arrays"
+                ):
+                    precompute_IS_base_node_values(
+                        parse_tree,
+                        baseline_model,
+                        solution,
+                        tree_dataset_dict,
+                        regime,
+                    )
+
                 parse_tree.evaluate_constraint(
                     theta=solution,
                     tree_dataset_dict=tree_dataset_dict,
@@ -477,6 +610,8 @@ class BaselineExperiment(Experiment):
                     branch="safety_test",
                     batch_size_safety=batch_size_safety,
                 )
+                if ground_truth_context is not None:
+                    ground_truth_context.save(parse_tree)
                 g = parse_tree.root.value
 
                 gvals.append(g)
@@ -515,59 +650,39 @@ class SeldonianExperiment(Experiment):
 
     def run_experiment(self, **kwargs):
         """Run the Seldonian experiment"""
-
-        n_workers = kwargs["n_workers"]
-        trial_kwargs = {
+        partial_kwargs = {
             key: kwargs[key] for key in kwargs if key not in ["data_fracs", "n_trials"]
         }
+        partial_kwargs["ground_truth_context_key"] = register_ground_truth_context()
 
-        data_fracs = kwargs["data_fracs"]
-        n_trials = kwargs["n_trials"]
-
-        if n_workers == 1:
-            for data_frac in data_fracs:
-                for trial_i in range(n_trials):
-                    self.run_QSA_trial(data_frac, trial_i, **trial_kwargs)
-
-        elif n_workers > 1:
-            import itertools
-
-            manager = mp.Manager()
-            shared_namespace = manager.Namespace()
-
-            # Store the trial_kwargs in the shared namespace
-            shared_namespace.trial_kwargs = trial_kwargs
-
-            chunked_arg_list = trial_arg_chunker(data_fracs, n_trials, n_workers)
-            with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as ex:
-                results = tqdm(
-                    ex.map(
-                        self.run_trials_par,
-                        chunked_arg_list,
-                        itertools.repeat(shared_namespace),
-                    ),
-                    total=len(chunked_arg_list),
-                )
-                for exc in results:
-                    if exc:
-                        print(exc)
-        else:
-            raise ValueError(f"n_workers value of {n_workers} must be >=1 ")
+        self.open_results_store(**kwargs)
+        if kwargs.get("save_importance_weights", False):
+            self.importance_weight_store = ImportanceWeightStore(
+                self.results_dir, self.model_name
+            )
+        try:
+            self.run_trials(self.run_QSA_trial, partial_kwargs, **kwargs)
+        finally:
+            release_ground_truth_context(partial_kwargs["ground_truth_context_key"])
 
         self.aggregate_results(**kwargs)
 
-    def run_trials_par(self, args_list, shared_namespace):
-        """Wrapper function that is run as a parallel process. 
-        Runs all the trials provided in args_list on a single core .
+    def record_trial_result(self, result):
+        """Append the result returned by a trial to the
+        consolidated results file, and its importance weights,
+        if any, to the importance weight store
 
-        :param args_list: list of (data_frac,trial_i) pairs
-        :param shared_namespace: The namespace shared across multiple cores 
-            containing the keyword arguments that are the same 
-            for all trials. 
+        :param result: The result row, see run_QSA_trial()
+        :type result: dict
         """
-        for args in args_list:
-            data_frac, trial_i = args
-            self.run_QSA_trial(data_frac, trial_i, **shared_namespace.trial_kwargs)
+        if result and "importance_weights" in result:
+            result = dict(result)
+            importance_weights = result.pop("importance_weights")
+            for branch, weights in importance_weights.items():
+                self.importance_weight_store.add(
+                    branch, result["data_frac"], result["trial_i"], weights
+                )
+        super().record_trial_result(result)
 
     def run_QSA_trial(self, data_frac, trial_i, **kwargs):
         """Run a trial of the quasi-Seldonian algorithm (QSA)
@@ -577,6 +692,11 @@ class SeldonianExperiment(Experiment):
 
         :param trial_i: The index of the trial
         :type trial_i: int
+
+        :return: The result row (see write_trial_result()), or None if
+            the trial was already run. For reinforcement learning with
+            save_importance_weights=True, it also has the importance weights
+            of both branches under the "importance_weights" key.
         """
         spec = kwargs["spec"]
         regime = kwargs["regime"]
@@ -670,18 +790,29 @@ class SeldonianExperiment(Experiment):
                     X_test = perf_eval_kwargs["X"]
                     Y_test = perf_eval_kwargs["y"]
                     model = SA.model
-                    # Batch the prediction if specified
-                    if "eval_batch_size" in perf_eval_kwargs:
-                        y_pred = batch_predictions(
+                    if perf_eval_kwargs.get("streaming_eval", False):
+                        # Predict and score one batch at a time
+                        performance = streaming_perf_eval(
                             model=model,
                             solution=solution,
-                            X_test=X_test,
+                            perf_eval_fn=perf_eval_fn,
                             **perf_eval_kwargs,
                         )
                     else:
-                        y_pred = model.predict(solution, X_test)
+                        # Batch the prediction if specified
+                        if "eval_batch_size" in perf_eval_kwargs:
+                            y_pred = batch_predictions(
+                                model=model,
+                                solution=solution,
+                                X_test=X_test,
+                                **perf_eval_kwargs,
+                            )
+                        else:
+                            y_pred = model.predict(solution, X_test)
 
-                    performance = perf_eval_fn(y_pred, model=model, **perf_eval_kwargs)
+                        performance = perf_eval_fn(
+                            y_pred, model=model, **perf_eval_kwargs
+                        )
 
                 elif regime == "reinforcement_learning":
                     model = copy.deepcopy(SA.model)
@@ -690,7 +821,15 @@ class SeldonianExperiment(Experiment):
                     perf_eval_kwargs["hyperparameter_and_setting_dict"] = kwargs[
                         "hyperparameter_and_setting_dict"
                     ]
-                    episodes_new_policy, performance = perf_eval_fn(**perf_eval_kwargs)
+                    if perf_eval_fn is generate_episodes_and_calc_J:
+                        # Size the rollout pool by the number of parallel trials
+                        episodes_new_policy, performance = perf_eval_fn(
+                            n_trial_workers=kwargs["n_workers"], **perf_eval_kwargs
+                        )
+                    else:
+                        episodes_new_policy, performance = perf_eval_fn(
+                            **perf_eval_kwargs
+                        )
 
                 elif regime == "custom":
                     test_data = perf_eval_kwargs["test_data"]
@@ -717,6 +856,9 @@ class SeldonianExperiment(Experiment):
                 constraint_eval_kwargs["regime"] = regime
                 constraint_eval_kwargs["branch"] = "safety_test"
                 constraint_eval_kwargs["verbose"] = verbose
+                constraint_eval_kwargs["ground_truth_context_key"] = kwargs.get(
+                    "ground_truth_context_key"
+                )
 
                 if regime == "reinforcement_learning":
                     constraint_eval_kwargs["episodes_new_policy"] = episodes_new_policy
@@ -752,8 +894,20 @@ class SeldonianExperiment(Experiment):
         # Write out file for this data_frac,trial_i combo
         data = [data_frac, trial_i, performance, passed_safety, gvec]
         colnames = ["data_frac", "trial_i", "performance", "passed_safety", "gvec"]
-        self.write_trial_result(data, colnames, trial_dir, verbose=kwargs["verbose"])
-        return
+        result = self.write_trial_result(
+            data, colnames, trial_dir, verbose=kwargs["verbose"]
+        )
+        if (
+            regime == "reinforcement_learning"
+            and kwargs.get("save_importance_weights", False)
+            and solution_found
+        ):
+            # Recorded in the importance weight store by the parent process
+            result["importance_weights"] = {
+                branch: SA.get_importance_weights(branch, solution)
+                for branch in ["candidate_selection", "safety_test"]
+            }
+        return result
 
     def evaluate_constraint_functions(
         self, solution, constraint_eval_fns, constraint_eval_kwargs
@@ -829,8 +983,20 @@ class SeldonianExperiment(Experiment):
                 sub_regime = None
                 backup_dataset_for_eval = spec_orig.dataset
 
+            # The theta-independent data only stay the same
+            # across trials when the ground truth dataset does,
+            # which is not the case for on-policy RL evaluation
+            if regime == "reinforcement_learning" and on_policy:
+                ground_truth_context = None
+            else:
+                ground_truth_context = get_ground_truth_context(
+                    constraint_eval_kwargs.get("ground_truth_context_key")
+                )
+
             for parse_tree in spec_for_exp.parse_trees:
                 parse_tree.reset_base_node_dict(reset_data=True)
+                if ground_truth_context is not None:
+                    ground_truth_context.restore(parse_tree)
 
                 # handle additional datasets
                 if have_additional_datasets:
@@ -838,17 +1004,9 @@ class SeldonianExperiment(Experiment):
                     cstr = parse_tree.constraint_str
 
                     for bn in held_out_addl_datasets[cstr]:
-                        if "candidate_dataset" in held_out_addl_datasets[cstr][bn]:
-                            # Combine the candidate and safety datasets into a single dataset for evaluation
-                            combined_dataset = (
-                                held_out_addl_datasets[cstr][bn]["candidate_dataset"]
-                                + held_out_addl_datasets[cstr][bn]["safety_dataset"]
-                            )
-                            tree_dataset_dict[bn] = combined_dataset
-                        else:
-                            tree_dataset_dict[bn] = held_out_addl_datasets[cstr][bn][
-                                "dataset"
-                            ]
+                        tree_dataset_dict[bn] = get_held_out_addl_dataset(
+                            held_out_addl_datasets[cstr][bn]
+                        )
                 else:
                     tree_dataset_dict = {"all": backup_dataset_for_eval}
                 # parse_tree.evaluate_constraint(**constraint_eval_kwargs)
@@ -861,6 +1019,8 @@ class SeldonianExperiment(Experiment):
                     branch="safety_test",
                     batch_size_safety=batch_size_safety,
                 )
+                if ground_truth_context is not None:
+                    ground_truth_context.save(parse_tree)
 
                 g = parse_tree.root.value
                 gvals.append(g)
@@ -895,39 +1055,19 @@ class FairlearnExperiment(Experiment):
             results_dir=results_dir,
             model_name=f"fairlearn_eps{fairlearn_epsilon_constraint:.2f}",
         )
+        self.fairlearn_epsilon_constraint = fairlearn_epsilon_constraint
+        self.trial_dir = os.path.join(
+            self.results_dir, f"{self.model_name}_results", "trial_data"
+        )
 
     def run_experiment(self, **kwargs):
         """Run the Fairlearn experiment"""
-        n_workers = kwargs["n_workers"]
         partial_kwargs = {
             key: kwargs[key] for key in kwargs if key not in ["data_fracs", "n_trials"]
         }
 
-        helper = partial(self.run_fairlearn_trial, **partial_kwargs)
-
-        data_fracs = kwargs["data_fracs"]
-        n_trials = kwargs["n_trials"]
-        data_fracs_vector = np.array([x for x in data_fracs for y in range(n_trials)])
-        trials_vector = np.array(
-            [x for y in range(len(data_fracs)) for x in range(n_trials)]
-        )
-
-        if n_workers == 1:
-            for ii in range(len(data_fracs_vector)):
-                data_frac = data_fracs_vector[ii]
-                trial_i = trials_vector[ii]
-                helper(data_frac, trial_i)
-        elif n_workers > 1:
-            with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as ex:
-                results = tqdm(
-                    ex.map(helper, data_fracs_vector, trials_vector),
-                    total=len(data_fracs_vector),
-                )
-                for exc in results:
-                    if exc:
-                        print(exc)
-        else:
-            raise ValueError(f"n_workers value of {n_workers} must be >=1 ")
+        self.open_results_store(**kwargs)
+        self.run_trials(self.run_fairlearn_trial, partial_kwargs, **kwargs)
 
         self.aggregate_results(**kwargs)
 
@@ -945,28 +1085,10 @@ class FairlearnExperiment(Experiment):
         verbose = kwargs["verbose"]
         datagen_method = kwargs["datagen_method"]
         fairlearn_sensitive_feature_names = kwargs["fairlearn_sensitive_feature_names"]
-        fairlearn_constraint_name = kwargs["fairlearn_constraint_name"]
-        fairlearn_epsilon_constraint = kwargs["fairlearn_epsilon_constraint"]
-        fairlearn_epsilon_eval = kwargs["fairlearn_epsilon_eval"]
-        fairlearn_eval_kwargs = kwargs["fairlearn_eval_kwargs"]
-        perf_eval_fn = kwargs["perf_eval_fn"]
-        perf_eval_kwargs = kwargs["perf_eval_kwargs"]
-        constraint_eval_fns = kwargs["constraint_eval_fns"]
-        constraint_eval_kwargs = kwargs["constraint_eval_kwargs"]
 
         assert regime == "supervised_learning"
 
-        trial_dir = os.path.join(
-            self.results_dir,
-            f"fairlearn_eps{fairlearn_epsilon_constraint:.2f}_results",
-            "trial_data",
-        )
-
-        savename = os.path.join(
-            trial_dir, f"data_frac_{data_frac:.4f}_trial_{trial_i}.csv"
-        )
-
-        if os.path.exists(savename):
+        if self.trial_exists(data_frac, trial_i):
             if verbose:
                 print(
                     f"Trial {trial_i} already run for "
@@ -974,8 +1096,6 @@ class FairlearnExperiment(Experiment):
                 )
             return
 
-        os.makedirs(trial_dir, exist_ok=True)
-
         ##############################################
         """ Setup for running Fairlearn algorithm """
         ##############################################
@@ -990,32 +1110,63 @@ class FairlearnExperiment(Experiment):
             verbose=verbose,
         )
 
-        ##############################################
-        """" Run Fairlearn algorithm on trial data """
-        ##############################################
+        return self.fit_and_evaluate_trial(
+            features,
+            labels,
+            fairlearn_sensitive_features,
+            data_frac,
+            trial_i,
+            **kwargs,
+        )
+
+    def trial_exists(self, data_frac, trial_i):
+        """Check whether the result file for a trial
+        has already been written
 
+        :param data_frac: Fraction of overall dataset size to use
+        :type data_frac: float
+
+        :param trial_i: The index of the trial
+        :type trial_i: int
+
+        :rtype: bool
+        """
+        savename = os.path.join(
+            self.trial_dir, f"data_frac_{data_frac:.4f}_trial_{trial_i}.csv"
+        )
+        return os.path.exists(savename)
+
+    def make_fairlearn_constraint(self, fairlearn_constraint_name):
+        """Create the Fairlearn constraint object
+        with this experiment's value of epsilon
+
+        :param fairlearn_constraint_name: The name of the constraint
+        :type fairlearn_constraint_name: str
+        """
+        reductions = import_fairlearn_reductions()
+        fairlearn_epsilon_constraint = self.fairlearn_epsilon_constraint
         if fairlearn_constraint_name == "disparate_impact":
-            fairlearn_constraint = DemographicParity(
+            fairlearn_constraint = reductions.DemographicParity(
                 ratio_bound=fairlearn_epsilon_constraint
             )
 
         elif fairlearn_constraint_name == "demographic_parity":
-            fairlearn_constraint = DemographicParity(
+            fairlearn_constraint = reductions.DemographicParity(
                 difference_bound=fairlearn_epsilon_constraint
             )
 
         elif fairlearn_constraint_name == "predictive_equality":
-            fairlearn_constraint = FalsePositiveRateParity(
+            fairlearn_constraint = reductions.FalsePositiveRateParity(
                 difference_bound=fairlearn_epsilon_constraint
             )
 
         elif fairlearn_constraint_name == "equalized_odds":
-            fairlearn_constraint = EqualizedOdds(
+            fairlearn_constraint = reductions.EqualizedOdds(
                 difference_bound=fairlearn_epsilon_constraint
             )
 
         elif fairlearn_constraint_name == "equal_opportunity":
-            fairlearn_constraint = EqualizedOdds(
+            fairlearn_constraint = reductions.EqualizedOdds(
                 difference_bound=fairlearn_epsilon_constraint
             )
 
@@ -1025,10 +1176,49 @@ class FairlearnExperiment(Experiment):
                 f"{fairlearn_constraint_name} "
                 "is not supported."
             )
+        return fairlearn_constraint
+
+    def fit_and_evaluate_trial(
+        self,
+        features,
+        labels,
+        fairlearn_sensitive_features,
+        data_frac,
+        trial_i,
+        **kwargs,
+    ):
+        """Fit the Fairlearn mitigator to the data of a single trial,
+        evaluate it on the ground truth dataset and write
+        out the trial result file
+
+        :param features: The trial features
+        :param labels: The trial labels
+        :param fairlearn_sensitive_features: The trial sensitive features
+        :param data_frac: Fraction of overall dataset size to use
+        :type data_frac: float
+        :param trial_i: The index of the trial
+        :type trial_i: int
+        """
+        spec = kwargs["spec"]
+        verbose = kwargs["verbose"]
+        fairlearn_constraint_name = kwargs["fairlearn_constraint_name"]
+        fairlearn_epsilon_eval = kwargs["fairlearn_epsilon_eval"]
+        fairlearn_eval_kwargs = kwargs["fairlearn_eval_kwargs"]
+        perf_eval_fn = kwargs["perf_eval_fn"]
+
+        os.makedirs(self.trial_dir, exist_ok=True)
+
+        ##############################################
+        """" Run Fairlearn algorithm on trial data """
+        ##############################################
+
+        fairlearn_constraint = self.make_fairlearn_constraint(fairlearn_constraint_name)
 
         classifier = LogisticRegression()
 
-        mitigator = ExponentiatedGradient(classifier, fairlearn_constraint)
+        mitigator = import_fairlearn_reductions().ExponentiatedGradient(
+            classifier, fairlearn_constraint
+        )
         solution_found = True
 
         try:
@@ -1075,10 +1265,11 @@ class FairlearnExperiment(Experiment):
         # Write out file for this data_frac,trial_i combo
         data = [data_frac, trial_i, performance, gvec]
         colnames = ["data_frac", "trial_i", "performance", "gvec"]
-        self.write_trial_result(data, colnames, trial_dir, verbose=kwargs["verbose"])
-        return
+        return self.write_trial_result(
+            data, colnames, self.trial_dir, verbose=verbose
+        )
 
-    def get_fairlearn_predictions(self, mitigator, X_test_fairlearn):
+    def get_fairlearn_predictions(self, mitigator, X_test_fairlearn, block_size=None):
         """
         Get the predicted labels from the fairlearn mitigator.
         The mitigator consists of potentially more than one predictor.
@@ -1086,24 +1277,51 @@ class FairlearnExperiment(Experiment):
         how many points to predict based on the weight of that predictor.
         Weights are normalized to 1 across all predictors.
 
+        If all predictors with non-zero weight are binary
+        logistic regression models, the predictions are computed
+        with get_logistic_mixture_predictions() instead of one
+        predict_proba() call per predictor.
+
         :param mitigator: The Fairlearn mitigator
 
         :param X_test_fairlearn: The test features from which
                 to predict the labels
 
+        :param block_size: The number of rows to predict at once
+                in the logistic regression fast path. If None,
+                all rows are predicted at once.
+        :type block_size: int
+
         :return y_pred: Array of predicted class labels
         """
         n_points_test = len(X_test_fairlearn)
-        y_pred = np.zeros(n_points_test)
         assert len(mitigator.predictors_) == len(mitigator.weights_)
+        # Predictors with non-zero weight and the
+        # range of test points each of them predicts
+        predictors = []
+        index_ranges = []
         start_index = 0
         for ii in range(len(mitigator.predictors_)):
             weight = mitigator.weights_[ii]
             if weight == 0:
                 continue
-            predictor = mitigator.predictors_[ii]
             n_points_this_predictor = int(round(weight * n_points_test))
             end_index = start_index + n_points_this_predictor
+            predictors.append(mitigator.predictors_[ii])
+            index_ranges.append((start_index, end_index))
+            start_index = end_index
+
+        if all(
+            isinstance(predictor, LogisticRegression)
+            and predictor.coef_.shape[0] == 1
+            for predictor in predictors
+        ):
+            return self.get_logistic_mixture_predictions(
+                predictors, index_ranges, X_test_fairlearn, block_size=block_size
+            )
+
+        y_pred = np.zeros(n_points_test)
+        for predictor, (start_index, end_index) in zip(predictors, index_ranges):
             X_test_this_predictor = X_test_fairlearn[start_index:end_index]
 
             probs = predictor.predict_proba(X_test_this_predictor)
@@ -1114,7 +1332,52 @@ class FairlearnExperiment(Experiment):
             else:
                 predictions = probs[:, 1]
             y_pred[start_index:end_index] = predictions
-            start_index = end_index
+        return y_pred
+
+    def get_logistic_mixture_predictions(
+        self, predictors, index_ranges, X_test_fairlearn, block_size=None
+    ):
+        """Predict the positive class probabilities of a mixture
+        of binary logistic regression models, where predictor k
+        predicts the test points in index_ranges[k].
+        The coefficients of all predictors are stacked so that
+        the logits of a block of rows come from a single
+        matrix multiplication.
+
+        :param predictors: Fitted binary LogisticRegression models
+        :param index_ranges: (start_index,end_index) of the
+                test points predicted by each predictor
+        :param X_test_fairlearn: The test features from which
+                to predict the labels
+        :param block_size: The number of rows to predict at once.
+                If None, all rows are predicted at once.
+        :type block_size: int
+
+        :return y_pred: Array of predicted class labels
+        """
+        n_points_test = len(X_test_fairlearn)
+        y_pred = np.zeros(n_points_test)
+        if len(predictors) == 0:
+            return y_pred
+
+        coefs = np.vstack([predictor.coef_ for predictor in predictors])  # (K,d)
+        intercepts = np.array([predictor.intercept_[0] for predictor in predictors])
+
+        # Which predictor each test point belongs to.
+        # Points past the last range are left at 0.
+        starts, ends = np.minimum(np.array(index_ranges).T, n_points_test)
+        n_predicted = ends[-1]
+        predictor_ids = np.repeat(np.arange(len(predictors)), ends - starts)
+
+        if block_size is None:
+            block_size = max(n_predicted, 1)
+        for block_start in range(0, n_predicted, block_size):
+            block_end = min(block_start + block_size, n_predicted)
+            X_block = np.asarray(X_test_fairlearn[block_start:block_end])
+            logits = np.dot(X_block, coefs.T) + intercepts  # (block,K)
+            ids = predictor_ids[block_start:block_end]
+            block_logits = logits[np.arange(len(ids)), ids]
+            y_pred[block_start:block_end] = expit(block_logits)
         return y_pred
 
     def evaluate_constraint_function(
@@ -1127,7 +1390,8 @@ class FairlearnExperiment(Experiment):
         sensitive_features=[],
     ):
         """Evaluate the constraint function using the
-        Fairlearn predictions
+        Fairlearn predictions. The per-group confusion counts
+        are computed in a single pass over the test set.
 
         :param y_pred: Predicted class labels, same shape as test_labels
         :type y_pred: 1D array
@@ -1150,118 +1414,163 @@ class FairlearnExperiment(Experiment):
                 sensitive in the Fairlearn dataset
         :type sensitive_features: List(str)
         """
-        failed = False
+        # TN, FP, FN, TP for each group and for the whole test set
+        group_counts = grouped_confusion_counts(
+            y_true=test_labels,
+            y_pred=y_pred >= 0.5,
+            sensitive_features=sensitive_features,
+        )
+        PR_grouped, FPR_grouped, FNR_grouped = confusion_rates(group_counts)
+        PR_overall, FPR_overall, FNR_overall = confusion_rates(group_counts.sum(axis=0))
+
+        # Compare the first group to either the overall rate
+        # or the second group, depending on the eval_method
+        if eval_method == "native":
+            PR_group2, FPR_group2, FNR_group2 = PR_overall, FPR_overall, FNR_overall
+        elif eval_method == "two-groups":
+            PR_group2, FPR_group2, FNR_group2 = (
+                PR_grouped[1],
+                FPR_grouped[1],
+                FNR_grouped[1],
+            )
+        PR_group1, FPR_group1, FNR_group1 = PR_grouped[0], FPR_grouped[0], FNR_grouped[0]
+
         if fairlearn_constraint_name == "demographic_parity":
             # g = abs((PR | ATR1) - (PR | ATR2)) - eps
-            PR_frame = MetricFrame(
-                metrics=selection_rate,
-                y_true=test_labels,
-                y_pred=y_pred >= 0.5,
-                sensitive_features=sensitive_features,
-            )
-            PR_grouped = PR_frame.by_group
-            PR_group1 = PR_grouped.iloc[0]
-            if eval_method == "native":
-                PR_overall = PR_frame.overall
-                g = abs(PR_group1 - PR_overall) - epsilon_eval
-            elif eval_method == "two-groups":
-                PR_group2 = PR_grouped.iloc[1]
-                g = abs(PR_group1 - PR_group2) - epsilon_eval
+            g = abs(PR_group1 - PR_group2) - epsilon_eval
 
         elif fairlearn_constraint_name == "predictive_equality":
             # g = abs((FPR | ATR1) - (FPR | ATR2)) - eps
-            FPR_frame = MetricFrame(
-                metrics=false_positive_rate,
-                y_true=test_labels,
-                y_pred=y_pred >= 0.5,
-                sensitive_features=sensitive_features,
-            )
-            FPR_grouped = FPR_frame.by_group
-            FPR_group1 = FPR_grouped.iloc[0]
-            if eval_method == "native":
-                FPR_overall = FPR_frame.overall
-                g = abs(FPR_group1 - FPR_overall) - epsilon_eval
-            elif eval_method == "two-groups":
-                FPR_group2 = FPR_grouped.iloc[1]
-                g = abs(FPR_group1 - FPR_group2) - epsilon_eval
+            g = abs(FPR_group1 - FPR_group2) - epsilon_eval
 
         elif fairlearn_constraint_name == "disparate_impact":
             # g = epsilon - min((PR | ATR1)/(PR | ATR2),(PR | ATR2)/(PR | ATR1))
-            PR_frame = MetricFrame(
-                metrics=selection_rate,
-                y_true=test_labels,
-                y_pred=y_pred >= 0.5,
-                sensitive_features=sensitive_features,
-            )
-
-            PR_grouped = PR_frame.by_group
-            PR_group1 = PR_grouped.iloc[0]
-            if eval_method == "native":
-                PR_overall = PR_frame.overall
-                g = epsilon_eval - min(PR_group1 / PR_overall, PR_overall / PR_group1)
-            elif eval_method == "two-groups":
-                PR_group2 = PR_grouped.iloc[1]
-                g = epsilon_eval - min(PR_group1 / PR_group2, PR_group2 / PR_group1)
+            g = epsilon_eval - min(PR_group1 / PR_group2, PR_group2 / PR_group1)
 
         elif fairlearn_constraint_name == "equalized_odds":
             # g = abs((FNR | [M]) - (FNR | [F])) + abs((FPR | [M]) - (FPR | [F])) - epsilon
-            FPR_frame = MetricFrame(
-                metrics=false_positive_rate,
-                y_true=test_labels,
-                y_pred=y_pred >= 0.5,
-                sensitive_features=sensitive_features,
+            g = (
+                abs(FPR_group1 - FPR_group2)
+                + abs(FNR_group1 - FNR_group2)
+                - epsilon_eval
             )
-            FPR_grouped = FPR_frame.by_group
-            FPR_group1 = FPR_grouped.iloc[0]
-
-            FNR_frame = MetricFrame(
-                metrics=false_negative_rate,
-                y_true=test_labels,
-                y_pred=y_pred >= 0.5,
-                sensitive_features=sensitive_features,
-            )
-            FNR_grouped = FNR_frame.by_group
-            FNR_group1 = FNR_grouped.iloc[0]
-
-            if eval_method == "native":
-                FPR_overall = FPR_frame.overall
-                FNR_overall = FNR_frame.overall
-                g = (
-                    abs(FPR_group1 - FPR_overall)
-                    + abs(FNR_group1 - FNR_overall)
-                    - epsilon_eval
-                )
-            elif eval_method == "two-groups":
-                FPR_group2 = FPR_grouped.iloc[1]
-                FNR_group2 = FNR_grouped.iloc[1]
-                g = (
-                    abs(FPR_group1 - FPR_group2)
-                    + abs(FNR_group1 - FNR_group2)
-                    - epsilon_eval
-                )
 
         elif fairlearn_constraint_name == "equal_opportunity":
             # g = abs((FNR | [M]) - (FNR | [F])) - epsilon
+            g = abs(FNR_group1 - FNR_group2) - epsilon_eval
 
-            FNR_frame = MetricFrame(
-                metrics=false_negative_rate,
-                y_true=test_labels,
-                y_pred=y_pred >= 0.5,
-                sensitive_features=sensitive_features,
-            )
-            FNR_grouped = FNR_frame.by_group
-            FNR_group1 = FNR_grouped.iloc[0]
-
-            if eval_method == "native":
-                FNR_overall = FNR_frame.overall
-                g = abs(FNR_group1 - FNR_overall) - epsilon_eval
-            elif eval_method == "two-groups":
-                FNR_group2 = FNR_grouped.iloc[1]
-                g = abs(FNR_group1 - FNR_group2) - epsilon_eval
         else:
             raise NotImplementedError(
                 "Evaluation for Fairlearn constraints of type: "
-                f"{fairlearn_constraint.short_name} "
+                f"{fairlearn_constraint_name} "
                 "is not supported."
             )
         return np.array([g])
+
+
+class FairlearnSweepExperiment(Experiment):
+    def __init__(self, results_dir, fairlearn_epsilons_constraint):
+        """Class for running Fairlearn experiments for several
+        values of epsilon at once. The data for each
+        (data_frac,trial_i) combination are loaded once and
+        shared by the mitigators of all values of epsilon.
+        The results for each value of epsilon are written
+        to the same place as a FairlearnExperiment with that epsilon.
+
+        :param results_dir: Parent directory for saving any
+                experimental results
+        :type results_dir: str
+
+        :param fairlearn_epsilons_constraint: The values of epsilon
+                (the threshold) to use in the constraint
+                to the Fairlearn model
+        :type fairlearn_epsilons_constraint: List(float)
+        """
+        super().__init__(results_dir=results_dir, model_name="fairlearn_sweep")
+        self.fl_exps = [
+            FairlearnExperiment(
+                results_dir=results_dir,
+                fairlearn_epsilon_constraint=fairlearn_epsilon_constraint,
+            )
+            for fairlearn_epsilon_constraint in fairlearn_epsilons_constraint
+        ]
+
+    def run_experiment(self, **kwargs):
+        """Run the Fairlearn experiments for all values of epsilon"""
+        partial_kwargs = {
+            key: kwargs[key] for key in kwargs if key not in ["data_fracs", "n_trials"]
+        }
+
+        for fl_exp in self.fl_exps:
+            fl_exp.open_results_store(**kwargs)
+        self.run_trials(self.run_fairlearn_sweep_trial, partial_kwargs, **kwargs)
+
+        for fl_exp in self.fl_exps:
+            fl_exp.aggregate_results(**kwargs)
+
+    def record_trial_result(self, results):
+        """Record the result for each value of epsilon
+        in the results file of the corresponding FairlearnExperiment
+
+        :param results: Result rows keyed by model name,
+            see run_fairlearn_sweep_trial()
+        :type results: dict
+        """
+        if results:
+            for fl_exp in self.fl_exps:
+                fl_exp.record_trial_result(results.get(fl_exp.model_name))
+
+    def run_fairlearn_sweep_trial(self, data_frac, trial_i, **kwargs):
+        """Run a Fairlearn trial for every value of epsilon
+        whose result file does not exist yet, loading the trial data once.
+
+        :param data_frac: Fraction of overall dataset size to use
+        :type data_frac: float
+
+        :param trial_i: The index of the trial
+        :type trial_i: int
+
+        :return: The result rows of the trials that were run, keyed by model name
+        :rtype: dict
+        """
+        verbose = kwargs["verbose"]
+        assert kwargs["regime"] == "supervised_learning"
+
+        fl_exps_to_run = [
+            fl_exp
+            for fl_exp in self.fl_exps
+            if not fl_exp.trial_exists(data_frac, trial_i)
+        ]
+        if len(fl_exps_to_run) == 0:
+            if verbose:
+                print(
+                    f"Trial {trial_i} already run for "
+                    f"this data_frac: {data_frac} for all values of epsilon. "
+                    "Skipping this trial. "
+                )
+            return
+
+        features, labels, fairlearn_sensitive_features = prep_data_for_fairlearn(
+            spec=kwargs["spec"],
+            results_dir=self.results_dir,
+            trial_i=trial_i,
+            data_frac=data_frac,
+            datagen_method=kwargs["datagen_method"],
+            fairlearn_sensitive_feature_names=kwargs[
+                "fairlearn_sensitive_feature_names"
+            ],
+            verbose=verbose,
+        )
+
+        results = {}
+        for fl_exp in fl_exps_to_run:
+            results[fl_exp.model_name] = fl_exp.fit_and_evaluate_trial(
+                features,
+                labels,
+                fairlearn_sensitive_features,
+                data_frac,
+                trial_i,
+                **kwargs,
+            )
+        return results
+
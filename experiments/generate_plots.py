@@ -2,28 +2,694 @@
 
 import os
 import glob
+import json
 import pickle
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
 import autograd.numpy as np  # Thinly-wrapped version of Numpy
 import pandas as pd
-import matplotlib
-from matplotlib.ticker import FormatStrFormatter
-import matplotlib.pyplot as plt
-from matplotlib import style
+
+# matplotlib is imported by the functions that plot, so that running
+# experiments (and every worker process) does not pay for importing it
 
 from seldonian.utils.io_utils import load_pickle, save_pickle
 from seldonian.dataset import *
 
-from .experiments import BaselineExperiment, SeldonianExperiment, FairlearnExperiment
+from .experiments import (
+    BaselineExperiment,
+    SeldonianExperiment,
+    FairlearnExperiment,
+    FairlearnSweepExperiment,
+)
 from .experiment_utils import (
     generate_behavior_policy_episodes,
-    has_failed,
+    combine_held_out_addl_datasets,
+    is_out_of_core,
+    get_mp_context,
+)
+from .results import (
+    seldonian_model_set,
+    find_models,
+    compute_summary,
+    results_filename,
+    run_info_filename,
+    find_run_info,
+    ImportanceWeightStore,
 )
 
-seldonian_model_set = set(["qsa", "headless_qsa", "sa"])
-plot_colormap = matplotlib.cm.get_cmap("tab10")
+plot_colormap_name = "tab10"
 marker_list = ["s", "p", "d", "*", "x", "h", "+"]
 
 
+def plot_summary(
+    summary,
+    constraint_strs,
+    deltas,
+    tot_data_size,
+    model_label_dict={},
+    fontsize=12,
+    title_fontsize=12,
+    legend_fontsize=8,
+    ncols_legend=3,
+    performance_label="accuracy",
+    sr_label="Prob. of solution",
+    fr_label="Prob. of violation",
+    performance_yscale="linear",
+    performance_ylims=[],
+    hoz_axis_label="Amount of data",
+    show_confidence_level=True,
+    marker_size=20,
+    save_format="pdf",
+    show_title=True,
+    custom_title=None,
+    include_legend=True,
+    savename=None,
+):
+    """Make the three plots from a summary table (see
+    PlotGenerator.compute_summary()). Does not need the spec
+    or the results themselves, so it can also plot the
+    partial results of a running experiment.
+
+    :param summary: The summary of every model to plot
+    :type summary: pandas.DataFrame
+    :param constraint_strs: The constraint strings, one row of plots each
+    :type constraint_strs: List(str)
+    :param deltas: The confidence levels of the constraints
+    :type deltas: List(float)
+    :param tot_data_size: The total number of datapoints in the experiment,
+        used to convert data_frac to the horizontal axes of the plots.
+
+    The shaded bands are the intervals in the summary, see
+    summarize_results(). See PlotGenerator.make_plots() for the remaining parameters.
+
+    :return: The figure
+    """
+    import matplotlib
+    import matplotlib.pyplot as plt
+
+    plot_colormap = matplotlib.cm.get_cmap(plot_colormap_name)
+    plt.style.use("bmh")
+    n_constraints = len(constraint_strs)
+    models = set(summary["model"])
+    seldonian_models = sorted(models.intersection(seldonian_model_set))
+    baselines = sorted(models.difference(seldonian_model_set))
+    summary_dict = {
+        (model_name, constraint_num): df.sort_values("data_frac")
+        for (model_name, constraint_num), df in summary.groupby(
+            ["model", "constraint_num"]
+        )
+    }
+
+    ## PLOTTING SETUP
+    vert_size = 3 + n_constraints
+    if include_legend:
+        vert_size += 0.5
+        figsize = (14, vert_size)
+    else:
+        figsize = (14, vert_size)
+    fig = plt.figure(figsize=figsize)
+    plot_index = 1
+    n_rows = len(constraint_strs)
+    n_cols = 3
+    legend_handles = []
+    legend_labels = []
+
+    # One row per constraint
+    for constraint_index, constraint_str in enumerate(constraint_strs):
+        constraint_num = constraint_index + 1
+        delta = deltas[constraint_index]
+
+        # SETUP FOR PLOTTING
+        ax_performance = fig.add_subplot(n_rows, n_cols, plot_index)
+        plot_index += 1
+        ax_sr = fig.add_subplot(n_rows, n_cols, plot_index, sharex=ax_performance)
+        plot_index += 1
+        ax_fr = fig.add_subplot(n_rows, n_cols, plot_index, sharex=ax_performance)
+        plot_index += 1
+
+        # Plot title (put above middle plot)
+        if show_title:
+            if custom_title:
+                title = custom_title
+            else:
+                title = f"constraint: \ng={constraint_str}"
+            ax_sr.set_title(title, y=1.05, fontsize=title_fontsize)
+
+        # Plot labels
+        ax_performance.set_ylabel(performance_label, fontsize=fontsize)
+        ax_sr.set_ylabel(sr_label, fontsize=fontsize)
+        ax_fr.set_ylabel(fr_label, fontsize=fontsize)
+
+        # Only put horizontal axis labels on last row of plots
+        if constraint_index == n_constraints - 1:
+            ax_performance.set_xlabel(hoz_axis_label, fontsize=fontsize)
+            ax_sr.set_xlabel(hoz_axis_label, fontsize=fontsize)
+            ax_fr.set_xlabel(hoz_axis_label, fontsize=fontsize)
+
+        # axis scaling
+        ax_performance.set_xscale("log")
+        if performance_yscale.lower() == "log":
+            ax_performance.set_yscale("log")
+        ax_sr.set_xscale("log")
+        ax_fr.set_xscale("log")
+
+        locmaj = matplotlib.ticker.LogLocator(base=10, numticks=12)
+        locmin = matplotlib.ticker.LogLocator(
+            base=10.0,
+            subs=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9),
+            numticks=12,
+        )
+        for ax in [ax_performance, ax_sr, ax_fr]:
+            ax.minorticks_on()
+            ax.xaxis.set_major_locator(locmaj)
+            ax.xaxis.set_minor_locator(locmin)
+            ax.xaxis.set_minor_formatter(matplotlib.ticker.NullFormatter())
+
+        ########################
+        ### PERFORMANCE PLOT ###
+        ########################
+
+        # Seldonian performance
+        for seldonian_i, seldonian_model in enumerate(seldonian_models):
+            this_summary = summary_dict[(seldonian_model, constraint_num)]
+            seldonian_color = plot_colormap(seldonian_i)
+            # Only show if 2 or more passed. Otherwise std is not defined.
+            gt1_mask = this_summary["performance_count"].to_numpy() > 1
+            this_summary_masked = this_summary[gt1_mask]
+            X_passed_seldonian_masked = (
+                this_summary_masked["data_frac"].to_numpy() * tot_data_size
+            )
+            mean_performance_masked = this_summary_masked[
+                "performance_mean"
+            ].to_numpy()
+            low_performance_masked = this_summary_masked[
+                "performance_low"
+            ].to_numpy()
+            high_performance_masked = this_summary_masked[
+                "performance_high"
+            ].to_numpy()
+            (pl,) = ax_performance.plot(
+                X_passed_seldonian_masked,
+                mean_performance_masked,
+                color=seldonian_color,
+                # linestyle="--",
+                linestyle="-",
+            )
+            if constraint_index == 0:
+                legend_handles.append(pl)
+                if seldonian_model in model_label_dict:
+                    legend_labels.append(model_label_dict[seldonian_model])
+                else:
+                    legend_labels.append(seldonian_model)
+
+            ax_performance.scatter(
+                X_passed_seldonian_masked,
+                mean_performance_masked,
+                color=seldonian_color,
+                s=marker_size,
+                marker="o",
+                zorder=10,
+            )
+            ax_performance.fill_between(
+                X_passed_seldonian_masked,
+                low_performance_masked,
+                high_performance_masked,
+                color=seldonian_color,
+                alpha=0.5,
+                zorder=10,
+            )
+
+        # Baseline performance
+        for baseline_i, baseline in enumerate(baselines):
+            baseline_color = plot_colormap(
+                baseline_i + len(seldonian_models)
+            )  # 0 is reserved for Seldonian model
+            this_summary = summary_dict[(baseline, constraint_num)]
+            # Only show if 2 or more passed. Otherwise std is not defined.
+            gt1_mask = this_summary["performance_count"].to_numpy() > 1
+            this_summary_masked = this_summary[gt1_mask]
+            X_valid_baseline_masked = (
+                this_summary_masked["data_frac"].to_numpy() * tot_data_size
+            )
+            baseline_mean_performance_masked = this_summary_masked[
+                "performance_mean"
+            ].to_numpy()
+            baseline_low_performance_masked = this_summary_masked[
+                "performance_low"
+            ].to_numpy()
+            baseline_high_performance_masked = this_summary_masked[
+                "performance_high"
+            ].to_numpy()
+            (pl,) = ax_performance.plot(
+                X_valid_baseline_masked,
+                baseline_mean_performance_masked,
+                color=baseline_color,
+                label=baseline,
+            )
+            if constraint_index == 0:
+                legend_handles.append(pl)
+                if baseline in model_label_dict:
+                    legend_labels.append(model_label_dict[baseline])
+                else:
+                    legend_labels.append(baseline)
+            ax_performance.scatter(
+                X_valid_baseline_masked,
+                baseline_mean_performance_masked,
+                color=baseline_color,
+                s=marker_size,
+                marker=marker_list[baseline_i],
+            )
+            ax_performance.fill_between(
+                X_valid_baseline_masked,
+                baseline_low_performance_masked,
+                baseline_high_performance_masked,
+                color=baseline_color,
+                alpha=0.5,
+            )
+
+        if performance_ylims:
+            ax_performance.set_ylim(*performance_ylims)
+        ##########################
+        ### SOLUTION RATE PLOT ###
+        ##########################
+
+        # Seldonian solution rate
+        for seldonian_i, seldonian_model in enumerate(seldonian_models):
+            this_summary = summary_dict[(seldonian_model, constraint_num)]
+            seldonian_color = plot_colormap(seldonian_i)
+            mean_sr = this_summary["solution_rate"].to_numpy()
+            low_sr = this_summary["solution_rate_low"].to_numpy()
+            high_sr = this_summary["solution_rate_high"].to_numpy()
+
+            X_all_seldonian = this_summary["data_frac"].to_numpy() * tot_data_size
+
+            ax_sr.plot(
+                X_all_seldonian,
+                mean_sr,
+                color=seldonian_color,
+                # linestyle="--",
+                linestyle="-",
+                label="QSA",
+                zorder=10,
+            )
+            ax_sr.scatter(
+                X_all_seldonian,
+                mean_sr,
+                color=seldonian_color,
+                s=marker_size,
+                marker="o",
+                zorder=10,
+            )
+            ax_sr.fill_between(
+                X_all_seldonian,
+                low_sr,
+                high_sr,
+                color=seldonian_color,
+                alpha=0.5,
+                zorder=10,
+            )
+
+        # Plot baseline solution rate
+        # (sometimes it doesn't return a solution due to not having enough training data
+        # to run model.fit() )
+        for baseline_i, baseline in enumerate(baselines):
+            this_summary = summary_dict[(baseline, constraint_num)]
+            baseline_color = plot_colormap(baseline_i + len(seldonian_models))
+            mean_sr = this_summary["solution_rate"].to_numpy()
+            low_sr = this_summary["solution_rate_low"].to_numpy()
+            high_sr = this_summary["solution_rate_high"].to_numpy()
+
+            X_all_baseline = this_summary["data_frac"].to_numpy() * tot_data_size
+
+            ax_sr.plot(
+                X_all_baseline, mean_sr, color=baseline_color, label=baseline
+            )
+            ax_sr.scatter(
+                X_all_baseline,
+                mean_sr,
+                color=baseline_color,
+                s=marker_size,
+                marker=marker_list[baseline_i],
+            )
+            ax_sr.fill_between(
+                X_all_baseline,
+                low_sr,
+                high_sr,
+                color=baseline_color,
+                alpha=0.5,
+            )
+
+        ax_sr.set_ylim(-0.05, 1.05)
+
+        ##########################
+        ### FAILURE RATE PLOT ###
+        ##########################
+
+        # Seldonian failure rate
+        for seldonian_i, seldonian_model in enumerate(seldonian_models):
+            this_summary = summary_dict[(seldonian_model, constraint_num)]
+            seldonian_color = plot_colormap(seldonian_i)
+            mean_fr = this_summary["failure_rate"].to_numpy()
+            low_fr = this_summary["failure_rate_low"].to_numpy()
+            high_fr = this_summary["failure_rate_high"].to_numpy()
+
+            X_all_seldonian = this_summary["data_frac"].to_numpy() * tot_data_size
+
+            ax_fr.plot(
+                X_all_seldonian,
+                mean_fr,
+                color=seldonian_color,
+                # linestyle="--",
+                linestyle="-",
+                label="QSA",
+                zorder=10,
+            )
+            ax_fr.fill_between(
+                X_all_seldonian,
+                low_fr,
+                high_fr,
+                color=seldonian_color,
+                alpha=0.5,
+                zorder=10,
+            )
+            ax_fr.scatter(
+                X_all_seldonian,
+                mean_fr,
+                color=seldonian_color,
+                s=marker_size,
+                marker="o",
+                zorder=10,
+            )
+
+        # Baseline failure rate
+        for baseline_i, baseline in enumerate(baselines):
+            baseline_color = plot_colormap(baseline_i + len(seldonian_models))
+            this_summary = summary_dict[(baseline, constraint_num)]
+            baseline_mean_fr = this_summary["failure_rate"].to_numpy()
+            baseline_low_fr = this_summary["failure_rate_low"].to_numpy()
+            baseline_high_fr = this_summary["failure_rate_high"].to_numpy()
+
+            X_all_baseline = this_summary["data_frac"].to_numpy() * tot_data_size
+
+            ax_fr.plot(
+                X_all_baseline,
+                baseline_mean_fr,
+                color=baseline_color,
+                label=baseline,
+            )
+            ax_fr.scatter(
+                X_all_baseline,
+                baseline_mean_fr,
+                color=baseline_color,
+                marker=marker_list[baseline_i],
+                s=marker_size,
+            )
+            ax_fr.fill_between(
+                X_all_baseline,
+                baseline_low_fr,
+                baseline_high_fr,
+                color=baseline_color,
+                alpha=0.5,
+            )
+
+        ax_fr.set_ylim(-0.05, 1.05)
+        if show_confidence_level:
+            ax_fr.axhline(
+                y=delta, color="k", linestyle="--", label=f"delta={delta}"
+            )
+    plt.tight_layout()
+
+    if include_legend:
+        if model_label_dict:
+            reordered_legend_labels = []
+            reordered_legend_handles = []
+            for name in model_label_dict:
+                display_name = model_label_dict[name]
+                if display_name in legend_labels:
+                    leg_index = legend_labels.index(display_name)
+                    leg_name = legend_labels[leg_index]
+                    leg_handle = legend_handles[leg_index]
+                    reordered_legend_labels.append(leg_name)
+                    reordered_legend_handles.append(leg_handle)
+            legend_handles = reordered_legend_handles
+            legend_labels = reordered_legend_labels
+        fig.subplots_adjust(bottom=0.25)
+        fig.legend(
+            legend_handles,
+            legend_labels,
+            bbox_to_anchor=(0.5, 0.15),
+            loc="upper center",
+            ncol=ncols_legend,
+            fontsize=legend_fontsize,
+        )
+
+    if savename:
+        plt.savefig(savename, format=save_format, bbox_inches="tight")
+        if isinstance(savename, str):
+            print(f"Saved {savename}")
+    else:
+        plt.show()
+    return fig
+
+
+def figure_input_files(results_dir, ignore_models=[]):
+    """The files a figure of results_dir is made from: the results
+    file and the run description (see save_run_info()) of each model
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param ignore_models: Model names to leave out
+    :type ignore_models: List
+
+    :rtype: List(str)
+    """
+    filenames = []
+    for model_names in find_models(results_dir, ignore_models):
+        for model_name in model_names:
+            for filename in [
+                results_filename(results_dir, model_name),
+                run_info_filename(results_dir, model_name),
+            ]:
+                if os.path.exists(filename):
+                    filenames.append(filename)
+    return sorted(filenames)
+
+
+def file_hash(filename):
+    """The sha256 hash of the contents of a file"""
+    sha = hashlib.sha256()
+    with open(filename, "rb") as infile:
+        for chunk in iter(lambda: infile.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def figure_stamp_filename(savename):
+    """The file recording the inputs a saved figure was made from"""
+    return f"{savename}.inputs.json"
+
+
+def figure_is_current(savename, input_files, plot_kwargs):
+    """Whether the figure saved at savename was made from the current
+    input files with the same plotting parameters. A file whose
+    modification time or size changed is only considered changed if
+    its contents changed too, so touching or rewriting a results file
+    with the same results does not trigger a render.
+
+    :param savename: The filename of the figure
+    :type savename: str
+    :param input_files: See figure_input_files()
+    :type input_files: List(str)
+    :param plot_kwargs: The parameters of the figure,
+        serialized with json.dumps(sort_keys=True)
+    :type plot_kwargs: str
+
+    :return: (is_current, inputs), where inputs is the stamp of the
+        current input files to save with the figure
+    """
+    stamp_filename = figure_stamp_filename(savename)
+    stamp = {}
+    if os.path.exists(savename) and os.path.exists(stamp_filename):
+        with open(stamp_filename, "r") as infile:
+            stamp = json.load(infile)
+    old_inputs = stamp.get("inputs", {})
+
+    inputs = {}
+    is_current = bool(stamp) and stamp.get("plot_kwargs") == plot_kwargs
+    is_current = is_current and sorted(old_inputs) == input_files
+    for filename in input_files:
+        stat = os.stat(filename)
+        old = old_inputs.get(filename)
+        if old and old[:2] == [stat.st_mtime_ns, stat.st_size]:
+            # Unchanged since the last render, no need to read it
+            inputs[filename] = old
+            continue
+        inputs[filename] = [stat.st_mtime_ns, stat.st_size, file_hash(filename)]
+        if not old or old[2] != inputs[filename][2]:
+            is_current = False
+    return is_current, inputs
+
+
+def render_figure(
+    results_dir,
+    savename=None,
+    ignore_models=[],
+    constraint_strs=None,
+    deltas=None,
+    tot_data_size=None,
+    interval="ste",
+    confidence=0.95,
+    force=False,
+    **plot_kwargs,
+):
+    """Make the three plots of the experiments in results_dir without
+    the spec, from the cached summary tables (see compute_summary())
+    and the run description of the experiments (see save_run_info()).
+    The figure is skipped if it was already made from the same
+    results with the same parameters, see figure_is_current().
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param savename: The filename to which the figure will be saved.
+        Defaults to plots.{save_format} in results_dir
+    :type savename: str
+    :param ignore_models: Do not plot these models
+    :type ignore_models: List
+    :param constraint_strs: The constraint strings. If None, taken
+        from the run description of the experiments.
+    :type constraint_strs: List(str)
+    :param deltas: The confidence levels of the constraints.
+        If None, taken from the run description.
+    :type deltas: List(float)
+    :param tot_data_size: The total number of datapoints in the experiment.
+        If None, taken from the run description.
+    :type tot_data_size: int
+    :param interval: The shaded intervals, see PlotGenerator.make_plots()
+    :type interval: str
+    :param confidence: The confidence level of the intervals
+    :type confidence: float
+    :param force: Render the figure even if it is up to date
+    :type force: bool
+    :param plot_kwargs: Passed on to plot_summary()
+
+    :return: (savename, status), where status is "rendered",
+        "skipped" (up to date) or "no results"
+    """
+    save_format = plot_kwargs.get("save_format", "pdf")
+    if savename is None:
+        savename = os.path.join(results_dir, f"plots.{save_format}")
+    if None in [constraint_strs, deltas, tot_data_size]:
+        run_info = find_run_info(results_dir, ignore_models)
+        if run_info is None:
+            raise ValueError(
+                f"No run description found in {results_dir}. "
+                "Pass constraint_strs, deltas and tot_data_size."
+            )
+        if constraint_strs is None:
+            constraint_strs = run_info["constraint_strs"]
+        if deltas is None:
+            deltas = run_info["deltas"]
+        if tot_data_size is None:
+            tot_data_size = run_info["tot_data_size"]
+
+    input_files = figure_input_files(results_dir, ignore_models)
+    if not input_files:
+        return savename, "no results"
+    fig_params = json.dumps(
+        dict(
+            plot_kwargs,
+            ignore_models=ignore_models,
+            constraint_strs=constraint_strs,
+            deltas=deltas,
+            tot_data_size=tot_data_size,
+            interval=interval,
+            confidence=confidence,
+        ),
+        sort_keys=True,
+        default=repr,
+    )
+    is_current, inputs = figure_is_current(savename, input_files, fig_params)
+    if is_current and not force:
+        return savename, "skipped"
+
+    summary = compute_summary(
+        results_dir,
+        len(constraint_strs),
+        ignore_models=ignore_models,
+        interval=interval,
+        confidence=confidence,
+    )
+    if len(summary) == 0:
+        return savename, "no results"
+    import matplotlib.pyplot as plt
+
+    fig = plot_summary(
+        summary,
+        constraint_strs=constraint_strs,
+        deltas=deltas,
+        tot_data_size=tot_data_size,
+        savename=savename,
+        **plot_kwargs,
+    )
+    plt.close(fig)
+    with open(figure_stamp_filename(savename), "w") as outfile:
+        json.dump({"plot_kwargs": fig_params, "inputs": inputs}, outfile)
+    return savename, "rendered"
+
+
+def use_agg_backend():
+    """Render without a display. Used by render_figures() in this
+    process or in each of its worker processes."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def render_figures(figures, n_workers=1, force=False, **plot_kwargs):
+    """Make the three plots for many results directories,
+    in parallel on the Agg backend. Figures whose results and
+    parameters have not changed since they were last made are
+    skipped, see render_figure().
+
+    :param figures: The figures to make. Each is either a results_dir
+        or a dictionary with a "results_dir" key and any arguments of
+        render_figure() for that figure only, e.g. its savename.
+    :type figures: List(str or dict)
+    :param n_workers: The number of processes to render with.
+        With 1, the figures are rendered in this process,
+        whose matplotlib backend is then switched to Agg.
+    :type n_workers: int
+    :param force: Render every figure even if it is up to date
+    :type force: bool
+    :param plot_kwargs: Arguments of render_figure()
+        shared by all figures
+
+    :return: List of (savename, status), one per figure,
+        see render_figure()
+    """
+    jobs = []
+    for figure in figures:
+        if isinstance(figure, str):
+            figure = {"results_dir": figure}
+        jobs.append(dict(plot_kwargs, force=force, **figure))
+
+    if n_workers == 1:
+        use_agg_backend()
+        return [render_figure(**job) for job in jobs]
+
+    statuses = [None] * len(jobs)
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=get_mp_context(),
+        initializer=use_agg_backend,
+    ) as ex:
+        futures = {ex.submit(render_figure, **job): ii for ii, job in enumerate(jobs)}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            statuses[futures[future]] = future.result()
+    return statuses
+
+
 class PlotGenerator:
     def __init__(
         self,
@@ -99,6 +765,50 @@ class PlotGenerator:
         )
         self.batch_epoch_dict = batch_epoch_dict
 
+    def compute_summary(
+        self,
+        ignore_models=[],
+        use_cache=True,
+        interval="ste",
+        confidence=0.95,
+        n_resamples=1000,
+    ):
+        """Summarize the results of every experiment run in
+        self.results_dir: the mean, std, standard error, count and
+        interval of the performance, solution rate and failure rate
+        per constraint per data_frac. This is all that make_plots() needs.
+        The summary of each model is cached next to its results file
+        and only recomputed when the results change.
+
+        :param ignore_models: Do not summarize any models whose .model_name attribute appears in this list.
+        :type ignore_models: List
+        :param use_cache: Whether to read and write the cached summaries
+        :type use_cache: bool
+        :param interval: The intervals to compute: "ste" (mean +/- one
+            standard error), "wilson", "clopper_pearson" or "bootstrap".
+            See experiments.results.summarize_results()
+        :type interval: str
+        :param confidence: The confidence level of the intervals
+            (not used for "ste")
+        :type confidence: float
+        :param n_resamples: The number of bootstrap resamples
+        :type n_resamples: int
+
+        :return: A tidy table with one row per model per constraint per data_frac.
+            See experiments.results.summarize_results() for the columns
+        :rtype: pandas.DataFrame
+        """
+        n_constraints = len(self.spec.parse_trees)
+        return compute_summary(
+            self.results_dir,
+            n_constraints,
+            ignore_models=ignore_models,
+            use_cache=use_cache,
+            interval=interval,
+            confidence=confidence,
+            n_resamples=n_resamples,
+        )
+
     def make_plots(
         self,
         tot_data_size=None,
@@ -120,6 +830,8 @@ class PlotGenerator:
         show_title=True,
         custom_title=None,
         include_legend=True,
+        interval="ste",
+        confidence=0.95,
         savename=None,
     ):
         """Make the three plots of the experiment. Looks up any
@@ -176,11 +888,19 @@ class PlotGenerator:
         :type custom_title: str, defaults to None
         :param include_legend: Whether to include the legend
         :type include_legend: bool, defaults to True
+        :param interval: The shaded intervals around the means: "ste"
+            (+/- one standard error), "wilson" or "clopper_pearson"
+            (for the solution and failure rates) or "bootstrap".
+            See compute_summary()
+        :type interval: str, defaults to "ste"
+        :param confidence: The confidence level of the intervals
+        :type confidence: float, defaults to 0.95
         :param savename: If not None, the filename to which the figure
                 will be saved on disk.
         :type savename: str, defaults to None
+
+        :return: The figure, see plot_summary()
         """
-        plt.style.use("bmh")
         regime = self.regime
 
         if tot_data_size is None:
@@ -190,505 +910,43 @@ class PlotGenerator:
                 tot_data_size = self.hyperparameter_and_setting_dict["num_episodes"]
         # Read in constraints
         parse_trees = self.spec.parse_trees
-        n_constraints = len(parse_trees)
         constraint_strs = [pt.constraint_str for pt in parse_trees]
         deltas = [pt.delta for pt in parse_trees]
 
         # Figure out what experiments we have from subfolders in results_dir
-        subfolders = [
-            os.path.basename(f) for f in os.scandir(self.results_dir) if f.is_dir()
-        ]
-        all_models = [
-            x.split("_results")[0] for x in subfolders if x.endswith("_results")
-        ]
-        if ignore_models != []:
-            all_models = [x for x in all_models if x not in ignore_models]
-        seldonian_models = list(set(all_models).intersection(seldonian_model_set))
-        baselines = sorted(list(set(all_models).difference(seldonian_model_set)))
+        seldonian_models, baselines = find_models(self.results_dir, ignore_models)
         if not (seldonian_models or baselines):
             print("No results for Seldonian models or baselines found ")
             return
 
-        ## BASELINE RESULTS SETUP
-        baseline_dict = {}
-        for baseline in baselines:
-            baseline_dict[baseline] = {}
-            savename_baseline = os.path.join(
-                self.results_dir, f"{baseline}_results", f"{baseline}_results.csv"
-            )
-            df_baseline = pd.read_csv(savename_baseline)
-            df_baseline["solution_returned"] = df_baseline["performance"].apply(
-                lambda x: ~np.isnan(x)
-            )
-            df_baseline["gvec"] = df_baseline["gvec"].apply(
-                lambda t: np.fromstring(t[1:-1], sep=" ")
-            )
-            new_colnames = [
-                "g" + str(ii) + "_failed" for ii in range(1, n_constraints + 1)
-            ]
-            for ii in range(len(new_colnames)):
-                colname = new_colnames[ii]
-                df_baseline[colname] = df_baseline["gvec"].str[ii].apply(has_failed)
-            df_baseline = df_baseline.drop("gvec", axis=1)
-
-            valid_mask = ~np.isnan(df_baseline["performance"])
-            df_baseline_valid = df_baseline[valid_mask]
-            # Get the list of all data_fracs
-            X_all = df_baseline.groupby("data_frac").mean().index * tot_data_size
-            # Get the list of data_fracs for which there is at least one trial that has non-nan performance
-            X_valid = (
-                df_baseline_valid.groupby("data_frac").mean().index * tot_data_size
-            )
-
-            baseline_dict[baseline]["df_baseline"] = df_baseline.copy()
-            baseline_dict[baseline]["df_baseline_valid"] = df_baseline_valid.copy()
-            baseline_dict[baseline]["X_all"] = X_all
-            baseline_dict[baseline]["X_valid"] = X_valid
-
-        # SELDONIAN RESULTS SETUP
-        seldonian_dict = {}
-        for seldonian_model in seldonian_models:
-            seldonian_dict[seldonian_model] = {}
-            savename_seldonian = os.path.join(
-                self.results_dir,
-                f"{seldonian_model}_results",
-                f"{seldonian_model}_results.csv",
-            )
-
-            df_seldonian = pd.read_csv(savename_seldonian)
-            df_seldonian["gvec"] = df_seldonian["gvec"].apply(
-                lambda t: np.fromstring(t[1:-1], sep=" ")
-            )
-            new_colnames = [
-                "g" + str(ii) + "_failed" for ii in range(1, n_constraints + 1)
-            ]
-            for ii in range(len(new_colnames)):
-                colname = new_colnames[ii]
-                df_seldonian[colname] = df_seldonian["gvec"].str[ii].apply(has_failed)
-            df_seldonian = df_seldonian.drop("gvec", axis=1)
-
-            passed_mask = df_seldonian["passed_safety"] == True
-            df_seldonian_passed = df_seldonian[passed_mask]
-            # Get the list of all data_fracs
-            X_all = df_seldonian.groupby("data_frac").mean().index * tot_data_size
-            # Get the list of data_fracs for which there is at least one trial that passed the safety test
-            X_passed = (
-                df_seldonian_passed.groupby("data_frac").mean().index * tot_data_size
-            )
-            seldonian_dict[seldonian_model]["df_seldonian"] = df_seldonian.copy()
-            seldonian_dict[seldonian_model][
-                "df_seldonian_passed"
-            ] = df_seldonian_passed.copy()
-            seldonian_dict[seldonian_model]["X_all"] = X_all
-            seldonian_dict[seldonian_model]["X_passed"] = X_passed
-
-        ## PLOTTING SETUP
-        vert_size = 3 + n_constraints
-        if include_legend:
-            vert_size += 0.5
-            figsize = (14, vert_size)
-        else:
-            figsize = (14, vert_size)
-        fig = plt.figure(figsize=figsize)
-        plot_index = 1
-        n_rows = len(constraint_strs)
-        n_cols = 3
-        legend_handles = []
-        legend_labels = []
-
-        # One row per constraint
-        for constraint_index, constraint_str in enumerate(constraint_strs):
-            constraint_num = constraint_index + 1
-            delta = deltas[constraint_index]
-
-            # SETUP FOR PLOTTING
-            ax_performance = fig.add_subplot(n_rows, n_cols, plot_index)
-            plot_index += 1
-            ax_sr = fig.add_subplot(n_rows, n_cols, plot_index, sharex=ax_performance)
-            plot_index += 1
-            ax_fr = fig.add_subplot(n_rows, n_cols, plot_index, sharex=ax_performance)
-            plot_index += 1
-
-            # Plot title (put above middle plot)
-            if show_title:
-                if custom_title:
-                    title = custom_title
-                else:
-                    title = f"constraint: \ng={constraint_str}"
-                ax_sr.set_title(title, y=1.05, fontsize=title_fontsize)
-
-            # Plot labels
-            ax_performance.set_ylabel(performance_label, fontsize=fontsize)
-            ax_sr.set_ylabel(sr_label, fontsize=fontsize)
-            ax_fr.set_ylabel(fr_label, fontsize=fontsize)
-
-            # Only put horizontal axis labels on last row of plots
-            if constraint_index == n_constraints - 1:
-                ax_performance.set_xlabel(hoz_axis_label, fontsize=fontsize)
-                ax_sr.set_xlabel(hoz_axis_label, fontsize=fontsize)
-                ax_fr.set_xlabel(hoz_axis_label, fontsize=fontsize)
-
-            # axis scaling
-            ax_performance.set_xscale("log")
-            if performance_yscale.lower() == "log":
-                ax_performance.set_yscale("log")
-            ax_sr.set_xscale("log")
-            ax_fr.set_xscale("log")
-
-            locmaj = matplotlib.ticker.LogLocator(base=10, numticks=12)
-            locmin = matplotlib.ticker.LogLocator(
-                base=10.0,
-                subs=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9),
-                numticks=12,
-            )
-            for ax in [ax_performance, ax_sr, ax_fr]:
-                ax.minorticks_on()
-                ax.xaxis.set_major_locator(locmaj)
-                ax.xaxis.set_minor_locator(locmin)
-                ax.xaxis.set_minor_formatter(matplotlib.ticker.NullFormatter())
-
-            ########################
-            ### PERFORMANCE PLOT ###
-            ########################
-
-            # Seldonian performance
-            for seldonian_i, seldonian_model in enumerate(seldonian_models):
-                this_seldonian_dict = seldonian_dict[seldonian_model]
-                seldonian_color = plot_colormap(seldonian_i)
-                df_seldonian_passed = this_seldonian_dict["df_seldonian_passed"]
-                mean_performance = (
-                    df_seldonian_passed.groupby("data_frac")
-                    .mean()["performance"]
-                    .to_numpy()
-                )
-                std_performance = (
-                    df_seldonian_passed.groupby("data_frac")
-                    .std()["performance"]
-                    .to_numpy()
-                )
-
-                n_passed = (
-                    df_seldonian_passed.groupby("data_frac")
-                    .count()["performance"]
-                    .to_numpy()
-                )
-                ste_performance = std_performance / np.sqrt(n_passed)
-                # Only show if 2 or more passed. Otherwise std is not defined.
-                gt1_mask = n_passed > 1
-                mean_performance_masked = mean_performance[gt1_mask]
-                std_performance_masked = std_performance[gt1_mask]
-                ste_performance_masked = ste_performance[gt1_mask]
-
-                X_passed_seldonian = this_seldonian_dict["X_passed"].to_numpy()
-                X_passed_seldonian_masked = X_passed_seldonian[gt1_mask]
-                (pl,) = ax_performance.plot(
-                    X_passed_seldonian_masked,
-                    mean_performance_masked,
-                    color=seldonian_color,
-                    # linestyle="--",
-                    linestyle="-",
-                )
-                if constraint_index == 0:
-                    legend_handles.append(pl)
-                    if seldonian_model in model_label_dict:
-                        legend_labels.append(model_label_dict[seldonian_model])
-                    else:
-                        legend_labels.append(seldonian_model)
-
-                ax_performance.scatter(
-                    X_passed_seldonian_masked,
-                    mean_performance_masked,
-                    color=seldonian_color,
-                    s=marker_size,
-                    marker="o",
-                    zorder=10,
-                )
-                ax_performance.fill_between(
-                    X_passed_seldonian_masked,
-                    mean_performance_masked - ste_performance_masked,
-                    mean_performance_masked + ste_performance_masked,
-                    color=seldonian_color,
-                    alpha=0.5,
-                    zorder=10,
-                )
-
-            # Baseline performance
-            for baseline_i, baseline in enumerate(baselines):
-                baseline_color = plot_colormap(
-                    baseline_i + len(seldonian_models)
-                )  # 0 is reserved for Seldonian model
-                this_baseline_dict = baseline_dict[baseline]
-                df_baseline_valid = this_baseline_dict["df_baseline_valid"]
-                n_trials = df_baseline_valid["trial_i"].max() + 1
-
-                # Performance
-                baseline_mean_performance = df_baseline_valid.groupby(
-                    "data_frac"
-                ).mean()["performance"]
-                baseline_std_performance = df_baseline_valid.groupby("data_frac").std()[
-                    "performance"
-                ]
-                baseline_ste_performance = baseline_std_performance / np.sqrt(n_trials)
-                X_valid_baseline = this_baseline_dict["X_valid"]
-                n_valid = (
-                    df_baseline_valid.groupby("data_frac")
-                    .count()["performance"]
-                    .to_numpy()
-                )
-                # Only show if 2 or more passed. Otherwise std is not defined.
-                gt1_mask = n_valid > 1
-                baseline_mean_performance_masked = baseline_mean_performance[gt1_mask]
-                baseline_std_performance_masked = baseline_std_performance[gt1_mask]
-                baseline_ste_performance_masked = baseline_ste_performance[gt1_mask]
-                X_valid_baseline_masked = X_valid_baseline[gt1_mask]
-                (pl,) = ax_performance.plot(
-                    X_valid_baseline_masked.to_numpy(),
-                    baseline_mean_performance_masked.to_numpy(),
-                    color=baseline_color,
-                    label=baseline,
-                )
-                if constraint_index == 0:
-                    legend_handles.append(pl)
-                    if baseline in model_label_dict:
-                        legend_labels.append(model_label_dict[baseline])
-                    else:
-                        legend_labels.append(baseline)
-                ax_performance.scatter(
-                    X_valid_baseline_masked,
-                    baseline_mean_performance_masked,
-                    color=baseline_color,
-                    s=marker_size,
-                    marker=marker_list[baseline_i],
-                )
-                ax_performance.fill_between(
-                    X_valid_baseline_masked,
-                    baseline_mean_performance_masked - baseline_ste_performance_masked,
-                    baseline_mean_performance_masked + baseline_ste_performance_masked,
-                    color=baseline_color,
-                    alpha=0.5,
-                )
-
-            if performance_ylims:
-                ax_performance.set_ylim(*performance_ylims)
-            ##########################
-            ### SOLUTION RATE PLOT ###
-            ##########################
-
-            # Seldonian solution rate
-            for seldonian_i, seldonian_model in enumerate(seldonian_models):
-                this_seldonian_dict = seldonian_dict[seldonian_model]
-                seldonian_color = plot_colormap(seldonian_i)
-                df_seldonian = this_seldonian_dict["df_seldonian"]
-                n_trials = df_seldonian["trial_i"].max() + 1
-                mean_sr = (
-                    df_seldonian.groupby("data_frac").mean()["passed_safety"].to_numpy()
-                )
-                std_sr = (
-                    df_seldonian.groupby("data_frac").std()["passed_safety"].to_numpy()
-                )
-                ste_sr = std_sr / np.sqrt(n_trials)
-
-                X_all_seldonian = this_seldonian_dict["X_all"].to_numpy()
-
-                ax_sr.plot(
-                    X_all_seldonian,
-                    mean_sr,
-                    color=seldonian_color,
-                    # linestyle="--",
-                    linestyle="-",
-                    label="QSA",
-                    zorder=10,
-                )
-                ax_sr.scatter(
-                    X_all_seldonian,
-                    mean_sr,
-                    color=seldonian_color,
-                    s=marker_size,
-                    marker="o",
-                    zorder=10,
-                )
-                ax_sr.fill_between(
-                    X_all_seldonian,
-                    mean_sr - ste_sr,
-                    mean_sr + ste_sr,
-                    color=seldonian_color,
-                    alpha=0.5,
-                    zorder=10,
-                )
-
-            # Plot baseline solution rate
-            # (sometimes it doesn't return a solution due to not having enough training data
-            # to run model.fit() )
-            for baseline_i, baseline in enumerate(baselines):
-                this_baseline_dict = baseline_dict[baseline]
-                baseline_color = plot_colormap(baseline_i + len(seldonian_models))
-                df_baseline = this_baseline_dict["df_baseline"]
-                n_trials = df_baseline["trial_i"].max() + 1
-                mean_sr = (
-                    df_baseline.groupby("data_frac")
-                    .mean()["solution_returned"]
-                    .to_numpy()
-                )
-                std_sr = (
-                    df_baseline.groupby("data_frac")
-                    .std()["solution_returned"]
-                    .to_numpy()
-                )
-                ste_sr = std_sr / np.sqrt(n_trials)
-
-                X_all_baseline = this_baseline_dict["X_all"].to_numpy()
-
-                ax_sr.plot(
-                    X_all_baseline, mean_sr, color=baseline_color, label=baseline
-                )
-                ax_sr.scatter(
-                    X_all_baseline,
-                    mean_sr,
-                    color=baseline_color,
-                    s=marker_size,
-                    marker=marker_list[baseline_i],
-                )
-                ax_sr.fill_between(
-                    X_all_baseline,
-                    mean_sr - ste_sr,
-                    mean_sr + ste_sr,
-                    color=baseline_color,
-                    alpha=0.5,
-                )
-
-            ax_sr.set_ylim(-0.05, 1.05)
-
-            ##########################
-            ### FAILURE RATE PLOT ###
-            ##########################
-
-            # Seldonian failure rate
-            for seldonian_i, seldonian_model in enumerate(seldonian_models):
-                this_seldonian_dict = seldonian_dict[seldonian_model]
-                seldonian_color = plot_colormap(seldonian_i)
-                df_seldonian = this_seldonian_dict["df_seldonian"]
-                n_trials = df_seldonian["trial_i"].max() + 1
-
-                gstr_failed = "g" + str(constraint_num) + "_failed"
-
-                mean_fr = (
-                    df_seldonian.groupby("data_frac").mean()[gstr_failed].to_numpy()
-                )
-                # Need to groupby data frac
-                std_fr = df_seldonian.groupby("data_frac").std()[gstr_failed].to_numpy()
-
-                ste_fr = std_fr / np.sqrt(n_trials)
-
-                X_all_seldonian = this_seldonian_dict["X_all"].to_numpy()
-
-                ax_fr.plot(
-                    X_all_seldonian,
-                    mean_fr,
-                    color=seldonian_color,
-                    # linestyle="--",
-                    linestyle="-",
-                    label="QSA",
-                    zorder=10,
-                )
-                ax_fr.fill_between(
-                    X_all_seldonian,
-                    mean_fr - ste_fr,
-                    mean_fr + ste_fr,
-                    color=seldonian_color,
-                    alpha=0.5,
-                    zorder=10,
-                )
-                ax_fr.scatter(
-                    X_all_seldonian,
-                    mean_fr,
-                    color=seldonian_color,
-                    s=marker_size,
-                    marker="o",
-                    zorder=10,
-                )
-
-            # Baseline failure rate
-            for baseline_i, baseline in enumerate(baselines):
-                baseline_color = plot_colormap(baseline_i + len(seldonian_models))
-                # Baseline performance
-                this_baseline_dict = baseline_dict[baseline]
-                df_baseline = this_baseline_dict["df_baseline"]
-                n_trials = df_baseline["trial_i"].max() + 1
-
-                # baseline_mean_fr = df_baseline_valid.groupby("data_frac").mean()[
-                #     "failed"
-                # ].to_numpy()
-                # baseline_std_fr = df_baseline_valid.groupby("data_frac").std()["failed"].to_numpy()
-                gstr_failed = "g" + str(constraint_num) + "_failed"
-
-                baseline_mean_fr = (
-                    df_baseline.groupby("data_frac").mean()[gstr_failed].to_numpy()
-                )
-                # Need to groupby data frac
-                baseline_std_fr = (
-                    df_baseline.groupby("data_frac").std()[gstr_failed].to_numpy()
-                )
-                baseline_ste_fr = baseline_std_fr / np.sqrt(n_trials)
-
-                X_all_baseline = this_baseline_dict["X_all"].to_numpy()
-
-                ax_fr.plot(
-                    X_all_baseline,
-                    baseline_mean_fr,
-                    color=baseline_color,
-                    label=baseline,
-                )
-                ax_fr.scatter(
-                    X_all_baseline,
-                    baseline_mean_fr,
-                    color=baseline_color,
-                    marker=marker_list[baseline_i],
-                    s=marker_size,
-                )
-                ax_fr.fill_between(
-                    X_all_baseline,
-                    baseline_mean_fr - baseline_ste_fr,
-                    baseline_mean_fr + baseline_ste_fr,
-                    color=baseline_color,
-                    alpha=0.5,
-                )
-
-            ax_fr.set_ylim(-0.05, 1.05)
-            if show_confidence_level:
-                ax_fr.axhline(
-                    y=delta, color="k", linestyle="--", label=f"delta={delta}"
-                )
-        plt.tight_layout()
-
-        if include_legend:
-            if model_label_dict:
-                reordered_legend_labels = []
-                reordered_legend_handles = []
-                for name in model_label_dict:
-                    display_name = model_label_dict[name]
-                    if display_name in legend_labels:
-                        leg_index = legend_labels.index(display_name)
-                        leg_name = legend_labels[leg_index]
-                        leg_handle = legend_handles[leg_index]
-                        reordered_legend_labels.append(leg_name)
-                        reordered_legend_handles.append(leg_handle)
-                legend_handles = reordered_legend_handles
-                legend_labels = reordered_legend_labels
-            fig.subplots_adjust(bottom=0.25)
-            fig.legend(
-                legend_handles,
-                legend_labels,
-                bbox_to_anchor=(0.5, 0.15),
-                loc="upper center",
-                ncol=ncols_legend,
-                fontsize=legend_fontsize,
-            )
-
-        if savename:
-            plt.savefig(savename, format=save_format, bbox_inches="tight")
-            print(f"Saved {savename}")
-        else:
-            plt.show()
+        # Everything plotted comes from the (cached) summary tables
+        summary = self.compute_summary(
+            ignore_models=ignore_models, interval=interval, confidence=confidence
+        )
+        return plot_summary(
+            summary,
+            constraint_strs=constraint_strs,
+            deltas=deltas,
+            tot_data_size=tot_data_size,
+            model_label_dict=model_label_dict,
+            fontsize=fontsize,
+            title_fontsize=title_fontsize,
+            legend_fontsize=legend_fontsize,
+            ncols_legend=ncols_legend,
+            performance_label=performance_label,
+            sr_label=sr_label,
+            fr_label=fr_label,
+            performance_yscale=performance_yscale,
+            performance_ylims=performance_ylims,
+            hoz_axis_label=hoz_axis_label,
+            show_confidence_level=show_confidence_level,
+            marker_size=marker_size,
+            save_format=save_format,
+            show_title=show_title,
+            custom_title=custom_title,
+            include_legend=include_legend,
+            savename=savename,
+        )
 
     def validate_constraint_eval_kwargs(self, constraint_eval_kwargs):
         """Ensure that if additional datasets are contained within the spec
@@ -750,6 +1008,12 @@ class PlotGenerator:
                         "is not a seldonian.DataSet object."
                     )
 
+        # Combine held out candidate and safety datasets once here,
+        # in the parent process, rather than in every trial
+        constraint_eval_kwargs = dict(constraint_eval_kwargs)
+        constraint_eval_kwargs["additional_datasets"] = combine_held_out_addl_datasets(
+            addl_datasets_held_out
+        )
         return constraint_eval_kwargs
 
 
@@ -809,7 +1073,11 @@ class SupervisedPlotGenerator(PlotGenerator):
                 defaults to []
 
         :param perf_eval_kwargs: Extra keyword arguments to pass to
-                perf_eval_fn
+                perf_eval_fn. If it contains "streaming_eval": True,
+                performance is accumulated batch by batch
+                (of size "eval_batch_size") with
+                experiment_utils.streaming_perf_eval(), and "X" and "y"
+                may be paths to .npy files, which are memory-mapped.
         :type perf_eval_kwargs: dict
 
         :param constraint_eval_kwargs: Extra keyword arguments to pass to
@@ -849,7 +1117,9 @@ class SupervisedPlotGenerator(PlotGenerator):
         """Generate resampled datasets to use in each trial. Resamples (with replacement)
         features, labels and sensitive attributes to create n_trials versions of these
         of the same shape as the inputs. Saves them as Seldonian DataSet objects 
-        in self.results_dir/resampled_datasets
+        in self.results_dir/resampled_datasets. Out-of-core datasets
+        (see experiment_utils.load_memmap_supervised_dataset()) are resampled
+        by saving only the resampled row indices.
         """
         if verbose:
             print("Checking for resampled datasets")
@@ -877,15 +1147,26 @@ class SupervisedPlotGenerator(PlotGenerator):
         for trial_i in range(self.n_trials):
             for key in orig_datasets:
                 if key == "dataset":
-                    savename = os.path.join(save_dir, f"trial_{trial_i}.pkl")
+                    basename = f"trial_{trial_i}"
                 else:
-                    savename = os.path.join(save_dir, f"trial_{trial_i}_{key}.pkl")
+                    basename = f"trial_{trial_i}_{key}"
+                savename = os.path.join(save_dir, f"{basename}.pkl")
+                savename_indices = os.path.join(save_dir, f"{basename}_indices.npy")
                 dataset = orig_datasets[key]
                 num_datapoints = dataset.num_datapoints
-                if not os.path.exists(savename):
-                    ix_resamp = np.random.choice(
-                        range(num_datapoints), num_datapoints, replace=True
-                    )
+                if os.path.exists(savename) or os.path.exists(savename_indices):
+                    continue
+
+                ix_resamp = np.random.choice(
+                    range(num_datapoints), num_datapoints, replace=True
+                )
+                if is_out_of_core(dataset):
+                    # Only save the indices. The rows are gathered
+                    # from disk when each trial needs them.
+                    np.save(savename_indices, ix_resamp)
+                    if verbose:
+                        print(f"Saved {savename_indices}")
+                else:
                     # features can be list of arrays or a single array
                     if type(dataset.features) == list:
                         resamp_features = [x[ix_resamp] for x in dataset.features]
@@ -1185,6 +1466,65 @@ class SupervisedPlotGenerator(PlotGenerator):
         fl_exp.run_experiment(**run_fairlearn_kwargs)
         return
 
+    def run_fairlearn_sweep(
+        self,
+        fairlearn_sensitive_feature_names,
+        fairlearn_constraint_name,
+        fairlearn_epsilons_constraint,
+        fairlearn_epsilon_eval,
+        fairlearn_eval_kwargs={},
+        verbose=False,
+    ):
+        """Run supervised experiments using the fairlearn
+        library for several values of epsilon. Equivalent to calling
+        run_fairlearn_experiment() once per value of epsilon, but
+        the data for each trial are loaded only once.
+
+        :param fairlearn_sensitive_feature_names: Names of columns that
+            are used as sensitive features in fairlearn model
+        :param fairlearn_constraint_name:
+            The name of the constraint in fairlearn's context
+        :param fairlearn_epsilons_constraint:
+            The thresholds of the constraint for training fairlearn's mitigators
+        :type fairlearn_epsilons_constraint: List(float)
+        :param fairlearn_epsilon_eval:
+            The threshold for evaluating fairlearn's mitigator
+        :param fairlearn_eval_kwargs:
+            Extra keyword arguments to pass to function evaluating fairlearn's mitigator
+            on the held out dataset.
+        :param verbose: Whether to display results to stdout
+                while the fairlearn algorithms are running in each trial
+        :type verbose: bool, defaults to False
+        """
+        self.generate_trial_datasets(verbose=verbose)
+
+        run_fairlearn_kwargs = dict(
+            spec=self.spec,
+            regime=self.regime,
+            data_fracs=self.data_fracs,
+            n_trials=self.n_trials,
+            n_workers=self.n_workers,
+            datagen_method=self.datagen_method,
+            fairlearn_sensitive_feature_names=fairlearn_sensitive_feature_names,
+            fairlearn_constraint_name=fairlearn_constraint_name,
+            fairlearn_epsilon_eval=fairlearn_epsilon_eval,
+            fairlearn_eval_kwargs=fairlearn_eval_kwargs,
+            perf_eval_fn=self.perf_eval_fn,
+            perf_eval_kwargs=self.perf_eval_kwargs,
+            constraint_eval_fns=self.constraint_eval_fns,
+            constraint_eval_kwargs=self.constraint_eval_kwargs,
+            verbose=verbose,
+        )
+
+        ## Run experiment
+        fl_sweep_exp = FairlearnSweepExperiment(
+            results_dir=self.results_dir,
+            fairlearn_epsilons_constraint=fairlearn_epsilons_constraint,
+        )
+
+        fl_sweep_exp.run_experiment(**run_fairlearn_kwargs)
+        return
+
 
 class CustomPlotGenerator(PlotGenerator):
     def __init__(
@@ -1281,7 +1621,9 @@ class CustomPlotGenerator(PlotGenerator):
     def generate_resampled_datasets(self, verbose=False):
         """Generate resampled datasets to use in each trial. Resamples (with replacement)
         features, labels and sensitive attributes to create n_trials versions of these
-        of the same shape as the inputs. Saves them in self.results_dir/resampled_datasets
+        of the same shape as the inputs. Saves the resampled indices
+        in self.results_dir/resampled_datasets, rather than copies of the data.
+        Resampled datasets pickled in full by older versions are used as is.
         """
 
         if verbose:
@@ -1309,32 +1651,25 @@ class CustomPlotGenerator(PlotGenerator):
 
         for trial_i in range(self.n_trials):
             for key in orig_datasets:
+                # Only the indices are saved. Trials view the samples
+                # of the original dataset through them (see IndexedCustomDataSet)
                 if key == "dataset":
-                    savename = os.path.join(save_dir, f"trial_{trial_i}.pkl")
+                    basename = f"trial_{trial_i}"
                 else:
-                    savename = os.path.join(save_dir, f"trial_{trial_i}_{key}.pkl")
+                    basename = f"trial_{trial_i}_{key}"
+                savename = os.path.join(save_dir, f"{basename}_indices.npy")
+                # Datasets pickled in full by older versions are
+                # kept, so that reruns use the same resampled data
+                savename_legacy = os.path.join(save_dir, f"{basename}.pkl")
                 dataset = orig_datasets[key]
                 num_datapoints = dataset.num_datapoints
-                if not os.path.exists(savename):
-                    # Data are a list of objects (could be list, array, etc.)
+                if not (os.path.exists(savename) or os.path.exists(savename_legacy)):
                     ix_resamp = np.random.choice(
                         range(num_datapoints), num_datapoints, replace=True
                     )
-                    resamp_data = [dataset.data[ii] for ii in ix_resamp]
-                    # Sensitive attributes must be arrays (or [])
-                    if isinstance(dataset.sensitive_attrs, np.ndarray):
-                        resamp_sensitive_attrs = dataset.sensitive_attrs[ix_resamp]
-                    else:
-                        resamp_sensitive_attrs = []
-
-                    resampled_dataset = CustomDataSet(
-                        data=resamp_data,
-                        sensitive_attrs=resamp_sensitive_attrs,
-                        num_datapoints=num_datapoints,
-                        meta=dataset.meta,
-                    )
-
-                    save_pickle(savename, resampled_dataset, verbose=verbose)
+                    np.save(savename, ix_resamp)
+                    if verbose:
+                        print(f"Saved {savename}")
 
             if have_addl_datasets:
                 savename_addl = os.path.join(
@@ -1370,29 +1705,11 @@ class CustomPlotGenerator(PlotGenerator):
                                     num_datapoints_addl,
                                     replace=True,
                                 )
-
-                                # Data are a list of objects (could be list, array, etc.)
-                                resamp_data_addl = [
-                                    addl_dataset.data[ii] for ii in ix_resamp
-                                ]
-
-                                # Sensitive attributes must be arrays (or [])
-                                if isinstance(addl_dataset.sensitive_attrs, np.ndarray):
-                                    resamp_sensitive_attrs_addl = (
-                                        addl_dataset.sensitive_attrs[ix_resamp_addl]
-                                    )
-                                else:
-                                    resamp_sensitive_attrs_addl = []
-
-                                resampled_dataset = CustomDataSet(
-                                    data=resamp_data_addl,
-                                    sensitive_attrs=resamp_sensitive_attrs_addl,
-                                    num_datapoints=num_datapoints_addl,
-                                    meta=addl_dataset.meta,
-                                )
+                                # Saved in place of the resampled dataset
+                                # (see load_indexed_addl_datasets())
                                 resampled_addl_datasets[constraint_str][bn][
                                     key
-                                ] = resampled_dataset
+                                ] = ix_resamp_addl
 
                     save_pickle(savename_addl, resampled_addl_datasets, verbose=verbose)
 
@@ -1525,13 +1842,17 @@ class RLPlotGenerator(PlotGenerator):
         self.regime = "reinforcement_learning"
         self.hyperparameter_and_setting_dict = hyperparameter_and_setting_dict
 
-    def run_seldonian_experiment(self, verbose=False):
+    def run_seldonian_experiment(self, verbose=False, save_importance_weights=False):
         """Run an RL Seldonian experiment using the spec attribute
         assigned to the class in __init__().
 
         :param verbose: Whether to display results to stdout
                 while the Seldonian algorithms are running in each trial
         :type verbose: bool, defaults to False
+        :param save_importance_weights: Whether to save the importance
+                weights of each trial's solution on the candidate and
+                safety data, for plot_importance_weights()
+        :type save_importance_weights: bool, defaults to False
         """
         from seldonian.RL.RL_runner import run_trial
 
@@ -1559,6 +1880,7 @@ class RLPlotGenerator(PlotGenerator):
             perf_eval_fn=self.perf_eval_fn,
             perf_eval_kwargs=self.perf_eval_kwargs,
             batch_epoch_dict=self.batch_epoch_dict,
+            save_importance_weights=save_importance_weights,
             verbose=verbose,
         )
 
@@ -1657,6 +1979,9 @@ class RLPlotGenerator(PlotGenerator):
                 will be saved on disk.
         :type savename: str, defaults to None
         """
+        import matplotlib
+        import matplotlib.pyplot as plt
+
         plt.style.use("bmh")
         regime = self.regime
         if regime != "reinforcement_learning":
@@ -1666,12 +1991,15 @@ class RLPlotGenerator(PlotGenerator):
 
         tot_data_size = self.hyperparameter_and_setting_dict["num_episodes"]
 
-        # Figure out what experiments we have from subfolders in results_dir
-        is_parent_dir = os.path.join(
-            self.results_dir, "qsa_results", "importance_weights"
-        )
-        cs_weights_dir = os.path.join(is_parent_dir, "candidate_selection")
-        st_weights_dir = os.path.join(is_parent_dir, "safety_test")
+        store = ImportanceWeightStore(self.results_dir, "qsa")
+        if len(store.index) == 0:
+            # Weights saved as one pickle file per trial
+            store.import_trial_pickles(data_fracs, n_trials)
+        index = store.index
+        index = index[
+            np.isin(index["data_frac"].astype(float).round(4), np.round(data_fracs, 4))
+            & (index["trial_i"] < n_trials)
+        ]
 
         ## PLOTTING SETUP
 
@@ -1695,41 +2023,26 @@ class RLPlotGenerator(PlotGenerator):
             if branch == "cs":
                 color = "blue"
                 label = "Candidate selection"
-                weights_dir = cs_weights_dir
+                branch_name = "candidate_selection"
             else:
                 color = "red"
                 label = "Safety test"
-                weights_dir = st_weights_dir
-
-            IS_weights_dict = {
-                data_frac: [] for data_frac in data_fracs
-            }  # keys: data_fracs, values: lists of mean IS weights for all trials at that data_frac
-            for data_frac in data_fracs:
-                for trial_i in range(n_trials):
-                    filename = os.path.join(
-                        weights_dir,
-                        f"importance_weights_frac_{data_frac:.4f}_trial_{trial_i}.pkl",
-                    )
-                    importance_weights = load_pickle(filename)
-                    if importance_weights is not None:
-                        mean_IS = np.mean(importance_weights)
-                        IS_weights_dict[data_frac].append(mean_IS)
-
-            good_data_fracs = np.array(
-                [key for key in IS_weights_dict if len(IS_weights_dict[key]) > 1]
-            )
-            n_trials_good_list = np.array(
-                [len(IS_weights_dict[key]) for key in good_data_fracs]
-            )
-            mean_good_IS_weights = np.array(
-                [np.mean(IS_weights_dict[key]) for key in good_data_fracs]
-            )
-            ste_good_IS_weights = np.array(
-                [
-                    np.std(IS_weights_dict[good_data_fracs[ii]])
-                    / n_trials_good_list[ii]
-                    for ii in range(len(good_data_fracs))
-                ]
+                branch_name = "safety_test"
+
+            # Mean and standard error, std/sqrt(n), over trials of the
+            # mean importance weight (over episodes) of each trial.
+            # The std is the population std (ddof=0), like np.std().
+            # Plots made before the weights were stored in the index
+            # divided by n instead, so their error bars were narrower.
+            grouped = index[index["branch"] == branch_name].groupby("data_frac")[
+                "mean"
+            ]
+            stats = grouped.agg(["mean", "count"]).assign(std=grouped.std(ddof=0))
+            stats = stats[stats["count"] > 1]
+            good_data_fracs = stats.index.to_numpy(dtype=float)
+            mean_good_IS_weights = stats["mean"].to_numpy(dtype=float)
+            ste_good_IS_weights = stats["std"].to_numpy(dtype=float) / np.sqrt(
+                stats["count"].to_numpy(dtype=float)
             )
 
             ax.scatter(
@@ -2,11 +2,14 @@
 import copy
 import os
 import numpy as np
-from functools import partial
 
 from .experiments import Experiment
 from . import headless_utils
-from .experiment_utils import batch_predictions
+from .experiment_utils import (
+    batch_predictions,
+    copy_spec_without_data,
+    default_preload_modules,
+)
 
 from seldonian.dataset import SupervisedDataSet
 from seldonian.seldonian_algorithm import SeldonianAlgorithm
@@ -17,6 +20,12 @@ from seldonian.warnings.custom_warnings import *
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 
+# The headless models are trained with torch in every trial
+headless_preload_modules = default_preload_modules + [
+    "torch",
+    "experiments.headless_experiments",
+]
+
 
 class HeadlessSeldonianExperiment(Experiment):
     def __init__(self, model_name, results_dir):
@@ -40,39 +49,20 @@ class HeadlessSeldonianExperiment(Experiment):
 
     def run_experiment(self, **kwargs):
         """Run the Seldonian experiment"""
-        n_workers = kwargs["n_workers"]
         partial_kwargs = {
             key: kwargs[key] for key in kwargs if key not in ["data_fracs", "n_trials"]
         }
-        # Pass partial_kwargs onto self.QSA()
-        helper = partial(self.run_trial, **partial_kwargs)
-
-        data_fracs = kwargs["data_fracs"]
-        n_trials = kwargs["n_trials"]
-        data_fracs_vector = np.array([x for x in data_fracs for y in range(n_trials)])
-        trials_vector = np.array(
-            [x for y in range(len(data_fracs)) for x in range(n_trials)]
+        self.open_results_store(**kwargs)
+        # Preload torch in the forkserver process by default
+        preload_modules = kwargs.get("preload_modules")
+        if preload_modules is None:
+            preload_modules = headless_preload_modules
+        self.run_trials(
+            self.run_trial,
+            partial_kwargs,
+            **dict(kwargs, preload_modules=preload_modules),
         )
 
-        if n_workers == 1:
-            for ii in range(len(data_fracs_vector)):
-                data_frac = data_fracs_vector[ii]
-                trial_i = trials_vector[ii]
-                helper(data_frac, trial_i)
-        elif n_workers > 1:
-            with ProcessPoolExecutor(
-                max_workers=n_workers, mp_context=mp.get_context("fork")
-            ) as ex:
-                results = tqdm(
-                    ex.map(helper, data_fracs_vector, trials_vector),
-                    total=len(data_fracs_vector),
-                )
-                for exc in results:
-                    if exc:
-                        print(exc)
-        else:
-            raise ValueError(f"n_workers value of {n_workers} must be >=1 ")
-
         self.aggregate_results(**kwargs)
 
     def run_trial(self, data_frac, trial_i, **kwargs):
@@ -227,7 +217,7 @@ class HeadlessSeldonianExperiment(Experiment):
         # Make a new spec object
         # and update the dataset
 
-        spec_for_experiment = copy.deepcopy(spec)
+        spec_for_experiment = copy_spec_without_data(spec)
         spec_for_experiment.dataset = dataset_for_experiment
 
         # If optimizing using gradient descent,
@@ -359,8 +349,9 @@ class HeadlessSeldonianExperiment(Experiment):
         # Write out file for this data_frac,trial_i combo
         data = [data_frac, trial_i, performance, passed_safety, gvec]
         colnames = ["data_frac", "trial_i", "performance", "passed_safety", "gvec"]
-        self.write_trial_result(data, colnames, trial_dir, verbose=kwargs["verbose"])
-        return
+        return self.write_trial_result(
+            data, colnames, trial_dir, verbose=kwargs["verbose"]
+        )
 
     def evaluate_constraint_functions(
         self, solution, constraint_eval_fns, constraint_eval_kwargs
@@ -5,18 +5,8 @@ import pickle
 import numpy as np
 import math
 
-from seldonian.RL.RL_runner import create_agent, run_trial_given_agent_and_env
-from seldonian.utils.stats_utils import weighted_sum_gamma
-from seldonian.dataset import SupervisedDataSet
-
-import torch
-from torch.utils.data import DataLoader
-import torch.nn as nn
-from torchvision.transforms import ToTensor
-from torch import optim
-from torch.autograd import Variable
-
-from seldonian.utils.io_utils import load_pickle, save_pickle
+# torch is imported by the functions that use it, so that importing
+# this module does not import torch until a headless model is trained
 
 
 def make_data_loaders(
@@ -25,6 +15,8 @@ def make_data_loaders(
     """
     Create PyTorch data loaders for candidate and safety datasets
     """
+    import torch
+
     n_points_tot = len(features)
     n_candidate = int(round(n_points_tot * (1.0 - frac_data_in_safety)))
     n_safety = n_points_tot - n_candidate
@@ -74,6 +66,8 @@ def train_pytorch_model(
 
     :param loss_func: The PyTorch loss function
     """
+    from torch.autograd import Variable
+
     pytorch_model.train()
 
     # Train the pytorch_model
@@ -162,10 +156,10 @@ def generate_latent_features(
     frac_data_in_safety,
     candidate_batch_size,
     safety_batch_size,
-    loss_func=nn.CrossEntropyLoss(),
+    loss_func=None,
     learning_rate=0.001,
     num_epochs=5,
-    device=torch.device("cpu"),
+    device=None,
     verbose=False,
 ):
     """
@@ -189,17 +183,25 @@ def generate_latent_features(
     :param safety_batch_size: The batch sized used for passing safety data through the network.
         Used for memory-optimization purposes only.
     :type safety_batch_size: int
-    :param loss_func: The PyTorch loss function used for pretraining
+    :param loss_func: The PyTorch loss function used for pretraining,
+        defaults to torch.nn.CrossEntropyLoss()
     :param learning_rate: Learning rate used in Adam optimization during pretraining
     :type learning_rate: float
     :param num_epochs: The number of epochs of pretraining to run
     :type num_epochs: int
     :param device: The device to run the pretraining
-        and to perform the forward passes to create latent features
+        and to perform the forward passes to create latent features,
+        defaults to torch.device("cpu")
     :type device: torch.device or int
     :param verbose: Verbosity flag
     :type verbose: Bool
     """
+    import torch
+
+    if loss_func is None:
+        loss_func = torch.nn.CrossEntropyLoss()
+    if device is None:
+        device = torch.device("cpu")
 
     full_pretraining_model.to(device)
     headless_pretraining_model.to(device)
@@ -0,0 +1,364 @@
+""" Module for monitoring the progress of running experiments
+
+Run from the command line, e.g.::
+
+    python -m experiments.monitor ./results --interval 60
+    python -m experiments.monitor ./results --serve --port 8000
+
+"""
+
+import os
+import io
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from .results import find_models, load_run_info, find_run_info, compute_summary
+
+trial_file_pattern = re.compile(r"data_frac_(\d+\.\d{4})_trial_(\d+)\.csv")
+
+
+def completed_trials(results_dir, model_name):
+    """Find the trials of a model whose result files exist
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param model_name: The name of the model
+    :type model_name: str
+
+    :return: Dictionary mapping (data_frac rounded to 4 decimals, trial_i)
+        to the modification time of the trial file
+    """
+    trial_dir = os.path.join(results_dir, f"{model_name}_results", "trial_data")
+    trials = {}
+    if not os.path.isdir(trial_dir):
+        return trials
+    for entry in os.scandir(trial_dir):
+        match = trial_file_pattern.fullmatch(entry.name)
+        if match:
+            key = (match.group(1), int(match.group(2)))
+            trials[key] = entry.stat().st_mtime
+    return trials
+
+
+def model_progress(results_dir, model_name, now=None):
+    """The progress of the latest run of a model's experiment
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param model_name: The name of the model
+    :type model_name: str
+    :param now: The current time, defaults to time.time()
+
+    :return: (per_frac, overall), where per_frac is a DataFrame with the
+        completed and pending trials per data_frac and overall is a dict
+        with the totals, throughput (trials per minute), ETA (minutes)
+        and the number of workers that still have trials to run.
+        None if the run was not described (see save_run_info())
+    """
+    run_info = load_run_info(results_dir, model_name)
+    if run_info is None:
+        return None
+    if now is None:
+        now = time.time()
+    trials = completed_trials(results_dir, model_name)
+    n_trials = run_info["n_trials"]
+
+    rows = []
+    finish_times = []
+    for data_frac in run_info["data_fracs"]:
+        frac_str = f"{data_frac:.4f}"
+        mtimes = [
+            trials[(frac_str, trial_i)]
+            for trial_i in range(n_trials)
+            if (frac_str, trial_i) in trials
+        ]
+        finish_times.extend(mtimes)
+        rows.append(
+            {
+                "model": model_name,
+                "data_frac": data_frac,
+                "completed": len(mtimes),
+                "pending": n_trials - len(mtimes),
+            }
+        )
+    per_frac = pd.DataFrame(rows)
+
+    completed = int(per_frac["completed"].sum())
+    pending = int(per_frac["pending"].sum())
+    # Only count trials that completed during this run
+    elapsed = max(now - run_info["started"], 1e-9)
+    n_this_run = int(np.sum(np.array(finish_times) >= run_info["started"]))
+    trials_per_min = 60 * n_this_run / elapsed
+    if pending == 0:
+        eta_min = 0.0
+    elif trials_per_min > 0:
+        eta_min = pending / trials_per_min
+    else:
+        eta_min = np.nan
+    overall = {
+        "model": model_name,
+        "completed": completed,
+        "total": completed + pending,
+        "trials_per_min": trials_per_min,
+        "eta_min": eta_min,
+        "n_workers": run_info["n_workers"],
+        # Per-trial timings are not recorded, so this is the
+        # number of workers that can still be given a trial
+        "workers_busy": min(run_info["n_workers"], pending),
+        "elapsed_min": elapsed / 60,
+    }
+    return per_frac, overall
+
+
+def experiment_progress(results_dir, now=None):
+    """The progress of every experiment run in results_dir
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param now: The current time, defaults to time.time()
+
+    :return: (per_frac, overall) DataFrames, see model_progress()
+    """
+    seldonian_models, baselines = find_models(results_dir)
+    per_fracs = []
+    overalls = []
+    for model_name in seldonian_models + baselines:
+        progress = model_progress(results_dir, model_name, now=now)
+        if progress is None:
+            continue
+        per_fracs.append(progress[0])
+        overalls.append(progress[1])
+    if not overalls:
+        return pd.DataFrame(), pd.DataFrame()
+    return pd.concat(per_fracs, ignore_index=True), pd.DataFrame(overalls)
+
+
+def format_progress(per_frac, overall):
+    """Format the progress of the experiments as text
+
+    :param per_frac: See experiment_progress()
+    :param overall: See experiment_progress()
+
+    :rtype: str
+    """
+    if len(overall) == 0:
+        return "No running or finished experiments found"
+    lines = []
+    for _, row in overall.iterrows():
+        lines.append(
+            f"{row['model']}: {row['completed']}/{row['total']} trials, "
+            f"{row['trials_per_min']:.2f} trials/min, "
+            f"ETA {row['eta_min']:.1f} min, "
+            f"workers busy {row['workers_busy']}/{row['n_workers']}"
+        )
+        this_model = per_frac[per_frac["model"] == row["model"]]
+        for _, frac_row in this_model.iterrows():
+            lines.append(
+                f"    data_frac={frac_row['data_frac']:<8.4g} "
+                f"completed={frac_row['completed']:<5} "
+                f"pending={frac_row['pending']}"
+            )
+    return "\n".join(lines)
+
+
+def render_partial_plots(results_dir, savename, save_format="png", **plot_kwargs):
+    """Make the three plots from the results recorded so far. The
+    summary of each model is only recomputed if its results changed
+    since the last render (see compute_summary()).
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param savename: File name or file object to save the figure to
+    :param save_format: The file type for the saved figure
+    :type save_format: str, defaults to "png"
+    :param plot_kwargs: Passed on to plot_summary()
+
+    :return: True if there were results to plot
+    """
+    run_info = find_run_info(results_dir)
+    if run_info is None:
+        return False
+    summary = compute_summary(results_dir, len(run_info["constraint_strs"]))
+    if len(summary) == 0:
+        return False
+
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from .generate_plots import plot_summary
+
+    fig = plot_summary(
+        summary,
+        constraint_strs=run_info["constraint_strs"],
+        deltas=run_info["deltas"],
+        tot_data_size=run_info["tot_data_size"],
+        save_format=save_format,
+        savename=savename,
+        **plot_kwargs,
+    )
+    plt.close(fig)
+    return True
+
+
+class ProgressRequestHandler(BaseHTTPRequestHandler):
+    """Serves the progress page (/), the partial plots
+    (/plots.png) and the progress as JSON (/progress.json)
+    of the experiments in self.server.results_dir
+    """
+
+    def do_GET(self):
+        results_dir = self.server.results_dir
+        path = self.path.split("?")[0]
+        if path == "/":
+            per_frac, overall = experiment_progress(results_dir)
+            refresh = int(self.server.interval)
+            body = (
+                "<html><head>"
+                f'<meta http-equiv="refresh" content="{refresh}">'
+                f"<title>Experiment progress: {results_dir}</title></head><body>"
+                f"<pre>{format_progress(per_frac, overall)}</pre>"
+                f'<img src="/plots.png?t={time.time()}" style="max-width:100%">'
+                "</body></html>"
+            ).encode()
+            self.respond(body, "text/html")
+        elif path == "/plots.png":
+            buf = io.BytesIO()
+            # pyplot is not thread-safe, so render one request at a time
+            with self.server.render_lock:
+                rendered = render_partial_plots(results_dir, buf, save_format="png")
+            if rendered:
+                self.respond(buf.getvalue(), "image/png")
+            else:
+                self.send_error(404, "No results to plot yet")
+        elif path == "/progress.json":
+            per_frac, overall = experiment_progress(results_dir)
+            body = json.dumps(
+                {
+                    "overall": overall.to_dict(orient="records"),
+                    "per_frac": per_frac.to_dict(orient="records"),
+                }
+            ).encode()
+            self.respond(body, "application/json")
+        else:
+            self.send_error(404)
+
+    def respond(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+def make_server(results_dir, port=8000, interval=30):
+    """Create the HTTP server for the progress of the
+    experiments in results_dir, see ProgressRequestHandler.
+    Requests are handled in threads, except that the
+    plots are rendered for one request at a time.
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param port: The port to listen on, 0 for any free port
+    :type port: int
+    :param interval: Seconds between refreshes of the page
+    :type interval: float
+
+    :rtype: http.server.ThreadingHTTPServer
+    """
+    server = ThreadingHTTPServer(("localhost", port), ProgressRequestHandler)
+    server.results_dir = results_dir
+    server.interval = interval
+    server.render_lock = threading.Lock()
+    return server
+
+
+def serve(results_dir, port=8000, interval=30):
+    """Serve the progress of the experiments in results_dir
+    at http://localhost:port until interrupted
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param port: The port to listen on
+    :type port: int
+    :param interval: Seconds between refreshes of the page
+    :type interval: float
+    """
+    server = make_server(results_dir, port=port, interval=interval)
+    print(f"Serving the progress of {results_dir} at http://localhost:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def watch(results_dir, interval=30, plot_savename=None, once=False):
+    """Print the progress of the experiments in results_dir every
+    interval seconds, until all trials have completed
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param interval: Seconds between updates
+    :type interval: float
+    :param plot_savename: If not None, the partial plots are
+        saved to this file at every update
+    :type plot_savename: str
+    :param once: Print the progress once and return
+    :type once: bool
+    """
+    while True:
+        per_frac, overall = experiment_progress(results_dir)
+        print(time.strftime("%Y-%m-%d %H:%M:%S"))
+        print(format_progress(per_frac, overall))
+        print()
+        if plot_savename:
+            save_format = os.path.splitext(plot_savename)[1][1:] or "png"
+            render_partial_plots(results_dir, plot_savename, save_format=save_format)
+        done = len(overall) > 0 and (overall["completed"] == overall["total"]).all()
+        if once or done:
+            return
+        time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Monitor the progress of the experiments in a results directory"
+    )
+    parser.add_argument("results_dir")
+    parser.add_argument(
+        "--interval", type=float, default=30, help="Seconds between updates"
+    )
+    parser.add_argument(
+        "--plots", default=None, help="Save the partial plots to this file"
+    )
+    parser.add_argument("--once", action="store_true", help="Update once and exit")
+    parser.add_argument(
+        "--serve", action="store_true", help="Serve the progress over HTTP"
+    )
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+    if args.serve:
+        serve(args.results_dir, port=args.port, interval=args.interval)
+    else:
+        watch(
+            args.results_dir,
+            interval=args.interval,
+            plot_savename=args.plots,
+            once=args.once,
+        )
+
+
+if __name__ == "__main__":
+    main()
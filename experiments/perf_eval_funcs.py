@@ -1,16 +1,81 @@
 import numpy as np
-from sklearn.metrics import log_loss, accuracy_score
+
+
+def binary_logistic_loss_per_sample(y_pred, y):
+    """The logistic loss of each sample for binary classification.
+    Predicted probabilities are clipped like in sklearn's log_loss.
+
+    :param y_pred: Array of predicted probabilities of each label
+    :param y: Array of true labels, 1-dimensional
+    """
+    eps = np.finfo(float).eps
+    y_pred = np.clip(y_pred, eps, 1 - eps)
+    return -np.where(y == 1, np.log(y_pred), np.log(1 - y_pred))
+
+
+def multiclass_logistic_loss_per_sample(y_pred, y):
+    """The logistic loss of each sample for multi-class classification
+
+    :param y_pred: Array of predicted probabilities of each class label
+    :param y: Array of true class labels
+    """
+    # In the multi-class setting, y_pred is an i x k matrix
+    # where i is the number of samples and k is the number of classes
+    # Each entry is the probability of predicting the kth class
+    # for the ith sample. We need the probability of predicting
+    # the true class for each sample.
+    n = len(y)
+    probs_trueclasses = y_pred[..., np.arange(n), y.astype("int")]
+    return -np.log(probs_trueclasses)
+
+
+def probabilistic_accuracy_per_sample(y_pred, y):
+    """The probability of predicting the true label of each
+    sample for binary classification
+
+    :param y_pred: Array of predicted probabilities of each label
+    :param y: Array of true labels, 1-dimensional
+    """
+    return np.where(y != 1.0, 1.0 - y_pred, y_pred)
+
+
+def multiclass_accuracy_per_sample(y_pred, y):
+    """The probability of predicting the true class
+    label of each sample
+
+    :param y_pred: Array of predicted probabilities of each class label
+    :param y: Array of true class labels
+    """
+    n = len(y)
+    return y_pred[..., np.arange(n), y.astype("int")]
+
+
+def deterministic_accuracy_per_sample(y_pred, y):
+    """Whether each sample is predicted correctly
+
+    :param y_pred: Array of predicted labels
+    :param y: Array of true labels
+    """
+    return y == (y_pred > 0.5)
+
+
+def squared_error_per_sample(y_pred, y):
+    """The squared error of each sample
+
+    :param y_pred: Array of predicted labels
+    :param y: Array of true labels
+    """
+    return np.square(y_pred - y)
 
 
 def binary_logistic_loss(y_pred, y, **kwargs):
-    """ Wrapper for sklearn's log_loss function. 
-    Just switches the order of the arguments 
-    to comply with the toolkit convention.
+    """Calculate average logistic loss over all data points
+    for binary classification, like sklearn's log_loss
 
     :param y_pred: Array of predicted probabilities of each label
     :param y: Array of true labels, 1-dimensional
     """
-    return log_loss(y, y_pred)
+    return np.mean(binary_logistic_loss_per_sample(y_pred, y))
 
 
 def multiclass_logistic_loss(y_pred, y, **kwargs):
@@ -23,15 +88,7 @@ def multiclass_logistic_loss(y_pred, y, **kwargs):
     :return: logistic loss
     :rtype: float
     """
-    # In the multi-class setting, y_pred is an i x k matrix
-    # where i is the number of samples and k is the number of classes
-    # Each entry is the probability of predicting the kth class
-    # for the ith sample. We need to get the probability of predicting
-    # the true class for each sample and then take the sum of the
-    # logs of that.
-    n = len(y)
-    probs_trueclasses = y_pred[np.arange(n), y.astype("int")]
-    return -1 / n * sum(np.log(probs_trueclasses))
+    return np.mean(multiclass_logistic_loss_per_sample(y_pred, y))
 
 
 def probabilistic_accuracy(y_pred, y, **kwargs):
@@ -42,8 +99,7 @@ def probabilistic_accuracy(y_pred, y, **kwargs):
     :param y_pred: Array of predicted probabilities of each label
     :param y: Array of true labels, 1-dimensional
     """
-    v = np.where(y != 1.0, 1.0 - y_pred, y_pred)
-    return sum(v) / len(v)
+    return np.mean(probabilistic_accuracy_per_sample(y_pred, y))
 
 
 def multiclass_accuracy(y_pred, y, **kwargs):
@@ -55,8 +111,7 @@ def multiclass_accuracy(y_pred, y, **kwargs):
     :param y: Array of true class labels
 
     """
-    n = len(y)
-    return np.sum(y_pred[np.arange(n), y.astype("int")]) / n
+    return np.mean(multiclass_accuracy_per_sample(y_pred, y))
 
 
 def deterministic_accuracy(y_pred, y, **kwargs):
@@ -67,9 +122,7 @@ def deterministic_accuracy(y_pred, y, **kwargs):
     :param y_pred: Array of predicted labels
     :param y: Array of true labels
     """
-    from sklearn.metrics import accuracy_score
-
-    return accuracy_score(y, y_pred > 0.5)
+    return np.mean(deterministic_accuracy_per_sample(y_pred, y))
 
 
 def MSE(y_pred, y, **kwargs):
@@ -78,6 +131,157 @@ def MSE(y_pred, y, **kwargs):
     :param y_pred: Array of predicted labels
     :param y: Array of true labels
     """
-    n = len(y)
-    res = sum(pow(y_pred - y, 2)) / n
-    return res
+    return np.mean(squared_error_per_sample(y_pred, y))
+
+
+def binary_logistic_loss_batch(y_preds, y, **kwargs):
+    """Batched version of binary_logistic_loss()
+
+    :param y_preds: Predicted probabilities of the positive label,
+        shape (n_trials,N)
+    :param y: Array of true labels, 1-dimensional
+
+    :return: Array of the logistic loss of each row of y_preds
+    """
+    return np.mean(binary_logistic_loss_per_sample(y_preds, y), axis=-1)
+
+
+def multiclass_logistic_loss_batch(y_preds, y, **kwargs):
+    """Batched version of multiclass_logistic_loss()
+
+    :param y_preds: Predicted probabilities of each class label,
+        shape (n_trials,N,n_classes)
+    :param y: Array of true class labels
+
+    :return: Array of the logistic loss of each trial
+    """
+    return np.mean(multiclass_logistic_loss_per_sample(y_preds, y), axis=-1)
+
+
+def probabilistic_accuracy_batch(y_preds, y, **kwargs):
+    """Batched version of probabilistic_accuracy()
+
+    :param y_preds: Predicted probabilities of the positive label,
+        shape (n_trials,N)
+    :param y: Array of true labels, 1-dimensional
+
+    :return: Array of the accuracy of each row of y_preds
+    """
+    return np.mean(probabilistic_accuracy_per_sample(y_preds, y), axis=-1)
+
+
+def multiclass_accuracy_batch(y_preds, y, **kwargs):
+    """Batched version of multiclass_accuracy()
+
+    :param y_preds: Predicted probabilities of each class label,
+        shape (n_trials,N,n_classes)
+    :param y: Array of true class labels
+
+    :return: Array of the accuracy of each trial
+    """
+    return np.mean(multiclass_accuracy_per_sample(y_preds, y), axis=-1)
+
+
+def deterministic_accuracy_batch(y_preds, y, **kwargs):
+    """Batched version of deterministic_accuracy()
+
+    :param y_preds: Predicted labels, shape (n_trials,N)
+    :param y: Array of true labels
+
+    :return: Array of the accuracy of each row of y_preds
+    """
+    return np.mean(deterministic_accuracy_per_sample(y_preds, y), axis=-1)
+
+
+def MSE_batch(y_preds, y, **kwargs):
+    """Batched version of MSE()
+
+    :param y_preds: Predicted labels, shape (n_trials,N)
+    :param y: Array of true labels
+
+    :return: Array of the mean squared error of each row of y_preds
+    """
+    return np.mean(squared_error_per_sample(y_preds, y), axis=-1)
+
+
+class StreamingMetric:
+    def __init__(self, per_sample_fn):
+        """Accumulates a performance metric that is the mean of
+        per-sample values over batches of predictions, so that the
+        full array of predictions never has to be in memory.
+
+        :param per_sample_fn: The function giving the metric's
+            value for each sample, e.g. squared_error_per_sample()
+        """
+        self.per_sample_fn = per_sample_fn
+        self.total = 0.0
+        self.n = 0
+
+    def update(self, y_pred, y):
+        """Add a batch of predictions to the accumulator
+
+        :param y_pred: Array of predictions for this batch
+        :param y: Array of true labels for this batch
+        """
+        self.total += np.sum(self.per_sample_fn(y_pred, y))
+        self.n += len(y)
+
+    def result(self):
+        """The value of the metric over all batches seen so far"""
+        return self.total / self.n
+
+
+per_sample_metrics = {
+    binary_logistic_loss: binary_logistic_loss_per_sample,
+    multiclass_logistic_loss: multiclass_logistic_loss_per_sample,
+    probabilistic_accuracy: probabilistic_accuracy_per_sample,
+    multiclass_accuracy: multiclass_accuracy_per_sample,
+    deterministic_accuracy: deterministic_accuracy_per_sample,
+    MSE: squared_error_per_sample,
+}
+
+
+def get_streaming_metric(perf_eval_fn):
+    """Get a new streaming accumulator equivalent
+    to one of the performance evaluation functions in this module
+
+    :param perf_eval_fn: One of the functions in this module
+
+    :return: A StreamingMetric instance
+    """
+    if perf_eval_fn not in per_sample_metrics:
+        raise NotImplementedError(
+            "Streaming evaluation is not supported "
+            f"for perf_eval_fn: {perf_eval_fn.__name__}"
+        )
+    return StreamingMetric(per_sample_metrics[perf_eval_fn])
+
+
+batched_metrics = {
+    binary_logistic_loss: binary_logistic_loss_batch,
+    multiclass_logistic_loss: multiclass_logistic_loss_batch,
+    probabilistic_accuracy: probabilistic_accuracy_batch,
+    multiclass_accuracy: multiclass_accuracy_batch,
+    deterministic_accuracy: deterministic_accuracy_batch,
+    MSE: MSE_batch,
+}
+
+
+def get_batched_metric(perf_eval_fn):
+    """Get the batched version of one of the
+    performance evaluation functions in this module.
+    The batched version scores the predictions of
+    many trials on the same test set in one call.
+
+    :param perf_eval_fn: One of the functions in this module
+
+    :return: The batched function, which takes
+        y_preds of shape (n_trials,N,...) and y
+        and returns one value per trial
+    """
+    if perf_eval_fn not in batched_metrics:
+        raise NotImplementedError(
+            "Batched evaluation is not supported "
+            f"for perf_eval_fn: {perf_eval_fn.__name__}"
+        )
+    return batched_metrics[perf_eval_fn]
@@ -0,0 +1,1121 @@
+""" Module for summarizing the results of experiments. Only needs
+numpy, pandas and scipy, so that the results can be read without the
+plotting or deep learning dependencies, e.g. by dashboards::
+
+    python -m experiments.results ./results --json summary.json
+
+"""
+
+import os
+import json
+import pickle
+import argparse
+import threading
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.special import betaincinv, ndtri
+
+seldonian_model_set = set(["qsa", "headless_qsa", "sa"])
+
+
+def find_models(results_dir, ignore_models=[]):
+    """Figure out what experiments we have from
+    the subfolders in results_dir
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param ignore_models: Model names to leave out
+    :type ignore_models: List
+
+    :return: (seldonian_models, baselines), each a sorted list of model names
+    """
+    subfolders = [os.path.basename(f) for f in os.scandir(results_dir) if f.is_dir()]
+    all_models = [x.split("_results")[0] for x in subfolders if x.endswith("_results")]
+    if ignore_models != []:
+        all_models = [x for x in all_models if x not in ignore_models]
+    seldonian_models = sorted(set(all_models).intersection(seldonian_model_set))
+    baselines = sorted(set(all_models).difference(seldonian_model_set))
+    return seldonian_models, baselines
+
+
+def parse_gvecs(gvec_strs, n_constraints):
+    """Parse the string representations of the constraint
+    vectors in a results file into a 2D array
+
+    :param gvec_strs: Strings like "[-0.1  0.2]", one per trial
+    :type gvec_strs: pandas.Series
+    :param n_constraints: The number of constraints
+
+    :return: Array of shape (len(gvec_strs), n_constraints)
+    """
+    gvecs = gvec_strs.str.strip("[] \n").str.split(expand=True)
+    gvecs = gvecs.reindex(columns=range(n_constraints))
+    return gvecs.to_numpy(dtype=float)
+
+
+summary_input_columns = set(["data_frac", "performance", "passed_safety", "gvec"])
+
+
+def count_constraints(gvec):
+    """The number of constraints from the constraint vector
+    of one trial, as saved in a results file
+
+    :param gvec: A string like "[-0.1  0.2]" or an array
+    """
+    if isinstance(gvec, str):
+        return len(gvec.strip("[] \n").split())
+    return len(np.atleast_1d(gvec))
+
+
+def trial_quantities(df, n_constraints, seldonian=True):
+    """Get the quantities that are summarized for each trial: the
+    performance (NaN unless the trial passed the safety test or returned
+    a solution), whether a solution was returned and whether
+    each constraint failed (see has_failed()).
+
+    :param df: The results of one or more trials
+    :type df: pandas.DataFrame
+    :param n_constraints: The number of constraints
+    :param seldonian: Whether df contains the results of a Seldonian model
+    :type seldonian: bool
+
+    :return: (data_fracs, quantities), where quantities has one row per trial
+        and the columns performance, solution_rate, g1_failed, g2_failed, ...
+    """
+    performance = df["performance"].to_numpy(dtype=float)
+    if seldonian:
+        solution_returned = df["passed_safety"].to_numpy(dtype=bool)
+    else:
+        solution_returned = ~np.isnan(performance)
+    gvec_col = df["gvec"]
+    if len(gvec_col) and isinstance(gvec_col.iloc[0], str):
+        gvecs = parse_gvecs(gvec_col, n_constraints)
+    else:
+        gvecs = np.array([np.atleast_1d(g) for g in gvec_col], dtype=float)
+        gvecs = gvecs.reshape(len(gvec_col), n_constraints)
+    # Same condition as has_failed(), applied to all trials at once
+    failed = (gvecs > 0) | np.isnan(gvecs)
+
+    quantities = np.column_stack(
+        [
+            np.where(solution_returned, performance, np.nan),
+            solution_returned.astype(float),
+            failed.astype(float),
+        ]
+    )
+    return df["data_frac"].to_numpy(dtype=float), quantities
+
+
+def sort_groups(group_ids):
+    """Sort rows by group once, so that each group is a contiguous
+    segment that np.add.reduceat() can reduce. The groups are first
+    numbered in a single pass, and the rows are then sorted by those
+    numbers, which takes linear time (radix sort) for up to 65536 groups.
+    Rows that are already sorted, like the trials of a finished
+    experiment, are not reordered.
+
+    :param group_ids: The group of each row, shape (n_rows,)
+
+    :return: (order, groups, starts, counts), where order sorts the rows
+        (None if they are already sorted), groups are the sorted unique
+        group_ids and starts and counts are the first row and the number
+        of rows of each group in the sorted rows
+    """
+    codes, groups = pd.factorize(np.asarray(group_ids), sort=True)
+    counts = np.bincount(codes, minlength=len(groups))
+    starts = np.cumsum(counts) - counts
+    if np.all(codes[:-1] <= codes[1:]):
+        order = None
+    else:
+        codes = codes.astype(np.min_scalar_type(max(len(groups) - 1, 0)))
+        order = np.argsort(codes, kind="stable")
+    return order, groups, starts, counts
+
+
+def grouped_stats(group_ids, quantities):
+    """Count, mean and sample standard deviation (ddof=1) of several
+    quantities within groups of rows, e.g. the trials of each data_frac.
+    NaN values are skipped. Equivalent to
+    pd.DataFrame(quantities).groupby(group_ids).agg(["count", "mean", "std"]),
+    in a single pass over the sorted rows.
+
+    :param group_ids: The group of each row, shape (n_rows,)
+    :param quantities: Array of shape (n_rows, n_quantities)
+
+    :return: (groups, count, mean, std), where groups are the sorted
+        unique group_ids and the others have shape (n_groups, n_quantities)
+    """
+    quantities = np.asarray(quantities, dtype=float)
+    if quantities.ndim == 1:
+        quantities = quantities[:, np.newaxis]
+    order, groups, starts, counts = sort_groups(group_ids)
+    if len(groups) == 0:
+        empty = np.empty((0, quantities.shape[1]))
+        return groups, empty.astype(np.intp), empty, empty
+    values = quantities if order is None else np.take(quantities, order, axis=0)
+    valid = ~np.isnan(values)
+    if not valid.all():
+        values = np.where(valid, values, 0.0)
+    count = np.add.reduceat(valid, starts, axis=0, dtype=np.intp)
+    sums = np.add.reduceat(values, starts, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Sums of squares about the overall mean of each quantity,
+        # which avoids the cancellation of the textbook formula
+        shift = np.nan_to_num(sums.sum(axis=0) / count.sum(axis=0))
+        squares = np.where(valid, (values - shift) ** 2, 0.0)
+        m2 = np.add.reduceat(squares, starts, axis=0)
+        mean = sums / count
+        m2 = np.maximum(m2 - count * (mean - shift) ** 2, 0.0)
+        std = np.where(count > 1, np.sqrt(m2 / (count - 1)), np.nan)
+    return groups, count, mean, std
+
+
+interval_methods = ["ste", "wilson", "clopper_pearson", "bootstrap"]
+
+
+def wilson_interval(successes, n, confidence=0.95):
+    """Wilson score intervals of binomial proportions
+
+    :param successes: Number of successes, any shape
+    :param n: Number of trials, same shape as successes
+    :param confidence: The confidence level of the intervals
+
+    :return: (low, high), NaN where n is 0
+    """
+    successes = np.asarray(successes, dtype=float)
+    n = np.asarray(n, dtype=float)
+    z = ndtri(0.5 + confidence / 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = successes / n
+        denom = 1 + z**2 / n
+        center = (p + z**2 / (2 * n)) / denom
+        half_width = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denom
+    return center - half_width, center + half_width
+
+
+def clopper_pearson_interval(successes, n, confidence=0.95):
+    """Clopper-Pearson (exact) intervals of binomial proportions
+
+    :param successes: Number of successes, any shape
+    :param n: Number of trials, same shape as successes
+    :param confidence: The confidence level of the intervals
+
+    :return: (low, high), NaN where n is 0
+    """
+    successes = np.asarray(successes, dtype=float)
+    n = np.asarray(n, dtype=float)
+    alpha = 1 - confidence
+    with np.errstate(invalid="ignore", divide="ignore"):
+        low = np.where(
+            successes > 0, betaincinv(successes, n - successes + 1, alpha / 2), 0.0
+        )
+        high = np.where(
+            successes < n, betaincinv(successes + 1, n - successes, 1 - alpha / 2), 1.0
+        )
+    return np.where(n > 0, low, np.nan), np.where(n > 0, high, np.nan)
+
+
+def bootstrap_intervals(
+    group_ids,
+    quantities,
+    n_resamples=1000,
+    confidence=0.95,
+    seed=0,
+    max_elements=2**24,
+):
+    """Percentile bootstrap intervals of the mean of several quantities
+    within groups of rows, e.g. the trials of each data_frac. All groups
+    and quantities are resampled at once: each resample draws one index
+    per row, within the row's group, and uses it for every quantity.
+    NaN values are left out of the means.
+
+    :param group_ids: The group of each row, shape (n_rows,)
+    :param quantities: Array of shape (n_rows, n_quantities)
+    :param n_resamples: The number of bootstrap resamples
+    :type n_resamples: int
+    :param confidence: The confidence level of the intervals
+    :param seed: Seed of the random number generator
+    :param max_elements: The maximum number of resampled values held
+        in memory at once. Resamples are processed in chunks below this.
+
+    :return: (groups, low, high), where groups are the sorted unique
+        group_ids and low and high have shape (n_groups, n_quantities)
+    """
+    quantities = np.asarray(quantities, dtype=float)
+    if quantities.ndim == 1:
+        quantities = quantities[:, np.newaxis]
+    order, groups, starts, counts = sort_groups(group_ids)
+    values = quantities if order is None else quantities[order]
+    row_starts = np.repeat(starts, counts)
+    row_counts = np.repeat(counts, counts)
+
+    rng = np.random.default_rng(seed)
+    means = np.empty((n_resamples, len(groups), values.shape[1]))
+    chunk_size = max(1, max_elements // max(values.size, 1))
+    for first in range(0, n_resamples, chunk_size):
+        last = min(first + chunk_size, n_resamples)
+        draws = rng.random((last - first, len(values)))
+        indices = row_starts + (draws * row_counts).astype(np.intp)
+        resampled = values[indices]
+        valid = ~np.isnan(resampled)
+        sums = np.add.reduceat(np.where(valid, resampled, 0.0), starts, axis=1)
+        n_valid = np.add.reduceat(valid, starts, axis=1, dtype=np.intp)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[first:last] = sums / n_valid
+
+    alpha = 1 - confidence
+    with warnings.catch_warnings():
+        # Groups without any valid value have NaN intervals
+        warnings.simplefilter("ignore", RuntimeWarning)
+        low, high = np.nanquantile(means, [alpha / 2, 1 - alpha / 2], axis=0)
+    return groups, low, high
+
+
+def summary_intervals(count, mean, std, interval="ste", confidence=0.95):
+    """Intervals of the quantities from trial_quantities() that only need
+    their statistics. "ste" is mean +/- one standard error. "wilson" and
+    "clopper_pearson" apply to the solution and failure rates, which are
+    proportions; the performance interval is then mean +/- one standard
+    error. Bootstrap intervals need the trials, see bootstrap_intervals().
+
+    :param count: Number of non-NaN values of each quantity, shape (n_fracs, 2 + n_constraints)
+    :param mean: Mean of each quantity, same shape as count
+    :param std: Standard deviation of each quantity, same shape as count
+    :param interval: "ste", "wilson" or "clopper_pearson"
+    :type interval: str
+    :param confidence: The confidence level of the
+        Wilson and Clopper-Pearson intervals
+
+    :return: (low, high), same shape as count
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ste = std / np.sqrt(count)
+    low = mean - ste
+    high = mean + ste
+    if interval == "ste":
+        return low, high
+    if interval == "wilson":
+        interval_fn = wilson_interval
+    elif interval == "clopper_pearson":
+        interval_fn = clopper_pearson_interval
+    else:
+        raise NotImplementedError(
+            f"interval: {interval} is not supported from summary statistics. "
+            f"Supported intervals are: {interval_methods[:-1]}"
+        )
+    # Round away floating point error in mean*count
+    successes = np.round(mean[:, 1:] * count[:, 1:])
+    low[:, 1:], high[:, 1:] = interval_fn(successes, count[:, 1:], confidence)
+    return low, high
+
+
+def make_summary_table(data_fracs, count, mean, std, low=None, high=None):
+    """Arrange the statistics of the quantities from trial_quantities()
+    into a tidy table with one row per constraint per data_frac.
+
+    :param data_fracs: The data fractions, shape (n_fracs,)
+    :param count: Number of non-NaN values of each quantity, shape (n_fracs, 2 + n_constraints)
+    :param mean: Mean of each quantity, same shape as count
+    :param std: Standard deviation of each quantity, same shape as count
+    :param low: Lower end of the interval of each quantity, same shape
+        as count. Defaults to mean - ste, see summary_intervals()
+    :param high: Upper end of the interval of each quantity, same shape
+        as count. Defaults to mean + ste
+    """
+    if low is None or high is None:
+        low, high = summary_intervals(count, mean, std)
+    n_constraints = count.shape[1] - 2
+    performance_count = count[:, 0]
+    n_trials = count[:, 1]
+    summary_columns = {
+        "data_frac": data_fracs,
+        "n_trials": n_trials.astype(int),
+        "performance_mean": mean[:, 0],
+        "performance_std": std[:, 0],
+        "performance_ste": std[:, 0] / np.sqrt(performance_count),
+        "performance_count": performance_count.astype(int),
+        "performance_low": low[:, 0],
+        "performance_high": high[:, 0],
+        "solution_rate": mean[:, 1],
+        "solution_rate_std": std[:, 1],
+        "solution_rate_ste": std[:, 1] / np.sqrt(n_trials),
+        "solution_rate_low": low[:, 1],
+        "solution_rate_high": high[:, 1],
+    }
+    summaries = []
+    for ii in range(n_constraints):
+        summary = pd.DataFrame(summary_columns)
+        summary.insert(0, "constraint_num", ii + 1)
+        summary["failure_rate"] = mean[:, ii + 2]
+        summary["failure_rate_std"] = std[:, ii + 2]
+        summary["failure_rate_ste"] = std[:, ii + 2] / np.sqrt(n_trials)
+        summary["failure_rate_low"] = low[:, ii + 2]
+        summary["failure_rate_high"] = high[:, ii + 2]
+        summaries.append(summary)
+    return pd.concat(summaries, ignore_index=True)
+
+
+def summarize_results(
+    df,
+    n_constraints,
+    seldonian=True,
+    interval="ste",
+    confidence=0.95,
+    n_resamples=1000,
+    seed=0,
+):
+    """Aggregate the results of all trials of one model into a tidy table
+    with one row per constraint per data_frac. The performance statistics
+    only use the trials that passed the safety test (Seldonian models)
+    or that returned a solution (baselines).
+
+    :param df: The results of all trials, as saved in {model}_results.csv
+    :type df: pandas.DataFrame
+    :param n_constraints: The number of constraints
+    :param seldonian: Whether df contains the results of a Seldonian model
+    :type seldonian: bool
+    :param interval: The intervals shown around the means in the plots,
+        one of interval_methods. See summary_intervals() and
+        bootstrap_intervals()
+    :type interval: str
+    :param confidence: The confidence level of the intervals
+        (not used for "ste")
+    :param n_resamples: The number of bootstrap resamples
+    :param seed: Seed of the bootstrap resampling
+
+    :return: DataFrame with columns constraint_num, data_frac, n_trials,
+        performance_{mean,std,ste,count,low,high},
+        solution_rate{,_std,_ste,_low,_high} and
+        failure_rate{,_std,_ste,_low,_high}
+    """
+    data_fracs, quantities = trial_quantities(df, n_constraints, seldonian=seldonian)
+    groups, count, mean, std = grouped_stats(data_fracs, quantities)
+    if interval == "bootstrap":
+        _, low, high = bootstrap_intervals(
+            data_fracs,
+            quantities,
+            n_resamples=n_resamples,
+            confidence=confidence,
+            seed=seed,
+        )
+    else:
+        low, high = summary_intervals(count, mean, std, interval, confidence)
+    return make_summary_table(groups, count, mean, std, low, high)
+
+
+class RunningStats:
+    def __init__(self, n_quantities):
+        """Running count, mean and standard deviation of several
+        quantities, updated with Welford's algorithm
+        (Chan et al.'s version for batches). NaN values are skipped.
+
+        :param n_quantities: The number of quantities
+        :type n_quantities: int
+        """
+        self.count = np.zeros(n_quantities)
+        self.mean = np.zeros(n_quantities)
+        self.m2 = np.zeros(n_quantities)
+
+    def update(self, values):
+        """Add a batch of values
+
+        :param values: Array of shape (n_values, n_quantities)
+        """
+        values = np.atleast_2d(values)
+        valid = ~np.isnan(values)
+        count_b = valid.sum(axis=0)
+        sum_b = np.where(valid, values, 0.0).sum(axis=0)
+        mean_b = np.divide(sum_b, count_b, out=np.zeros_like(sum_b), where=count_b > 0)
+        m2_b = np.where(valid, (values - mean_b) ** 2, 0.0).sum(axis=0)
+
+        count = self.count + count_b
+        delta = mean_b - self.mean
+        has_count = count > 0
+        safe_count = np.where(has_count, count, 1)
+        self.mean = np.where(has_count, self.mean + delta * count_b / safe_count, 0.0)
+        self.m2 = self.m2 + m2_b + delta**2 * self.count * count_b / safe_count
+        self.count = count
+
+    @property
+    def std(self):
+        """Sample standard deviation (ddof=1), NaN for fewer than 2 values"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(
+                self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan
+            )
+
+
+def results_filename(results_dir, model_name):
+    """The file containing the results of all trials of a model"""
+    return os.path.join(results_dir, f"{model_name}_results", f"{model_name}_results.csv")
+
+
+def summary_filename(results_dir, model_name):
+    """The file in which the summary of a model's results is cached"""
+    return os.path.join(results_dir, f"{model_name}_results", f"{model_name}_summary.pkl")
+
+
+def run_info_filename(results_dir, model_name):
+    """The file describing the latest run of a model's experiment"""
+    return os.path.join(results_dir, f"{model_name}_results", "run_info.json")
+
+
+def save_run_info(results_dir, model_name, run_info):
+    """Save the description of a run of an experiment: the data_fracs,
+    n_trials and n_workers, when it started, the constraints and the
+    total data size. Used to monitor the experiment while it runs
+    and to plot its results without the spec.
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param model_name: The name of the model
+    :type model_name: str
+    :param run_info: The description of the run
+    :type run_info: dict
+    """
+    filename = run_info_filename(results_dir, model_name)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "w") as outfile:
+        json.dump(run_info, outfile, indent=2)
+
+
+def load_run_info(results_dir, model_name):
+    """Load the description of the latest run of a model's experiment,
+    see save_run_info(). Returns None for results saved
+    before run descriptions were saved.
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param model_name: The name of the model
+    :type model_name: str
+    """
+    filename = run_info_filename(results_dir, model_name)
+    if not os.path.exists(filename):
+        return None
+    with open(filename, "r") as infile:
+        return json.load(infile)
+
+
+def find_run_info(results_dir, ignore_models=[]):
+    """Load the description of the experiments in results_dir
+    from the first model that has one, see save_run_info().
+    Returns None if no model has one.
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param ignore_models: Model names to leave out
+    :type ignore_models: List
+    """
+    for model_names in find_models(results_dir, ignore_models):
+        for model_name in model_names:
+            run_info = load_run_info(results_dir, model_name)
+            if run_info is not None:
+                return run_info
+    return None
+
+
+def temp_filename(filename):
+    """A temporary file name next to filename that is unique to this
+    process and thread, for writing a file then renaming it into place
+
+    :param filename: The file that will be replaced
+    :type filename: str
+    """
+    return f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def results_store_key(results_dir, model_name, n_constraints):
+    """The modification state of a model's results file, used to
+    decide whether a cached summary of it is still valid
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param model_name: The name of the model
+    :type model_name: str
+    :param n_constraints: The number of constraints
+    """
+    stat = os.stat(results_filename(results_dir, model_name))
+    return (stat.st_mtime_ns, stat.st_size, n_constraints)
+
+
+def compute_model_summary(
+    results_dir,
+    model_name,
+    n_constraints,
+    use_cache=True,
+    interval="ste",
+    confidence=0.95,
+    n_resamples=1000,
+    seed=0,
+):
+    """Get the summary table (see summarize_results()) of one model.
+    The summary is cached in {model}_results/{model}_summary.pkl
+    and only recomputed when the results file or the
+    interval parameters have changed since. If the cache
+    cannot be written, the summary is computed in memory.
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param model_name: The name of the model
+    :type model_name: str
+    :param n_constraints: The number of constraints
+    :param use_cache: Whether to read and write the cached summary
+    :type use_cache: bool
+    :param interval: See summarize_results()
+    :param confidence: See summarize_results()
+    :param n_resamples: See summarize_results()
+    :param seed: See summarize_results()
+
+    :rtype: pandas.DataFrame
+    """
+    key = results_store_key(results_dir, model_name, n_constraints) + (
+        interval,
+        confidence,
+        n_resamples,
+        seed,
+    )
+    cache_filename = summary_filename(results_dir, model_name)
+    if use_cache and os.path.exists(cache_filename):
+        with open(cache_filename, "rb") as infile:
+            cached = pickle.load(infile)
+        if cached["key"] == key:
+            return cached["summary"]
+
+    # Only read the columns that are summarized
+    df = pd.read_csv(
+        results_filename(results_dir, model_name),
+        usecols=lambda column: column in summary_input_columns,
+    )
+    summary = summarize_results(
+        df,
+        n_constraints,
+        seldonian=model_name in seldonian_model_set,
+        interval=interval,
+        confidence=confidence,
+        n_resamples=n_resamples,
+        seed=seed,
+    )
+    if use_cache:
+        # Write then rename, so that other processes plotting
+        # the same results never read a partially written cache
+        tmp_filename = temp_filename(cache_filename)
+        try:
+            with open(tmp_filename, "wb") as outfile:
+                pickle.dump({"key": key, "summary": summary}, outfile)
+            os.replace(tmp_filename, cache_filename)
+        except OSError:
+            # E.g. results on a read-only mount. The summary
+            # is still returned, it is just not cached.
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+    return summary
+
+
+def compute_summary(
+    results_dir,
+    n_constraints,
+    ignore_models=[],
+    use_cache=True,
+    interval="ste",
+    confidence=0.95,
+    n_resamples=1000,
+    seed=0,
+):
+    """Get the summary table of every model with results in results_dir
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param n_constraints: The number of constraints
+    :param ignore_models: Model names to leave out
+    :type ignore_models: List
+    :param use_cache: Whether to read and write the cached summaries
+    :type use_cache: bool
+    :param interval: See summarize_results()
+    :param confidence: See summarize_results()
+    :param n_resamples: See summarize_results()
+    :param seed: See summarize_results()
+
+    :return: The summary tables of all models stacked,
+        with the model name in the "model" column
+    :rtype: pandas.DataFrame
+    """
+    seldonian_models, baselines = find_models(results_dir, ignore_models)
+    summaries = []
+    for model_name in seldonian_models + baselines:
+        if not os.path.exists(results_filename(results_dir, model_name)):
+            # Started, but no trial has completed yet
+            continue
+        summary = compute_model_summary(
+            results_dir,
+            model_name,
+            n_constraints,
+            use_cache=use_cache,
+            interval=interval,
+            confidence=confidence,
+            n_resamples=n_resamples,
+            seed=seed,
+        )
+        summaries.append(summary.assign(model=model_name))
+    if not summaries:
+        return pd.DataFrame()
+    summary = pd.concat(summaries, ignore_index=True)
+    return summary[["model"] + [c for c in summary.columns if c != "model"]]
+
+
+def load_summary(
+    results_dir,
+    ignore_models=[],
+    use_cache=True,
+    interval="ste",
+    confidence=0.95,
+    as_arrow=False,
+    json_filename=None,
+):
+    """Load the summary of every model with results in results_dir,
+    without the spec. The number of constraints, the constraint strings
+    and the amount of data are taken from the run description of the
+    experiments (see save_run_info()) when there is one. Otherwise the
+    number of constraints is read from the results.
+
+    :param results_dir: The directory containing the results
+    :type results_dir: str
+    :param ignore_models: Model names to leave out
+    :type ignore_models: List
+    :param use_cache: Whether to read and write the cached summaries,
+        see compute_model_summary()
+    :type use_cache: bool
+    :param interval: See summarize_results()
+    :param confidence: See summarize_results()
+    :param as_arrow: Return a pyarrow Table instead of a DataFrame
+    :type as_arrow: bool
+    :param json_filename: If not None, also save the summary
+        to this file, see summary_to_json()
+    :type json_filename: str
+
+    :return: The table from compute_summary(), with the columns
+        constraint_str, delta and data_size (data_frac times the total
+        data size) if the experiments were described
+    """
+    run_info = find_run_info(results_dir, ignore_models)
+    if run_info is not None:
+        n_constraints = len(run_info["constraint_strs"])
+    else:
+        n_constraints = None
+        seldonian_models, baselines = find_models(results_dir, ignore_models)
+        for model_name in seldonian_models + baselines:
+            filename = results_filename(results_dir, model_name)
+            if os.path.exists(filename):
+                gvec = pd.read_csv(filename, usecols=["gvec"], nrows=1)["gvec"]
+                n_constraints = count_constraints(gvec.iloc[0])
+                break
+    if n_constraints is None:
+        summary = pd.DataFrame()
+    else:
+        summary = compute_summary(
+            results_dir,
+            n_constraints,
+            ignore_models=ignore_models,
+            use_cache=use_cache,
+            interval=interval,
+            confidence=confidence,
+        )
+    if run_info is not None and len(summary) > 0:
+        constraint_index = summary["constraint_num"].to_numpy() - 1
+        summary["constraint_str"] = np.array(run_info["constraint_strs"])[
+            constraint_index
+        ]
+        summary["delta"] = np.array(run_info["deltas"])[constraint_index]
+        summary["data_size"] = summary["data_frac"] * run_info["tot_data_size"]
+
+    if json_filename is not None:
+        summary_to_json(summary, json_filename)
+    if as_arrow:
+        import pyarrow
+
+        return pyarrow.Table.from_pandas(summary, preserve_index=False)
+    return summary
+
+
+def summary_to_json(summary, filename=None):
+    """Convert a summary table to JSON, one object per row.
+    NaN values become null.
+
+    :param summary: See load_summary()
+    :type summary: pandas.DataFrame
+    :param filename: If not None, the file to save the JSON to
+    :type filename: str
+
+    :rtype: str
+    """
+    summary_json = summary.to_json(orient="records")
+    if filename is not None:
+        with open(filename, "w") as outfile:
+            outfile.write(summary_json)
+    return summary_json
+
+
+class StreamingResultsStore:
+    def __init__(self, results_dir, model_name, data_fracs=None, n_trials=None):
+        """The consolidated results file of a model, {model}_results.csv,
+        to which the result of each trial is appended as soon as it
+        completes, along with running statistics per data_frac.
+        The summary table (see summarize_results()) is therefore
+        available at any moment without re-reading the results.
+
+        The trial files in {model}_results/trial_data are the source of
+        truth: rows recorded by earlier runs whose trial file no longer
+        exists are dropped when the store is opened, as are rows outside
+        of the current run if data_fracs and n_trials are given.
+
+        :param results_dir: The directory containing the results
+        :type results_dir: str
+        :param model_name: The name of the model
+        :type model_name: str
+        :param data_fracs: The data fractions of the current run
+        :type data_fracs: List
+        :param n_trials: The number of trials per data fraction
+            of the current run
+        :type n_trials: int
+        """
+        self.filename = results_filename(results_dir, model_name)
+        self.trial_dir = os.path.join(
+            results_dir, f"{model_name}_results", "trial_data"
+        )
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        self.seldonian = model_name in seldonian_model_set
+        self.columns = None
+        self.n_constraints = None
+        self.recorded = set()
+        self.running_stats = {}
+        # Rows recorded by earlier runs
+        if os.path.exists(self.filename):
+            df = pd.read_csv(self.filename)
+            self.columns = list(df.columns)
+            if data_fracs is not None and n_trials is not None:
+                run_trials = set(
+                    self.trial_key(data_frac, trial_i)
+                    for data_frac in data_fracs
+                    for trial_i in range(n_trials)
+                )
+            else:
+                run_trials = None
+            keep = np.array(
+                [
+                    self.is_current(data_frac, trial_i, run_trials)
+                    for data_frac, trial_i in zip(df["data_frac"], df["trial_i"])
+                ],
+                dtype=bool,
+            )
+            if not keep.all():
+                df = df[keep]
+                self.write(df)
+            self.update_stats(df)
+
+    @staticmethod
+    def trial_key(data_frac, trial_i):
+        return (f"{data_frac:.4f}", int(trial_i))
+
+    def trial_filename(self, data_frac, trial_i):
+        return os.path.join(
+            self.trial_dir, f"data_frac_{data_frac:.4f}_trial_{trial_i}.csv"
+        )
+
+    def is_current(self, data_frac, trial_i, run_trials=None):
+        """Whether a recorded row still has its trial file and,
+        if run_trials is given, is one of those trials"""
+        if run_trials is not None:
+            if self.trial_key(data_frac, trial_i) not in run_trials:
+                return False
+        return os.path.exists(self.trial_filename(data_frac, trial_i))
+
+    def has_trial(self, data_frac, trial_i):
+        """Whether the result of this trial is already in the results file"""
+        return self.trial_key(data_frac, trial_i) in self.recorded
+
+    def add(self, row):
+        """Append the result of one trial
+
+        :param row: The result, with the keys data_frac, trial_i,
+            performance, gvec and for Seldonian models passed_safety
+        :type row: dict
+        """
+        self.add_rows(pd.DataFrame([row]))
+
+    def add_rows(self, df):
+        """Append the results of several trials. Trials that are
+        already in the results file, e.g. because they were run again,
+        replace the recorded rows.
+
+        :type df: pandas.DataFrame
+        """
+        if len(df) == 0:
+            return
+        if self.columns is None:
+            self.columns = list(df.columns)
+        df = df[self.columns]
+        keys = set(
+            self.trial_key(data_frac, trial_i)
+            for data_frac, trial_i in zip(df["data_frac"], df["trial_i"])
+        )
+        if keys.isdisjoint(self.recorded):
+            df.to_csv(
+                self.filename,
+                mode="a",
+                header=not os.path.exists(self.filename),
+                index=False,
+            )
+            self.update_stats(df)
+            return
+
+        # Rewrite the file without the replaced rows and
+        # recompute the running statistics
+        old = pd.read_csv(self.filename)
+        replaced = np.array(
+            [
+                self.trial_key(data_frac, trial_i) in keys
+                for data_frac, trial_i in zip(old["data_frac"], old["trial_i"])
+            ],
+            dtype=bool,
+        )
+        df = pd.concat([old[~replaced], df], ignore_index=True)
+        self.write(df)
+        self.recorded = set()
+        self.running_stats = {}
+        self.update_stats(df)
+
+    def write(self, df):
+        """Replace the results file with df"""
+        # Write then rename, so that readers never see a partial file
+        tmp_filename = temp_filename(self.filename)
+        df.to_csv(tmp_filename, index=False)
+        os.replace(tmp_filename, self.filename)
+
+    def update_stats(self, df):
+        if len(df) == 0:
+            return
+        for data_frac, trial_i in zip(df["data_frac"], df["trial_i"]):
+            self.recorded.add(self.trial_key(data_frac, trial_i))
+        if self.n_constraints is None:
+            self.n_constraints = count_constraints(df["gvec"].iloc[0])
+        data_fracs, quantities = trial_quantities(
+            df, self.n_constraints, seldonian=self.seldonian
+        )
+        order, groups, starts, counts = sort_groups(data_fracs)
+        if order is not None:
+            quantities = quantities[order]
+        for data_frac, start, count in zip(groups, starts, counts):
+            if data_frac not in self.running_stats:
+                self.running_stats[data_frac] = RunningStats(quantities.shape[1])
+            self.running_stats[data_frac].update(quantities[start : start + count])
+
+    def summary(self, interval="ste", confidence=0.95):
+        """The summary table of the trials recorded so far,
+        from the running statistics
+
+        :param interval: "ste", "wilson" or "clopper_pearson",
+            see summary_intervals()
+        :type interval: str
+        :param confidence: The confidence level of the intervals
+
+        :rtype: pandas.DataFrame
+        """
+        if not self.running_stats:
+            return pd.DataFrame()
+        data_fracs = np.array(sorted(self.running_stats))
+        stats = [self.running_stats[data_frac] for data_frac in data_fracs]
+        count = np.array([x.count for x in stats])
+        mean = np.array([x.mean for x in stats])
+        std = np.array([x.std for x in stats])
+        low, high = summary_intervals(count, mean, std, interval, confidence)
+        return make_summary_table(data_fracs, count, mean, std, low, high)
+
+
+def importance_weight_stats(weights):
+    """Summary statistics of the importance weights of one trial
+
+    :param weights: The importance weights of each episode
+    :type weights: numpy.ndarray
+
+    :return: (mean, max, effective sample size). The effective
+        sample size is (sum w)^2 / sum w^2
+    """
+    weights = np.asarray(weights, dtype=float)
+    if len(weights) == 0:
+        return np.nan, np.nan, 0.0
+    sum_sq = np.sum(weights**2)
+    ess = np.sum(weights) ** 2 / sum_sq if sum_sq > 0 else 0.0
+    return np.mean(weights), np.max(weights), ess
+
+
+class ImportanceWeightStore:
+    def __init__(self, results_dir, model_name="qsa"):
+        """The importance weights of every trial of an RL experiment,
+        for the candidate selection and safety test branches. The weights
+        of all trials are concatenated in a single file of float64s,
+        importance_weights/weights.bin, and importance_weights/index.csv
+        has one row per trial with the offset and length of its weights
+        in that file and their mean, max and effective sample size.
+
+        :param results_dir: The directory containing the results
+        :type results_dir: str
+        :param model_name: The name of the model
+        :type model_name: str
+        """
+        self.store_dir = os.path.join(
+            results_dir, f"{model_name}_results", "importance_weights"
+        )
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.weights_filename = os.path.join(self.store_dir, "weights.bin")
+        self.index_filename = os.path.join(self.store_dir, "index.csv")
+        if os.path.exists(self.index_filename):
+            self.index = pd.read_csv(self.index_filename)
+        else:
+            self.index = pd.DataFrame(
+                columns=[
+                    "branch",
+                    "data_frac",
+                    "trial_i",
+                    "offset",
+                    "length",
+                    "mean",
+                    "max",
+                    "ess",
+                ]
+            )
+        self.recorded = set(
+            (branch, f"{data_frac:.4f}", int(trial_i))
+            for branch, data_frac, trial_i in zip(
+                self.index["branch"], self.index["data_frac"], self.index["trial_i"]
+            )
+        )
+
+    def add(self, branch, data_frac, trial_i, weights):
+        """Append the importance weights of one trial.
+        Trials that are already in the store are skipped.
+
+        :param branch: "candidate_selection" or "safety_test"
+        :type branch: str
+        :param data_frac: The data fraction of the trial
+        :type data_frac: float
+        :param trial_i: The index of the trial
+        :type trial_i: int
+        :param weights: The importance weights of each episode
+        :type weights: numpy.ndarray
+        """
+        key = (branch, f"{data_frac:.4f}", int(trial_i))
+        if key in self.recorded:
+            return
+        weights = np.asarray(weights, dtype=np.float64).ravel()
+        offset = 0
+        if os.path.exists(self.weights_filename):
+            offset = os.path.getsize(self.weights_filename) // 8
+        with open(self.weights_filename, "ab") as outfile:
+            weights.tofile(outfile)
+
+        mean, max_weight, ess = importance_weight_stats(weights)
+        row = pd.DataFrame(
+            [
+                {
+                    "branch": branch,
+                    "data_frac": data_frac,
+                    "trial_i": int(trial_i),
+                    "offset": offset,
+                    "length": len(weights),
+                    "mean": mean,
+                    "max": max_weight,
+                    "ess": ess,
+                }
+            ]
+        )
+        row.to_csv(
+            self.index_filename,
+            mode="a",
+            header=not os.path.exists(self.index_filename),
+            index=False,
+        )
+        if len(self.index) == 0:
+            self.index = row
+        else:
+            self.index = pd.concat([self.index, row], ignore_index=True)
+        self.recorded.add(key)
+
+    def get_weights(self, branch, data_frac, trial_i):
+        """Load the importance weights of one trial,
+        or None if they were not saved
+
+        :rtype: numpy.ndarray
+        """
+        data_fracs = self.index["data_frac"].to_numpy(dtype=float)
+        mask = (
+            (self.index["branch"] == branch)
+            & (np.round(data_fracs, 4) == round(data_frac, 4))
+            & (self.index["trial_i"] == trial_i)
+        )
+        if not mask.any():
+            return None
+        row = self.index[mask].iloc[0]
+        return np.fromfile(
+            self.weights_filename,
+            dtype=np.float64,
+            count=int(row["length"]),
+            offset=8 * int(row["offset"]),
+        )
+
+    def import_trial_pickles(self, data_fracs, n_trials):
+        """Add the importance weights saved one pickle file per trial, as
+        importance_weights/{branch}/importance_weights_frac_{data_frac}_trial_{trial_i}.pkl,
+        to the store
+
+        :param data_fracs: The data fractions of the experiment
+        :type data_fracs: List(float)
+        :param n_trials: The number of trials of the experiment
+        :type n_trials: int
+        """
+        for branch in ["candidate_selection", "safety_test"]:
+            for data_frac in data_fracs:
+                for trial_i in range(n_trials):
+                    filename = os.path.join(
+                        self.store_dir,
+                        branch,
+                        f"importance_weights_frac_{data_frac:.4f}_trial_{trial_i}.pkl",
+                    )
+                    if not os.path.exists(filename):
+                        continue
+                    with open(filename, "rb") as infile:
+                        weights = pickle.load(infile)
+                    if weights is not None:
+                        self.add(branch, data_frac, trial_i, weights)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Summarize the results of the experiments in a results directory"
+    )
+    parser.add_argument("results_dir")
+    parser.add_argument(
+        "--json", default=None, help="Save the summary to this file as JSON"
+    )
+    parser.add_argument("--interval", default="ste", choices=interval_methods)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--ignore-models", nargs="*", default=[])
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the cached summaries",
+    )
+    args = parser.parse_args(argv)
+    summary = load_summary(
+        args.results_dir,
+        ignore_models=args.ignore_models,
+        use_cache=not args.no_cache,
+        interval=args.interval,
+        confidence=args.confidence,
+        json_filename=args.json,
+    )
+    if args.json is None:
+        print(summary.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,11 @@ from seldonian.RL.Agents.Policies.Softmax import DiscreteSoftmax
 from seldonian.RL.environments.gridworld import Gridworld
 from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor
+from experiments.experiment_utils import stack_episodes,precompute_IS_base_node_values
+from experiments.experiments import BaselineExperiment
+from seldonian.parse_tree.parse_tree import ParseTree
+from experiments.baselines.diabetes_US_baseline import RLDiabetesUSAgentBaseline
+from seldonian.dataset import Episode,RLDataSet,RLMetaData
 
 def test_supervised_base_class():
 	bl_model = SupervisedExperimentBaseline(model_name="custom_SL_baseline")
@@ -122,3 +127,290 @@ def test_fitted_Q_baseline(gridworld_spec):
 
 
 	
+def test_fitted_Q_sparse_and_closed_form(gridworld_spec):
+	""" The sparse design matrix and the closed-form
+	tabular fit should give the same Q table as the dense fit
+	"""
+	constraint_strs = ['J_pi_new_IS >= -0.25']
+	deltas=[0.05]
+	spec = gridworld_spec(constraint_strs,deltas)
+
+	gw = Gridworld(size=3)
+	env_description = gw.get_env_description()
+	num_observations=9
+	num_actions=4
+	env_kwargs={
+		'gamma':0.9,
+		'num_observations':num_observations,
+		'num_actions':num_actions,
+		'terminal_observation':8
+	}
+	q_tables = []
+	for fit_kwargs in [{},{'sparse_features':True},{'closed_form':True}]:
+		policy = DiscreteSoftmax(hyperparam_and_setting_dict={},env_description=env_description)
+		bl_model = ExactTabularFittedQBaseline(
+			model_name="Tabular_fitted_Q",
+			regressor_class=LinearRegression,
+			policy=policy,
+			env_kwargs=env_kwargs,
+			num_iters=10,
+			**fit_kwargs
+		)
+		bl_model.train(spec.dataset)
+		q_tables.append(np.array(bl_model.policy.get_params()))
+
+	assert np.allclose(q_tables[0],q_tables[1],atol=1e-4)
+	assert np.allclose(q_tables[0],q_tables[2])
+
+	transitions = bl_model.get_transitions(spec.dataset.episodes)
+	observations, actions, _, _ = zip(*transitions)
+	bl_model.closed_form = False
+	bl_model.sparse_features = True
+	X_sparse = bl_model.make_X(observations,actions)
+	bl_model.sparse_features = False
+	X_dense = bl_model.make_X(observations,actions)
+	assert X_sparse.shape == X_dense.shape == (len(transitions),num_observations*num_actions)
+	assert np.allclose(X_sparse.toarray(),X_dense)
+	assert np.allclose(X_dense[0],bl_model.one_hot_encode(observations[0],actions[0]))
+
+	# Approximate tabular with a regressor that accepts sparse input
+	policy = DiscreteSoftmax(hyperparam_and_setting_dict={},env_description=env_description)
+	bl_model2 = ApproximateTabularFittedQBaseline(
+		model_name="Approx_tabular_fitted_Q",
+		regressor_class=RandomForestRegressor,
+		policy=policy,
+		env_kwargs=env_kwargs,
+		num_iters=10,
+		sparse_features=True
+	)
+	bl_model2.train(spec.dataset)
+	fitted_greedy_actions2 = np.argmax(bl_model2.policy.get_params(),axis=1)
+	assert fitted_greedy_actions2[2] == 2
+	assert fitted_greedy_actions2[5] == 2
+	assert fitted_greedy_actions2[7] == 1
+
+def test_fitted_Q_stopping_criteria(gridworld_spec):
+	""" Test the configurable stopping criteria of fitted Q """
+	constraint_strs = ['J_pi_new_IS >= -0.25']
+	deltas=[0.05]
+	spec = gridworld_spec(constraint_strs,deltas)
+
+	gw = Gridworld(size=3)
+	env_description = gw.get_env_description()
+	env_kwargs={
+		'gamma':0.9,
+		'num_observations':9,
+		'num_actions':4,
+		'terminal_observation':8
+	}
+	def train_model(**stopping_kwargs):
+		policy = DiscreteSoftmax(hyperparam_and_setting_dict={},env_description=env_description)
+		bl_model = ExactTabularFittedQBaseline(
+			model_name="Tabular_fitted_Q",
+			regressor_class=LinearRegression,
+			policy=policy,
+			env_kwargs=env_kwargs,
+			num_iters=20,
+			closed_form=True,
+			**stopping_kwargs
+		)
+		bl_model.train(spec.dataset)
+		return bl_model
+
+	bl_model_default = train_model()
+	bl_model_stable3 = train_model(greedy_stability_iters=3)
+	assert bl_model_stable3.n_iters_run == bl_model_default.n_iters_run + 2
+	assert np.array_equal(
+		bl_model_stable3.last_greedy_actions,bl_model_default.last_greedy_actions)
+	assert np.allclose(bl_model_default.q_table,bl_model_default.policy.get_params())
+
+	bl_model_no_stopping = train_model(greedy_stability_iters=None)
+	assert bl_model_no_stopping.n_iters_run == 20
+
+	bl_model_loose_tol = train_model(greedy_stability_iters=None,q_tol=1e6)
+	assert bl_model_loose_tol.n_iters_run == 1
+
+	bl_model_tol = train_model(greedy_stability_iters=None,q_tol=1e-3)
+	assert 1 < bl_model_tol.n_iters_run < 20
+	assert np.max(np.abs(bl_model_tol.q_table-bl_model_tol.last_q_table)) <= 1e-3
+
+def test_batched_episode_probs(gridworld_spec):
+	""" Test the batched action probability and importance weight
+	API against a loop over episodes using the policy directly
+	"""
+	np.random.seed(0)
+	constraint_strs = ['J_pi_new_IS >= -0.25']
+	deltas=[0.05]
+	spec = gridworld_spec(constraint_strs,deltas)
+	# The stored episodes predate the action_probs attribute
+	episodes = [Episode(ep.observations,ep.actions,ep.rewards,ep.pis)
+		for ep in spec.dataset.episodes]
+
+	gw = Gridworld(size=3)
+	env_description = gw.get_env_description()
+	policy = DiscreteSoftmax(hyperparam_and_setting_dict={},env_description=env_description)
+	bl_model = ExactTabularFittedQBaseline(
+		model_name="Tabular_fitted_Q",
+		regressor_class=LinearRegression,
+		policy=policy,
+		env_kwargs={
+			'gamma':0.9,
+			'num_observations':9,
+			'num_actions':4,
+			'terminal_observation':8
+		},
+	)
+	thetas = np.random.randn(3,9,4)
+	expected_probs = []
+	expected_weights = []
+	for theta in thetas:
+		policy.set_new_params(theta)
+		probs = [policy.get_probs_from_observations_and_actions(
+			ep.observations,ep.actions,ep.action_probs) for ep in episodes]
+		expected_probs.append(np.concatenate(probs))
+		expected_weights.append([np.prod(p/ep.action_probs) for p,ep in zip(probs,episodes)])
+
+	stacked = stack_episodes(episodes)
+	assert len(stacked['episode_offsets']) == len(episodes) + 1
+	assert stacked['episode_offsets'][-1] == len(stacked['actions'])
+	args = [stacked['observations'],stacked['actions'],stacked['action_probs']]
+
+	probs = bl_model.get_probs_from_episode_arrays(thetas,*args)
+	assert probs.shape == (3,len(stacked['actions']))
+	assert np.allclose(probs,expected_probs)
+	# Default implementation in the parent class gives the same answer
+	probs_default = RLExperimentBaseline.get_probs_from_episode_arrays(bl_model,thetas,*args)
+	assert np.allclose(probs_default,expected_probs)
+
+	weights = bl_model.get_importance_weights_from_episode_arrays(
+		thetas,*args,stacked['episode_offsets'])
+	assert weights.shape == (3,len(episodes))
+	assert np.allclose(weights,expected_weights)
+
+	ep = episodes[0]
+	single_ep_probs = bl_model.get_probs_from_observations_and_actions(
+		thetas[1],ep.observations,ep.actions,ep.action_probs)
+	assert np.allclose(single_ep_probs,expected_probs[1][:len(ep.actions)])
+
+
+def test_batched_IS_ground_truth(gridworld_spec,tmp_path):
+	""" Test that ground truth evaluation of a baseline gets the
+	J_pi_new_IS base node values from the batched importance weights,
+	and that they match the parse tree's per-episode estimate """
+	np.random.seed(0)
+	constraint_strs = ['J_pi_new_IS >= -0.25']
+	deltas=[0.05]
+	spec = gridworld_spec(constraint_strs,deltas)
+	# The stored episodes predate the action_probs attribute
+	episodes = [Episode(ep.observations,ep.actions,ep.rewards,ep.pis)
+		for ep in spec.dataset.episodes]
+	dataset = RLDataSet(episodes=episodes,meta=spec.dataset.meta)
+
+	gw = Gridworld(size=3)
+	env_description = gw.get_env_description()
+	policy = DiscreteSoftmax(hyperparam_and_setting_dict={},env_description=env_description)
+	bl_model = ExactTabularFittedQBaseline(
+		model_name="Tabular_fitted_Q",
+		regressor_class=LinearRegression,
+		policy=policy,
+		env_kwargs={
+			'gamma':0.9,
+			'num_observations':9,
+			'num_actions':4,
+			'terminal_observation':8
+		},
+	)
+	theta = np.random.randn(9,4)
+	bl_model.set_new_params(theta)
+
+	def make_parse_tree():
+		parse_tree = ParseTree(delta=0.05,regime='reinforcement_learning',sub_regime='all')
+		parse_tree.build_tree(constraint_str=constraint_strs[0])
+		return parse_tree
+
+	eval_kwargs = dict(theta=theta,tree_dataset_dict={"all":dataset},model=bl_model,
+		regime='reinforcement_learning',sub_regime='all',branch='safety_test',
+		batch_size_safety=None)
+	parse_tree = make_parse_tree()
+	parse_tree.evaluate_constraint(**eval_kwargs)
+	expected = parse_tree.root.value
+
+	parse_tree = make_parse_tree()
+	precompute_IS_base_node_values(parse_tree,bl_model,theta,
+		{"all":dataset},'reinforcement_learning')
+	node_dict = parse_tree.base_node_dict['J_pi_new_IS']
+	assert node_dict['value_computed']
+	parse_tree.evaluate_constraint(**eval_kwargs)
+	assert parse_tree.root.value == pytest.approx(expected)
+
+	# Off-policy ground truth evaluation of a baseline trial
+	bl_exp = BaselineExperiment(baseline_model=bl_model,results_dir=str(tmp_path))
+	gvec = bl_exp.evaluate_constraint_functions(
+		solution=theta,
+		constraint_eval_fns=[],
+		constraint_eval_kwargs={
+			"parse_trees":[make_parse_tree()],
+			"additional_datasets":{},
+			"regime":'reinforcement_learning',
+			"sub_regime":'all',
+			"dataset":dataset,
+			"baseline_model":bl_model})
+	assert gvec == pytest.approx([expected])
+
+
+def make_diabetes_dataset(n_episodes=200,cr_range=(5.0,15.0),cf_range=(15.0,25.0)):
+	""" One-step episodes whose actions are (CR,CF) pairs
+	drawn uniformly from the bounding box """
+	rng = np.random.default_rng(0)
+	episodes = []
+	for _ in range(n_episodes):
+		cr = rng.uniform(*cr_range)
+		cf = rng.uniform(*cf_range)
+		reward = -(cr-9.0)**2 - (cf-22.0)**2
+		episodes.append(Episode(observations=[0],actions=[np.array([cr,cf])],
+			rewards=[reward],action_probs=[1.0]))
+	meta = RLMetaData(all_col_names=["episode_index","O","A","R","pi_b"])
+	return RLDataSet(episodes=episodes,meta=meta)
+
+def test_diabetes_US_batch_objective(tmp_path,monkeypatch):
+	""" Test that the batched objective of the diabetes US baseline
+	matches evaluating each theta separately and that training
+	with it gives the same solution """
+	# CMA-ES writes its output files to the working directory
+	monkeypatch.chdir(tmp_path)
+	dataset = make_diabetes_dataset()
+	bl_model = RLDiabetesUSAgentBaseline(
+		initial_solution=np.zeros(2),env_kwargs={})
+	solution = bl_model.train(dataset,seed=1,sigma0=1)
+	assert np.all(np.isfinite(solution))
+	assert bl_model.primary_objective_fn(solution) < bl_model.primary_objective_fn(np.zeros(2))
+
+	rng = np.random.default_rng(1)
+	thetas = list(rng.normal(0,3,(20,2)))
+	expected = [bl_model.primary_objective_fn(theta) for theta in thetas]
+	assert np.allclose(bl_model.primary_objective_fn_batch(thetas),expected)
+
+	# Boxes that contain no episodes give nan, like np.mean()
+	corner_dataset = make_diabetes_dataset(
+		n_episodes=20,cr_range=(5.0,6.0),cf_range=(15.0,16.0))
+	bl_model_corner = RLDiabetesUSAgentBaseline(
+		initial_solution=np.array([-50.0,-50.0]),env_kwargs={})
+	bl_model_corner.train(corner_dataset,seed=1,sigma0=1)
+	corner_thetas = thetas + [np.array([50.0,50.0])]
+	expected = [bl_model_corner.primary_objective_fn(theta) for theta in corner_thetas]
+	assert np.isnan(expected[-1])
+	assert np.allclose(bl_model_corner.primary_objective_fn_batch(corner_thetas),
+		expected,equal_nan=True)
+
+	# Without shrinking every theta maps to the whole box
+	bl_model_noshrink = RLDiabetesUSAgentBaseline(
+		initial_solution=np.zeros(2),env_kwargs={},
+		cr_shrink_factor=1,cf_shrink_factor=1)
+	bl_model_noshrink.train(dataset,seed=1,sigma0=1)
+	expected = [bl_model_noshrink.primary_objective_fn(theta) for theta in thetas]
+	assert np.allclose(bl_model_noshrink.primary_objective_fn_batch(thetas),expected)
+
+	bl_model_batch = RLDiabetesUSAgentBaseline(
+		initial_solution=np.zeros(2),env_kwargs={},batch_objective=True)
+	solution_batch = bl_model_batch.train(dataset,seed=1,sigma0=1)
+	assert np.allclose(solution_batch,solution)
@@ -1,10 +1,20 @@
 import pytest
+import numpy as np
 
 from experiments.experiments import (
-	BaselineExperiment,SeldonianExperiment)
+	BaselineExperiment,SeldonianExperiment,FairlearnExperiment)
 
 from experiments.perf_eval_funcs import MSE
+from experiments.experiment_utils import (
+	register_ground_truth_context,get_ground_truth_context,
+	release_ground_truth_context)
+from experiments import experiment_utils
 from experiments.baselines.logistic_regression import BinaryLogisticRegressionBaseline
+from experiments.baselines.linear_regression import LinearRegressionBaseline
+from fairlearn.reductions import ExponentiatedGradient,DemographicParity
+from sklearn.linear_model import LogisticRegression
+from fairlearn.metrics import (
+	MetricFrame,selection_rate,false_positive_rate,false_negative_rate)
 
 def test_create_seldonian_experiment():
 	sd_exp = SeldonianExperiment(model_name='qsa',results_dir="./results")
@@ -22,5 +32,157 @@ def test_create_baseline_experiment():
 	bl_exp = BaselineExperiment(baseline_model=bl_model,results_dir="./results")
 	assert bl_exp.model_name == 'logistic_regression'
 
+def test_fairlearn_constraint_evaluation():
+	""" Test that the single-pass grouped evaluation of the
+	fairlearn constraints matches Fairlearn's MetricFrame """
+	np.random.seed(0)
+	n_points = 500
+	test_labels = np.random.randint(0,2,n_points)
+	y_pred = np.random.uniform(0,1,n_points)
+	sensitive_features = np.random.randint(0,2,(n_points,1))
+	fl_exp = FairlearnExperiment(
+		results_dir="./results",fairlearn_epsilon_constraint=0.1)
 
-	
+	frames = {}
+	for name,metric in [("PR",selection_rate),
+		("FPR",false_positive_rate),("FNR",false_negative_rate)]:
+		frame = MetricFrame(metrics=metric,y_true=test_labels,
+			y_pred=y_pred>=0.5,sensitive_features=sensitive_features)
+		frames[name] = (frame.by_group.iloc[0],
+			{"native":frame.overall,"two-groups":frame.by_group.iloc[1]})
+
+	epsilon_eval = 0.05
+	for eval_method in ["native","two-groups"]:
+		PR1,PR2 = frames["PR"][0],frames["PR"][1][eval_method]
+		FPR1,FPR2 = frames["FPR"][0],frames["FPR"][1][eval_method]
+		FNR1,FNR2 = frames["FNR"][0],frames["FNR"][1][eval_method]
+		expected = {
+			"demographic_parity":abs(PR1-PR2)-epsilon_eval,
+			"predictive_equality":abs(FPR1-FPR2)-epsilon_eval,
+			"disparate_impact":epsilon_eval-min(PR1/PR2,PR2/PR1),
+			"equalized_odds":abs(FPR1-FPR2)+abs(FNR1-FNR2)-epsilon_eval,
+			"equal_opportunity":abs(FNR1-FNR2)-epsilon_eval,
+		}
+		for constraint_name in expected:
+			gvec = fl_exp.evaluate_constraint_function(
+				y_pred=y_pred,
+				test_labels=test_labels,
+				fairlearn_constraint_name=constraint_name,
+				epsilon_eval=epsilon_eval,
+				eval_method=eval_method,
+				sensitive_features=sensitive_features)
+			assert gvec[0] == pytest.approx(expected[constraint_name])
+
+	with pytest.raises(NotImplementedError) as excinfo:
+		fl_exp.evaluate_constraint_function(
+			y_pred=y_pred,
+			test_labels=test_labels,
+			fairlearn_constraint_name="bad_constraint",
+			epsilon_eval=epsilon_eval,
+			sensitive_features=sensitive_features)
+	error_str = (
+		"Evaluation for Fairlearn constraints of type: "
+		"bad_constraint is not supported.")
+	assert str(excinfo.value) == error_str
+
+def test_fairlearn_logistic_mixture_predictions():
+	""" Test that the stacked logistic regression predictions
+	of a fairlearn mitigator match predicting with each predictor """
+	np.random.seed(0)
+	n_points = 400
+	features = np.random.randn(n_points,3)
+	sensitive_features = np.random.randint(0,2,n_points)
+	labels = (features[:,0] + sensitive_features + 0.5*np.random.randn(n_points) > 0.5).astype(int)
+	mitigator = ExponentiatedGradient(LogisticRegression(),
+		DemographicParity(difference_bound=0.01))
+	mitigator.fit(features,labels,sensitive_features=sensitive_features)
+	fl_exp = FairlearnExperiment(
+		results_dir="./results",fairlearn_epsilon_constraint=0.01)
+
+	X_test = np.random.randn(250,3)
+	expected = np.zeros(len(X_test))
+	start_index = 0
+	for predictor,weight in zip(mitigator.predictors_,mitigator.weights_):
+		if weight == 0:
+			continue
+		end_index = start_index + int(round(weight*len(X_test)))
+		expected[start_index:end_index] = predictor.predict_proba(
+			X_test[start_index:end_index])[:,1]
+		start_index = end_index
+
+	y_pred = fl_exp.get_fairlearn_predictions(mitigator,X_test)
+	assert np.allclose(y_pred,expected)
+	y_pred_blocked = fl_exp.get_fairlearn_predictions(mitigator,X_test,block_size=16)
+	assert np.allclose(y_pred_blocked,expected)
+
+def test_ground_truth_constraint_context(gpa_regression_spec):
+	""" Test that reusing the cached ground truth data of
+	the base nodes gives the same constraint values """
+	np.random.seed(0)
+	constraint_strs = ['abs((Mean_Error | [M]) - (Mean_Error | [F])) - 0.1',
+		'Mean_Squared_Error - 2.0']
+	deltas = [0.05,0.05]
+	spec = gpa_regression_spec(constraint_strs,deltas)
+	bl_model = LinearRegressionBaseline()
+	bl_exp = BaselineExperiment(baseline_model=bl_model,results_dir="./results")
+	constraint_eval_kwargs = {
+		"parse_trees":spec.parse_trees,
+		"additional_datasets":{},
+		"regime":"supervised_learning",
+		"sub_regime":"regression",
+		"dataset":spec.dataset,
+		"baseline_model":bl_model,
+	}
+	n_features = spec.dataset.features.shape[1]
+	solutions = [np.random.randn(n_features+1) for _ in range(3)]
+	expected = [bl_exp.evaluate_constraint_functions(
+		solution,[],constraint_eval_kwargs) for solution in solutions]
+
+	key = register_ground_truth_context()
+	constraint_eval_kwargs["ground_truth_context_key"] = key
+	for solution,gvec in zip(solutions,expected):
+		gvec_cached = bl_exp.evaluate_constraint_functions(
+			solution,[],constraint_eval_kwargs)
+		assert np.allclose(gvec_cached,gvec)
+
+	context = get_ground_truth_context(key)
+	cached_keys = set(context.data_dicts.keys())
+	assert cached_keys == {
+		(constraint_strs[0],'Mean_Error | [M]'),
+		(constraint_strs[0],'Mean_Error | [F]'),
+		(constraint_strs[1],'Mean_Squared_Error')}
+	assert get_ground_truth_context(None) is None
+
+	# Releasing the context frees its cached data
+	release_ground_truth_context(key)
+	assert key not in experiment_utils._ground_truth_contexts
+
+
+def test_import_time():
+	""" Test that importing the library does not import
+	the optional dependencies of features that are not used,
+	and measure how long the import takes """
+	import os
+	import sys
+	import subprocess
+	repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	code = (
+		"import sys,time\n"
+		"start = time.perf_counter()\n"
+		"import experiments.experiments,experiments.generate_plots\n"
+		"import experiments.headless_experiments,experiments.monitor\n"
+		"print(time.perf_counter() - start)\n"
+		"print(','.join(m for m in ['torch','torchvision','fairlearn','matplotlib'] "
+		"if m in sys.modules))\n"
+	)
+	output = subprocess.run([sys.executable,"-c",code],capture_output=True,
+		text=True,check=True,cwd=repo_dir).stdout.split("\n")
+	import_time = float(output[0])
+	assert output[1] == ""
+	# Generous, to only catch heavy imports creeping back in
+	assert import_time < 10
+
+	# The fairlearn experiments import fairlearn when they need it
+	fl_exp = FairlearnExperiment(results_dir="./results",fairlearn_epsilon_constraint=0.1)
+	constraint = fl_exp.make_fairlearn_constraint("demographic_parity")
+	assert isinstance(constraint,DemographicParity)
@@ -6,12 +6,36 @@ import pytest
 
 from experiments.generate_plots import (
     SupervisedPlotGenerator,RLPlotGenerator,
-    CustomPlotGenerator)
+    CustomPlotGenerator,render_figures)
 
 from experiments.experiment_utils import (
-    generate_episodes_and_calc_J,has_failed)
-
-from experiments.perf_eval_funcs import (MSE,probabilistic_accuracy)
+    generate_episodes_and_calc_J,has_failed,
+    run_eval_rollouts,eval_rollout_worker_budget,streaming_perf_eval,
+    batch_trial_performance,
+    combine_held_out_addl_datasets,
+    get_held_out_addl_dataset,load_memmap_supervised_dataset,
+    IndexedArray,MemmapArray,prep_merged_feat_labels,
+    load_resampled_datasets,prep_custom_data,IndexedData,
+    batch_predictions_custom_regime,set_start_method,get_mp_context,
+    setup_SA_spec_for_exp)
+from experiments.results import (
+    compute_summary,summarize_results,StreamingResultsStore,load_run_info,
+    ImportanceWeightStore,importance_weight_stats,wilson_interval,
+    clopper_pearson_interval,bootstrap_intervals,grouped_stats,
+    load_summary,save_run_info)
+from experiments.monitor import (
+    experiment_progress,format_progress,render_partial_plots,make_server)
+from experiments.baselines.linear_regression import LinearRegressionBaseline
+import pickle
+from experiments import experiment_utils
+from seldonian.dataset import SupervisedDataSet,CustomDataSet
+
+from experiments.perf_eval_funcs import (
+    MSE,probabilistic_accuracy,binary_logistic_loss,deterministic_accuracy,
+    multiclass_accuracy,multiclass_logistic_loss,get_streaming_metric,
+    get_batched_metric)
+from seldonian.models.models import (
+    LinearRegressionModel,BinaryLogisticRegressionModel)
 
 from seldonian.RL.environments.gridworld import Gridworld
 
@@ -156,7 +180,8 @@ def test_custom_regime_plot_generator(custom_text_spec,experiment):
     resampled_dir = os.path.join(results_dir,"resampled_datasets")
     resampled_files = os.listdir(resampled_dir)
     assert len(resampled_files) == n_trials
-    assert "trial_0.pkl" in resampled_files and "trial_1.pkl" in resampled_files
+    assert "trial_0_indices.npy" in resampled_files
+    assert "trial_1_indices.npy" in resampled_files
 
     # Seldonian experiment
 
@@ -263,8 +288,8 @@ def test_custom_regime_addl_datasets_plot_generator(custom_text_addl_datasets_sp
     resampled_dir = os.path.join(results_dir,"resampled_datasets")
     resampled_files = os.listdir(resampled_dir)
     assert len(resampled_files) == n_trials*2
-    assert "trial_0.pkl" in resampled_files
-    assert "trial_1.pkl" in resampled_files
+    assert "trial_0_indices.npy" in resampled_files
+    assert "trial_1_indices.npy" in resampled_files
     assert "trial_0_addl_datasets.pkl" in resampled_files
     assert "trial_1_addl_datasets.pkl" in resampled_files
 
@@ -622,6 +647,69 @@ def test_addl_datasets_with_hold_out(gpa_regression_addl_datasets_spec,experimen
     addl_resampled_file = os.path.join(results_dir,"resampled_datasets/trial_0_addl_datasets.pkl")
     assert os.path.exists(addl_resampled_file)
 
+def test_baseline_addl_datasets_with_hold_out(gpa_regression_addl_datasets_spec,
+    tmp_path,monkeypatch):
+    """ Test that baseline trials evaluate the constraints on the
+    held out addl datasets, using the candidate and safety datasets
+    combined once by the plot generator """
+    np.random.seed(42)
+    constraint_strs = ['Mean_Squared_Error <= 2.0']
+    deltas = [0.05]
+    spec = gpa_regression_addl_datasets_spec(constraint_strs,deltas)
+    dataset = spec.dataset
+
+    # Held out labels that are far off, so that every
+    # baseline solution violates the constraint on them
+    held_out_addl_datasets = {}
+    for cstr in spec.additional_datasets:
+        held_out_addl_datasets[cstr] = {}
+        for bn,this_dict in spec.additional_datasets[cstr].items():
+            addl_dataset = this_dict["dataset"]
+            def make_subset(start,end):
+                return SupervisedDataSet(
+                    features=addl_dataset.features[start:end],
+                    labels=addl_dataset.labels[start:end] + 100,
+                    sensitive_attrs=addl_dataset.sensitive_attrs[start:end],
+                    num_datapoints=end-start,
+                    meta=addl_dataset.meta)
+            held_out_addl_datasets[cstr][bn] = {
+                "candidate_dataset":make_subset(0,400),
+                "safety_dataset":make_subset(400,1000)}
+
+    # Record the held out datasets the trials evaluate on
+    evaluated = []
+    def spy(held_out_dict):
+        evaluated.append(held_out_dict)
+        return experiment_utils.get_held_out_addl_dataset(held_out_dict)
+    monkeypatch.setattr("experiments.experiments.get_held_out_addl_dataset",spy)
+
+    results_dir = os.path.join(tmp_path,"results")
+    spg = SupervisedPlotGenerator(
+        spec=spec,
+        n_trials=2,
+        data_fracs=[0.1],
+        datagen_method="resample",
+        perf_eval_fn=MSE,
+        results_dir=results_dir,
+        n_workers=1,
+        constraint_eval_fns=[],
+        perf_eval_kwargs={'X':dataset.features,'y':dataset.labels},
+        constraint_eval_kwargs={"additional_datasets":held_out_addl_datasets})
+    spg.run_baseline_experiment(baseline_model=LinearRegressionBaseline(),verbose=False)
+
+    # Both trials used the held out datasets combined by the plot generator
+    combined_addl_datasets = spg.constraint_eval_kwargs["additional_datasets"]
+    assert len(evaluated) == 2
+    for held_out_dict in evaluated:
+        assert held_out_dict is combined_addl_datasets[cstr][bn]
+        assert "combined_dataset" in held_out_dict
+
+    df = pd.read_csv(os.path.join(results_dir,
+        "linear_regression_results","linear_regression_results.csv"))
+    gvecs = df.gvec.apply(lambda t: np.fromstring(t[1:-1],sep=' '))
+    assert len(gvecs) == 2
+    assert all(gvec[0] > 1000 for gvec in gvecs)
+
 @pytest.mark.parametrize('experiment', ["./tests/static/gridworld_results"], indirect=True)
 def test_too_few_episodes(gridworld_spec,experiment):
     """ Test that too small of a data_frac resulting in < 1
@@ -767,3 +855,1066 @@ def test_RL_plot_generator(gridworld_spec,experiment):
         savename=savename)
     # Make sure it was saved
     assert os.path.exists(savename)
+
+def test_parallel_eval_rollouts():
+    """ Test that seeded evaluation episodes do not depend
+    on the number of rollout workers """
+    hyperparameter_and_setting_dict = {}
+    hyperparameter_and_setting_dict["env"] = Gridworld()
+    hyperparameter_and_setting_dict["agent"] = "Parameterized_non_learning_softmax_agent"
+    hyperparameter_and_setting_dict["num_episodes"] = 10
+    hyperparameter_and_setting_dict["num_trials"] = 1
+    hyperparameter_and_setting_dict["vis"] = False
+    new_params = np.random.randn(9,4)
+
+    serial_episodes = run_eval_rollouts(
+        hyperparameter_and_setting_dict,new_params,
+        num_episodes=10,n_workers=1,seed=42)
+    parallel_episodes = run_eval_rollouts(
+        hyperparameter_and_setting_dict,new_params,
+        num_episodes=10,n_workers=3,seed=42)
+    assert len(serial_episodes) == len(parallel_episodes) == 10
+    for ep_s,ep_p in zip(serial_episodes,parallel_episodes):
+        assert np.array_equal(ep_s.observations,ep_p.observations)
+        assert np.array_equal(ep_s.actions,ep_p.actions)
+        assert np.allclose(ep_s.rewards,ep_p.rewards)
+
+    # Seeded rollouts leave the global random stream untouched
+    np.random.seed(0)
+    expected = np.random.rand(3)
+    np.random.seed(0)
+    run_eval_rollouts(
+        hyperparameter_and_setting_dict,new_params,
+        num_episodes=2,n_workers=1,seed=42)
+    assert np.array_equal(np.random.rand(3),expected)
+
+    # Never more rollout workers than cpus left over per trial worker
+    n_cpus = os.cpu_count()
+    assert eval_rollout_worker_budget(4,n_trial_workers=n_cpus) == 1
+    assert eval_rollout_worker_budget(1,n_trial_workers=1) == 1
+    assert eval_rollout_worker_budget(2*n_cpus,n_trial_workers=1) == n_cpus
+
+def test_streaming_perf_eval(tmp_path):
+    """ Test that evaluating performance one batch at a time
+    from memory-mapped test data matches evaluating on the
+    full arrays """
+    np.random.seed(0)
+    n_points = 1003
+    X = np.random.randn(n_points,4)
+    theta = np.random.randn(5)
+    X_path = os.path.join(tmp_path,"X_test.npy")
+    np.save(X_path,X)
+
+    model = LinearRegressionModel()
+    y = model.predict(theta,X) + np.random.randn(n_points)
+    y_path = os.path.join(tmp_path,"y_test.npy")
+    np.save(y_path,y)
+    performance = streaming_perf_eval(
+        model=model,solution=theta,perf_eval_fn=MSE,
+        X=X_path,y=y_path,eval_batch_size=100)
+    assert performance == pytest.approx(MSE(model.predict(theta,X),y))
+
+    model = BinaryLogisticRegressionModel()
+    y = np.random.randint(0,2,n_points)
+    y_pred = model.predict(theta,X)
+    for perf_eval_fn in [probabilistic_accuracy,binary_logistic_loss,deterministic_accuracy]:
+        performance = streaming_perf_eval(
+            model=model,solution=theta,perf_eval_fn=perf_eval_fn,
+            X=X_path,y=y,eval_batch_size=64)
+        assert performance == pytest.approx(perf_eval_fn(y_pred,y))
+
+    with pytest.raises(NotImplementedError) as excinfo:
+        streaming_perf_eval(
+            model=model,solution=theta,perf_eval_fn=has_failed,
+            X=X_path,y=y,eval_batch_size=64)
+    error_str = (
+        "Streaming evaluation is not supported "
+        "for perf_eval_fn: has_failed")
+    assert str(excinfo.value) == error_str
+
+def test_metrics_match_sklearn():
+    """ Test that the metrics, which are computed from
+    their per-sample values, match sklearn's and that
+    accumulating them over batches gives the same result """
+    from sklearn.metrics import log_loss,accuracy_score
+    np.random.seed(0)
+    n_points = 200
+    y = np.random.randint(0,2,n_points)
+    y_pred = np.random.uniform(0,1,n_points)
+    y_pred[:3] = [0.0,1.0,0.5]
+    assert binary_logistic_loss(y_pred,y) == pytest.approx(log_loss(y,y_pred))
+    assert deterministic_accuracy(y_pred,y) == pytest.approx(
+        accuracy_score(y,y_pred > 0.5))
+
+    y_multi = np.random.randint(0,3,n_points)
+    y_pred_multi = np.random.dirichlet(np.ones(3),n_points)
+    assert multiclass_logistic_loss(y_pred_multi,y_multi) == pytest.approx(
+        log_loss(y_multi,y_pred_multi))
+
+    for perf_eval_fn,preds,labels in [
+        (MSE,y_pred,y),(probabilistic_accuracy,y_pred,y),
+        (binary_logistic_loss,y_pred,y),(deterministic_accuracy,y_pred,y),
+        (multiclass_accuracy,y_pred_multi,y_multi),
+        (multiclass_logistic_loss,y_pred_multi,y_multi)]:
+        metric = get_streaming_metric(perf_eval_fn)
+        for batch_start in range(0,n_points,64):
+            metric.update(preds[batch_start:batch_start+64],
+                labels[batch_start:batch_start+64])
+        assert metric.result() == pytest.approx(perf_eval_fn(preds,labels))
+
+def test_batched_perf_eval():
+    """ Test that the batched metrics give the same
+    result as evaluating each trial separately """
+    np.random.seed(0)
+    n_trials = 5
+    n_points = 200
+    y = np.random.randint(0,2,n_points)
+    y_preds = np.random.uniform(0,1,(n_trials,n_points))
+    for perf_eval_fn in [MSE,probabilistic_accuracy,
+        binary_logistic_loss,deterministic_accuracy]:
+        batched_fn = get_batched_metric(perf_eval_fn)
+        expected = [perf_eval_fn(y_pred,y) for y_pred in y_preds]
+        assert np.allclose(batched_fn(y_preds,y),expected)
+
+    y_multi = np.random.randint(0,3,n_points)
+    y_preds_multi = np.random.dirichlet(np.ones(3),(n_trials,n_points))
+    for perf_eval_fn in [multiclass_accuracy,multiclass_logistic_loss]:
+        batched_fn = get_batched_metric(perf_eval_fn)
+        expected = [perf_eval_fn(y_pred,y_multi) for y_pred in y_preds_multi]
+        assert np.allclose(batched_fn(y_preds_multi,y_multi),expected)
+
+    model = LinearRegressionModel()
+    X = np.random.randn(n_points,2)
+    solutions = [np.random.randn(3) for _ in range(n_trials)]
+    performances = batch_trial_performance(model,solutions,MSE,X,y)
+    expected = [MSE(model.predict(solution,X),y) for solution in solutions]
+    assert np.allclose(performances,expected)
+
+    with pytest.raises(NotImplementedError):
+        get_batched_metric(has_failed)
+
+def test_combine_held_out_addl_datasets(gpa_regression_spec):
+    """ Test that held out candidate and safety additional
+    datasets are combined once, without changing the input dict """
+    constraint_strs = ['Mean_Squared_Error - 2.0']
+    deltas = [0.05]
+    spec = gpa_regression_spec(constraint_strs,deltas)
+    dataset = spec.dataset
+    def make_subset(start,end):
+        return SupervisedDataSet(
+            features=dataset.features[start:end],
+            labels=dataset.labels[start:end],
+            sensitive_attrs=dataset.sensitive_attrs[start:end],
+            num_datapoints=end-start,
+            meta=dataset.meta)
+    held_out = {
+        constraint_strs[0]:{
+            "Mean_Squared_Error":{
+                "candidate_dataset":make_subset(0,300),
+                "safety_dataset":make_subset(300,1000)
+            }
+        }
+    }
+    combined = combine_held_out_addl_datasets(held_out)
+    this_dict = combined[constraint_strs[0]]["Mean_Squared_Error"]
+    assert "combined_dataset" not in held_out[constraint_strs[0]]["Mean_Squared_Error"]
+    combined_dataset = get_held_out_addl_dataset(this_dict)
+    assert combined_dataset is this_dict["combined_dataset"]
+    assert combined_dataset.num_datapoints == 1000
+    assert np.allclose(combined_dataset.features,dataset.features)
+
+    # Without a pre-combined dataset, it is combined on the fly
+    uncombined_dataset = get_held_out_addl_dataset(
+        held_out[constraint_strs[0]]["Mean_Squared_Error"])
+    assert np.allclose(uncombined_dataset.labels,combined_dataset.labels)
+
+def test_out_of_core_dataset(gpa_regression_spec,tmp_path):
+    """ Test running a baseline experiment on a dataset
+    whose arrays are memory-mapped from disk """
+    np.random.seed(42)
+    constraint_strs = ['Mean_Squared_Error - 2.0']
+    deltas = [0.05]
+    spec = gpa_regression_spec(constraint_strs,deltas)
+    dataset = spec.dataset
+    filenames = {}
+    for name in ["features","labels","sensitive_attrs"]:
+        filenames[name] = os.path.join(tmp_path,f"{name}.npy")
+        np.save(filenames[name],getattr(dataset,name))
+
+    memmap_dataset = load_memmap_supervised_dataset(
+        features_filename=filenames["features"],
+        labels_filename=filenames["labels"],
+        meta=dataset.meta,
+        sensitive_attrs_filename=filenames["sensitive_attrs"])
+    assert isinstance(memmap_dataset.features,MemmapArray)
+    assert memmap_dataset.num_datapoints == dataset.num_datapoints
+    # Pickled by filename, not by value
+    pickled_features = pickle.dumps(memmap_dataset.features)
+    assert len(pickled_features) < 1000
+    assert np.array_equal(pickle.loads(pickled_features),dataset.features)
+    # Other views of the file are pickled by value
+    for view in [memmap_dataset.features.T,
+        memmap_dataset.features.reshape(-1),
+        np.memmap.__getitem__(memmap_dataset.features,slice(10,20))]:
+        assert isinstance(view,MemmapArray)
+        unpickled = pickle.loads(pickle.dumps(view))
+        assert not isinstance(unpickled,MemmapArray)
+        assert np.array_equal(unpickled,np.asarray(view))
+
+    indices = np.random.randint(0,dataset.num_datapoints,50)
+    indexed_features = IndexedArray(memmap_dataset.features,indices)
+    assert indexed_features.shape == (50,dataset.features.shape[1])
+    assert np.array_equal(indexed_features[:20],dataset.features[indices[:20]])
+
+    spec.dataset = memmap_dataset
+    results_dir = os.path.join(tmp_path,"results")
+    spg = SupervisedPlotGenerator(
+        spec=spec,
+        n_trials=2,
+        data_fracs=[0.1],
+        datagen_method="resample",
+        perf_eval_fn=MSE,
+        results_dir=results_dir,
+        n_workers=1,
+        constraint_eval_fns=[],
+        perf_eval_kwargs={'X':filenames["features"],'y':dataset.labels,
+            'eval_batch_size':100,'streaming_eval':True},
+        constraint_eval_kwargs={})
+    spg.run_baseline_experiment(baseline_model=LinearRegressionBaseline(),verbose=False)
+
+    # Only the indices were saved for each resampled trial dataset
+    for trial_i in range(2):
+        assert os.path.exists(os.path.join(
+            results_dir,"resampled_datasets",f"trial_{trial_i}_indices.npy"))
+        assert not os.path.exists(os.path.join(
+            results_dir,"resampled_datasets",f"trial_{trial_i}.pkl"))
+    df = pd.read_csv(os.path.join(results_dir,
+        "linear_regression_results","linear_regression_results.csv"))
+    assert len(df) == 2
+    assert np.all(np.isfinite(df["performance"]))
+
+def test_out_of_core_seldonian_trial(gpa_regression_spec,tmp_path,monkeypatch):
+    """ Test running a Seldonian experiment on forced candidate
+    and safety datasets that are memory-mapped from disk, and that
+    the spec of each trial does not hold in-memory copies of them """
+    np.random.seed(42)
+    constraint_strs = ['Mean_Squared_Error - 2.0']
+    deltas = [0.05]
+    spec = gpa_regression_spec(constraint_strs,deltas)
+    dataset = spec.dataset
+
+    def make_memmap_dataset(name,start,end):
+        filenames = {}
+        for attr in ["features","labels","sensitive_attrs"]:
+            filenames[attr] = os.path.join(tmp_path,f"{name}_{attr}.npy")
+            np.save(filenames[attr],getattr(dataset,attr)[start:end])
+        return load_memmap_supervised_dataset(
+            features_filename=filenames["features"],
+            labels_filename=filenames["labels"],
+            meta=dataset.meta,
+            sensitive_attrs_filename=filenames["sensitive_attrs"])
+
+    spec.dataset = make_memmap_dataset("dataset",0,1000)
+    spec.candidate_dataset = make_memmap_dataset("candidate",0,400)
+    spec.safety_dataset = make_memmap_dataset("safety",400,1000)
+    results_dir = os.path.join(tmp_path,"results")
+    # The engine writes its logs to the working directory
+    monkeypatch.chdir(tmp_path)
+    spg = SupervisedPlotGenerator(
+        spec=spec,
+        n_trials=1,
+        data_fracs=[0.5],
+        datagen_method="resample",
+        perf_eval_fn=MSE,
+        results_dir=results_dir,
+        n_workers=1,
+        constraint_eval_fns=[],
+        perf_eval_kwargs={'X':dataset.features,'y':dataset.labels},
+        constraint_eval_kwargs={})
+    spg.run_seldonian_experiment(verbose=False)
+    df = pd.read_csv(os.path.join(results_dir,"qsa_results","qsa_results.csv"))
+    assert len(df) == 1
+
+    for key in ["candidate_dataset","safety_dataset"]:
+        assert os.path.exists(os.path.join(
+            results_dir,"resampled_datasets",f"trial_0_{key}_indices.npy"))
+
+    spec_for_exp = setup_SA_spec_for_exp(
+        spec=spec,
+        regime="supervised_learning",
+        results_dir=results_dir,
+        trial_i=0,
+        data_frac=0.5,
+        datagen_method="resample",
+        batch_epoch_dict={},
+        kwargs={},
+        perf_eval_kwargs={})
+    # The trial datasets only hold this trial's rows
+    assert spec_for_exp.candidate_dataset.num_datapoints == 200
+    assert len(spec_for_exp.candidate_dataset.features) == 200
+    assert len(spec_for_exp.safety_dataset.features) == 300
+    # and the datasets that are not replaced are still memory-mapped
+    assert spec_for_exp.dataset is spec.dataset
+    assert isinstance(spec_for_exp.dataset.features,MemmapArray)
+    assert spec_for_exp.dataset.features.filename is not None
+
+def test_prep_merged_feat_labels(gpa_regression_spec):
+    """ Test that taking the prefix of the candidate dataset
+    followed by the safety dataset matches merging the
+    full datasets and then taking the prefix """
+    constraint_strs = ['Mean_Squared_Error - 2.0']
+    deltas = [0.05]
+    spec = gpa_regression_spec(constraint_strs,deltas)
+    dataset = spec.dataset
+    def make_subset(start,end):
+        return SupervisedDataSet(
+            features=dataset.features[start:end],
+            labels=dataset.labels[start:end],
+            sensitive_attrs=dataset.sensitive_attrs[start:end],
+            num_datapoints=end-start,
+            meta=dataset.meta)
+    cand_dataset = make_subset(0,400)
+    safety_dataset = make_subset(400,1000)
+    for n_points in [1,250,400,401,1000]:
+        features,labels,sensitive_attrs = prep_merged_feat_labels(
+            cand_dataset,safety_dataset,n_points,include_sensitive_attrs=True)
+        assert np.array_equal(features,dataset.features[:n_points])
+        assert np.array_equal(labels,dataset.labels[:n_points])
+        assert np.array_equal(sensitive_attrs,dataset.sensitive_attrs[:n_points])
+
+    # Prefix within the candidate dataset is not copied
+    features,labels = prep_merged_feat_labels(cand_dataset,safety_dataset,100)
+    assert np.shares_memory(features,cand_dataset.features)
+
+@pytest.mark.parametrize('experiment', ["./tests/static/results"], indirect=True)
+def test_custom_regime_indexed_datasets(custom_text_spec,experiment):
+    """ Test that resampled custom regime trials are views
+    of the original data rather than copies of it """
+    np.random.seed(42)
+    spec = custom_text_spec()
+    results_dir = "./tests/static/results"
+    spg = CustomPlotGenerator(
+        spec=spec,
+        n_trials=2,
+        data_fracs=[0.5],
+        datagen_method="resample",
+        perf_eval_fn=None,
+        results_dir=results_dir,
+        n_workers=1,
+        constraint_eval_fns=[],
+        perf_eval_kwargs={},
+        constraint_eval_kwargs={})
+    # Trial 1 was resampled by an older version, which
+    # pickled the resampled dataset in full
+    resampled_dir = os.path.join(results_dir,"resampled_datasets")
+    os.makedirs(resampled_dir,exist_ok=True)
+    legacy_dataset = CustomDataSet(data=spec.dataset.data[::-1],
+        sensitive_attrs=[],num_datapoints=spec.dataset.num_datapoints,
+        meta=spec.dataset.meta)
+    with open(os.path.join(resampled_dir,"trial_1.pkl"),"wb") as outfile:
+        pickle.dump(legacy_dataset,outfile)
+    spg.generate_resampled_datasets()
+    assert not os.path.exists(os.path.join(resampled_dir,"trial_1_indices.npy"))
+    trial_datasets,_,_ = load_resampled_datasets(
+        spec,results_dir,trial_i=1,data_frac=0.5)
+    assert trial_datasets["dataset"].data == legacy_dataset.data
+
+    indices = np.load(os.path.join(resampled_dir,"trial_0_indices.npy"))
+
+    trial_datasets,n_points_dict,_ = load_resampled_datasets(
+        spec,results_dir,trial_i=0,data_frac=0.5)
+    trial_dataset = trial_datasets["dataset"]
+    assert isinstance(trial_dataset.data,IndexedData)
+    assert trial_dataset.data.base is spec.dataset.data
+    assert len(trial_dataset.data) == spec.dataset.num_datapoints
+
+    n_points = n_points_dict["dataset"]
+    data = prep_custom_data(trial_dataset,n_points)
+    assert isinstance(data,list)
+    assert len(data) == n_points
+    for ii,sample in zip(indices[:n_points],data):
+        # References to, not copies of, the original samples
+        assert sample is spec.dataset.data[ii]
+
+    # Batched predictions on the view match predictions on the copy
+    theta = np.array([1.0,2.0,3.0])
+    y_pred = batch_predictions_custom_regime(
+        spec.model,theta,trial_dataset.data,eval_batch_size=7)
+    expected = spec.model.predict(
+        theta,[spec.dataset.data[ii] for ii in indices])
+    assert np.allclose(y_pred,expected)
+
+def test_compute_summary(tmp_path):
+    """ Test that the summary table matches aggregating
+    the results file with pandas and that it is cached
+    until the results file changes """
+    rng = np.random.default_rng(0)
+    n_constraints = 2
+    data_fracs = np.repeat([0.1,0.5,1.0],20)
+    trial_is = np.tile(np.arange(20),3)
+    gvecs = rng.normal(-0.1,0.2,size=(len(data_fracs),n_constraints))
+    gvecs[3,1] = np.nan
+    performance = rng.uniform(size=len(data_fracs))
+    passed_safety = rng.uniform(size=len(data_fracs)) > 0.3
+    baseline_performance = performance.copy()
+    baseline_performance[:5] = np.nan
+    for model_name,df in [
+        ("qsa",pd.DataFrame({"data_frac":data_fracs,"trial_i":trial_is,
+            "performance":performance,"passed_safety":passed_safety,
+            "gvec":[str(g) for g in gvecs]})),
+        ("logistic_regression",pd.DataFrame({"data_frac":data_fracs,"trial_i":trial_is,
+            "performance":baseline_performance,"gvec":[str(g) for g in gvecs]}))]:
+        os.makedirs(tmp_path / f"{model_name}_results")
+        df.to_csv(tmp_path / f"{model_name}_results" / f"{model_name}_results.csv",index=False)
+
+    summary = compute_summary(str(tmp_path),n_constraints)
+    assert set(summary["model"]) == {"qsa","logistic_regression"}
+    assert len(summary) == 2*n_constraints*3
+
+    for model_name,solution_returned in [
+        ("qsa",passed_safety),
+        ("logistic_regression",~np.isnan(baseline_performance))]:
+        for constraint_num in [1,2]:
+            this_summary = summary[(summary["model"]==model_name) &
+                (summary["constraint_num"]==constraint_num)]
+            g = gvecs[:,constraint_num-1]
+            df = pd.DataFrame({"data_frac":data_fracs,"sr":solution_returned,
+                "failed":(g > 0) | np.isnan(g)})
+            df_valid = pd.DataFrame({"data_frac":data_fracs[solution_returned],
+                "performance":performance[solution_returned]})
+            assert np.allclose(this_summary["solution_rate"],
+                df.groupby("data_frac").mean()["sr"])
+            assert np.allclose(this_summary["failure_rate"],
+                df.groupby("data_frac").mean()["failed"])
+            assert np.allclose(this_summary["failure_rate_ste"],
+                df.groupby("data_frac").std()["failed"]/np.sqrt(20))
+            assert np.allclose(this_summary["performance_mean"],
+                df_valid.groupby("data_frac").mean()["performance"])
+            n_valid = df_valid.groupby("data_frac").count()["performance"]
+            assert np.array_equal(this_summary["performance_count"],n_valid)
+            assert np.allclose(this_summary["performance_ste"],
+                df_valid.groupby("data_frac").std()["performance"]/np.sqrt(n_valid))
+
+    # The cached summary is used until the results file changes
+    summary_file = tmp_path / "qsa_results" / "qsa_summary.pkl"
+    assert summary_file.exists()
+    mtime = os.stat(summary_file).st_mtime_ns
+    compute_summary(str(tmp_path),n_constraints)
+    assert os.stat(summary_file).st_mtime_ns == mtime
+    results_file = tmp_path / "qsa_results" / "qsa_results.csv"
+    df = pd.read_csv(results_file)
+    df.iloc[:20].to_csv(results_file,index=False)
+    summary = compute_summary(str(tmp_path),n_constraints,ignore_models=["logistic_regression"])
+    assert list(summary["data_frac"]) == [0.1,0.1]
+
+def test_streaming_results_store(gpa_regression_spec,tmp_path):
+    """ Test that trial results are appended to the consolidated
+    results file as they complete and that the running statistics
+    match summarizing the whole file """
+    np.random.seed(42)
+    constraint_strs = ['Mean_Squared_Error - 2.0']
+    deltas = [0.05]
+    spec = gpa_regression_spec(constraint_strs,deltas)
+    dataset = spec.dataset
+    results_dir = str(tmp_path)
+    spg = SupervisedPlotGenerator(
+        spec=spec,
+        n_trials=3,
+        data_fracs=[0.1,0.5],
+        datagen_method="resample",
+        perf_eval_fn=MSE,
+        results_dir=results_dir,
+        n_workers=2,
+        constraint_eval_fns=[],
+        perf_eval_kwargs={'X':dataset.features,'y':dataset.labels},
+        constraint_eval_kwargs={})
+    baseline = LinearRegressionBaseline()
+    spg.run_baseline_experiment(baseline_model=baseline,verbose=False)
+
+    results_file = os.path.join(results_dir,
+        "linear_regression_results","linear_regression_results.csv")
+    df = pd.read_csv(results_file)
+    assert len(df) == 6
+    assert set(zip(df["data_frac"],df["trial_i"])) == set(
+        (data_frac,trial_i) for data_frac in [0.1,0.5] for trial_i in range(3))
+
+    # Reopening the store recovers the running statistics from the file
+    store = StreamingResultsStore(results_dir,"linear_regression")
+    assert store.n_constraints == 1
+    expected = summarize_results(df,1,seldonian=False)
+    running = store.summary()
+    for col in expected.columns:
+        assert np.allclose(running[col],expected[col],equal_nan=True)
+
+    # Rows that are already recorded are replaced, not appended again
+    store.add_rows(df.iloc[:2])
+    assert len(pd.read_csv(results_file)) == 6
+
+    # Trials recorded by an earlier run are skipped, and trial
+    # files that were never recorded are picked up at the end
+    os.remove(results_file)
+    spg.n_trials = 4
+    spg.run_baseline_experiment(baseline_model=baseline,verbose=False)
+    df = pd.read_csv(results_file)
+    assert len(df) == 8
+    assert len(set(zip(df["data_frac"],df["trial_i"]))) == 8
+    # The ground truth contexts of the runs were released
+    assert experiment_utils._ground_truth_contexts == {}
+
+def test_rerun_trials_replace_results(gpa_regression_spec,tmp_path):
+    """ Test that the consolidated results file follows the
+    trial files when trials are rerun or the run changes """
+    np.random.seed(42)
+    constraint_strs = ['Mean_Squared_Error - 2.0']
+    deltas = [0.05]
+    spec = gpa_regression_spec(constraint_strs,deltas)
+    dataset = spec.dataset
+    results_dir = str(tmp_path)
+    model_dir = os.path.join(results_dir,"linear_regression_results")
+    results_file = os.path.join(model_dir,"linear_regression_results.csv")
+    trial_file = os.path.join(model_dir,"trial_data","data_frac_0.1000_trial_0.csv")
+
+    # A fresh result replaces the recorded one
+    store = StreamingResultsStore(results_dir,"linear_regression")
+    row = {"data_frac":0.1,"trial_i":0,"performance":0.1,"gvec":"[-1.0]"}
+    store.add(row)
+    store.add(dict(row,trial_i=1))
+    store.add(dict(row,performance=0.9))
+    df = pd.read_csv(results_file)
+    assert list(zip(df["trial_i"],df["performance"])) == [(1,0.1),(0,0.9)]
+    assert np.allclose(store.summary()["performance_mean"],0.5)
+
+    # Without a trial file, the row is dropped when the store is opened
+    store = StreamingResultsStore(results_dir,"linear_regression")
+    assert not store.has_trial(0.1,0)
+    assert len(pd.read_csv(results_file)) == 0
+
+    spg = SupervisedPlotGenerator(
+        spec=spec,
+        n_trials=2,
+        data_fracs=[0.1,0.5],
+        datagen_method="resample",
+        perf_eval_fn=MSE,
+        results_dir=results_dir,
+        n_workers=1,
+        constraint_eval_fns=[],
+        perf_eval_kwargs={'X':dataset.features,'y':dataset.labels},
+        constraint_eval_kwargs={})
+    baseline = LinearRegressionBaseline()
+    spg.run_baseline_experiment(baseline_model=baseline,verbose=False)
+    assert len(pd.read_csv(results_file)) == 4
+
+    # Deleting a trial file reruns the trial and records the new result
+    df = pd.read_csv(results_file)
+    df.loc[(df["data_frac"] == 0.1) & (df["trial_i"] == 0),"performance"] = -1.0
+    df.to_csv(results_file,index=False)
+    os.remove(trial_file)
+    spg.run_baseline_experiment(baseline_model=baseline,verbose=False)
+    df = pd.read_csv(results_file)
+    assert len(df) == 4
+    rerun = df[(df["data_frac"] == 0.1) & (df["trial_i"] == 0)]
+    assert len(rerun) == 1
+    assert rerun["performance"].iloc[0] == pd.read_csv(trial_file)["performance"].iloc[0]
+    assert rerun["performance"].iloc[0] != -1.0
+
+    # A smaller run only keeps its own trials
+    spg.n_trials = 1
+    spg.data_fracs = [0.5]
+    spg.run_baseline_experiment(baseline_model=baseline,verbose=False)
+    df = pd.read_csv(results_file)
+    assert list(zip(df["data_frac"],df["trial_i"])) == [(0.5,0)]
+
+def test_experiment_monitor(gpa_regression_spec,tmp_path):
+    """ Test the progress reported by the monitor
+    and the plots of partial results """
+    np.random.seed(42)
+    constraint_strs = ['Mean_Squared_Error - 2.0']
+    deltas = [0.05]
+    spec = gpa_regression_spec(constraint_strs,deltas)
+    dataset = spec.dataset
+    results_dir = str(tmp_path)
+    spg = SupervisedPlotGenerator(
+        spec=spec,
+        n_trials=3,
+        data_fracs=[0.1,0.5],
+        datagen_method="resample",
+        perf_eval_fn=MSE,
+        results_dir=results_dir,
+        n_workers=1,
+        constraint_eval_fns=[],
+        perf_eval_kwargs={'X':dataset.features,'y':dataset.labels},
+        constraint_eval_kwargs={})
+    spg.run_baseline_experiment(baseline_model=LinearRegressionBaseline(),verbose=False)
+
+    run_info = load_run_info(results_dir,"linear_regression")
+    assert run_info["data_fracs"] == [0.1,0.5]
+    assert run_info["n_trials"] == 3
+    assert run_info["constraint_strs"] == constraint_strs
+    assert run_info["tot_data_size"] == dataset.num_datapoints
+
+    per_frac,overall = experiment_progress(results_dir)
+    assert list(per_frac["completed"]) == [3,3]
+    assert list(per_frac["pending"]) == [0,0]
+    assert overall["completed"][0] == 6
+    assert overall["eta_min"][0] == 0
+    assert overall["trials_per_min"][0] > 0
+
+    # Pretend the last trial of data_frac=0.5 is still running
+    os.remove(os.path.join(results_dir,"linear_regression_results",
+        "trial_data","data_frac_0.5000_trial_2.csv"))
+    per_frac,overall = experiment_progress(results_dir)
+    assert list(per_frac["pending"]) == [0,1]
+    assert overall["workers_busy"][0] == 1
+    assert np.isfinite(overall["eta_min"][0])
+    assert "linear_regression: 5/6 trials" in format_progress(per_frac,overall)
+
+    savename = os.path.join(results_dir,"partial.png")
+    assert render_partial_plots(results_dir,savename)
+    assert os.path.getsize(savename) > 0
+
+    # The same progress is served over HTTP
+    import threading
+    import json
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+    server = make_server(results_dir,port=0)
+    thread = threading.Thread(target=server.serve_forever,daemon=True)
+    thread.start()
+    try:
+        url = f"http://localhost:{server.server_address[1]}"
+        with urllib.request.urlopen(url + "/progress.json") as response:
+            progress = json.load(response)
+        assert progress["overall"][0]["completed"] == 5
+
+        # Concurrent requests for the plots all succeed
+        def get_plots(_):
+            with urllib.request.urlopen(url + "/plots.png") as response:
+                return response.headers["Content-Type"],response.read()[:8]
+        with ThreadPoolExecutor(4) as ex:
+            responses = list(ex.map(get_plots,range(4)))
+        for content_type,header in responses:
+            assert content_type == "image/png"
+            assert header == b"\x89PNG\r\n\x1a\n"
+        model_dir = os.path.join(results_dir,"linear_regression_results")
+        assert not [f for f in os.listdir(model_dir) if f.endswith(".tmp")]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_importance_weight_store(gridworld_spec,tmp_path):
+    """ Test that the importance weights of all trials are saved in
+    one file with per-trial statistics, and plotted from it """
+    results_dir = str(tmp_path)
+    store = ImportanceWeightStore(results_dir,"qsa")
+    weights = np.array([0.5,1.5,2.0,0.0])
+    store.add("candidate_selection",0.1,0,weights)
+    store.add("candidate_selection",0.1,1,2*weights[:3])
+    # Already recorded, so skipped
+    store.add("candidate_selection",0.1,0,weights+1)
+    assert len(store.index) == 2
+    mean,max_weight,ess = importance_weight_stats(weights)
+    assert mean == pytest.approx(1.0)
+    assert max_weight == 2.0
+    assert ess == pytest.approx(16/6.5)
+    np.testing.assert_array_equal(
+        store.get_weights("candidate_selection",0.1,0),weights)
+    np.testing.assert_array_equal(
+        store.get_weights("candidate_selection",0.1,1),2*weights[:3])
+    assert store.get_weights("safety_test",0.1,0) is None
+
+    # The index is read back from disk
+    store = ImportanceWeightStore(results_dir,"qsa")
+    assert list(store.index["length"]) == [4,3]
+    assert store.index["mean"][1] == pytest.approx(8/3)
+
+    # Weights saved one pickle file per trial can be imported
+    legacy_dir = os.path.join(results_dir,"qsa_results",
+        "importance_weights","safety_test")
+    os.makedirs(legacy_dir)
+    for trial_i in range(2):
+        filename = os.path.join(legacy_dir,
+            f"importance_weights_frac_0.1000_trial_{trial_i}.pkl")
+        with open(filename,'wb') as outfile:
+            pickle.dump(weights*(trial_i+1),outfile)
+    store.import_trial_pickles([0.1],n_trials=3)
+    np.testing.assert_array_equal(
+        store.get_weights("safety_test",0.1,1),2*weights)
+
+    # Plot from the store
+    spec = gridworld_spec(['J_pi_new_IS >= - 0.25'],[0.05])
+    hyperparameter_and_setting_dict = {}
+    hyperparameter_and_setting_dict["env"] = Gridworld()
+    hyperparameter_and_setting_dict["agent"] = "Parameterized_non_learning_softmax_agent"
+    hyperparameter_and_setting_dict["num_episodes"] = 100
+    hyperparameter_and_setting_dict["num_trials"] = 1
+    hyperparameter_and_setting_dict["vis"] = False
+    spg = RLPlotGenerator(
+        spec=spec,
+        n_trials=2,
+        data_fracs=[0.1],
+        datagen_method="generate_episodes",
+        hyperparameter_and_setting_dict=hyperparameter_and_setting_dict,
+        perf_eval_fn=generate_episodes_and_calc_J,
+        results_dir=results_dir,
+        n_workers=1,
+        constraint_eval_fns=[],
+        perf_eval_kwargs={'n_episodes_for_eval':10},
+        constraint_eval_kwargs={})
+    savename = os.path.join(results_dir,"importance_weights.png")
+    spg.plot_importance_weights(n_trials=2,data_fracs=[0.1],
+        save_format="png",savename=savename)
+    assert os.path.exists(savename)
+
+    # Trials run in worker processes record their weights in this one
+    spec = gridworld_spec(['J_pi_new_IS >= - 10.0'],[0.05])
+    spec.optimization_hyperparams['num_iters'] = 5
+    spg = RLPlotGenerator(
+        spec=spec,
+        n_trials=2,
+        data_fracs=[1.0],
+        datagen_method="generate_episodes",
+        hyperparameter_and_setting_dict=hyperparameter_and_setting_dict,
+        perf_eval_fn=generate_episodes_and_calc_J,
+        results_dir=str(tmp_path / "parallel"),
+        n_workers=2,
+        constraint_eval_fns=[],
+        perf_eval_kwargs={'n_episodes_for_eval':10},
+        constraint_eval_kwargs={})
+    spg.run_seldonian_experiment(verbose=False,save_importance_weights=True)
+    store = ImportanceWeightStore(str(tmp_path / "parallel"),"qsa")
+    assert len(store.index) == 4
+    for trial_i in range(2):
+        for branch in ["candidate_selection","safety_test"]:
+            assert store.get_weights(branch,1.0,trial_i) is not None
+
+def test_render_figures(gpa_regression_spec,tmp_path):
+    """ Test rendering the plots of several results
+    directories and skipping the ones that are up to date """
+    np.random.seed(42)
+    constraint_strs = ['Mean_Squared_Error - 2.0']
+    deltas = [0.05]
+    spec = gpa_regression_spec(constraint_strs,deltas)
+    dataset = spec.dataset
+    results_dirs = [str(tmp_path / "exp0"),str(tmp_path / "exp1")]
+    for ii,results_dir in enumerate(results_dirs):
+        spg = SupervisedPlotGenerator(
+            spec=spec,
+            n_trials=2,
+            data_fracs=[0.1,0.5+0.1*ii],
+            datagen_method="resample",
+            perf_eval_fn=MSE,
+            results_dir=results_dir,
+            n_workers=1,
+            constraint_eval_fns=[],
+            perf_eval_kwargs={'X':dataset.features,'y':dataset.labels},
+            constraint_eval_kwargs={})
+        spg.run_baseline_experiment(baseline_model=LinearRegressionBaseline(),verbose=False)
+
+    figures = [results_dirs[0],
+        {"results_dir":results_dirs[1],"custom_title":"Second"}]
+    statuses = render_figures(figures,n_workers=2,save_format="png")
+    assert [status for _,status in statuses] == ["rendered","rendered"]
+    savenames = [savename for savename,_ in statuses]
+    assert savenames[0] == os.path.join(results_dirs[0],"plots.png")
+    for savename in savenames:
+        assert os.path.getsize(savename) > 0
+
+    # Nothing changed
+    statuses = render_figures(figures,n_workers=2,save_format="png")
+    assert [status for _,status in statuses] == ["skipped","skipped"]
+
+    # Modified but identical results are not a change
+    results_file = os.path.join(results_dirs[0],
+        "linear_regression_results","linear_regression_results.csv")
+    os.utime(results_file,ns=(1,1))
+    statuses = render_figures(figures,save_format="png")
+    assert [status for _,status in statuses] == ["skipped","skipped"]
+
+    # New results or parameters are
+    df = pd.read_csv(results_file)
+    df.iloc[:1].to_csv(results_file,index=False)
+    statuses = render_figures(figures,save_format="png")
+    assert [status for _,status in statuses] == ["rendered","skipped"]
+    statuses = render_figures(figures,save_format="png",performance_label="MSE")
+    assert [status for _,status in statuses] == ["rendered","rendered"]
+    # Rendering in this process switches it to Agg
+    import matplotlib
+    backend = matplotlib.get_backend()
+    matplotlib.use("pdf")
+    try:
+        statuses = render_figures(figures,save_format="png",
+            performance_label="MSE",force=True)
+        assert [status for _,status in statuses] == ["rendered","rendered"]
+        assert matplotlib.get_backend().lower() == "agg"
+    finally:
+        matplotlib.use(backend)
+
+def test_confidence_intervals(tmp_path):
+    """ Test the Wilson, Clopper-Pearson and bootstrap
+    intervals and their use in the summary table """
+    from scipy.stats import beta
+    successes = np.array([0,3,10])
+    n = np.array([10,10,10])
+    low,high = wilson_interval(successes,n,confidence=0.95)
+    assert low[0] == pytest.approx(0.0,abs=1e-12)
+    assert high[0] == pytest.approx(0.2775,abs=1e-4)
+    assert low[1] == pytest.approx(0.1078,abs=1e-4)
+    assert high[1] == pytest.approx(0.6032,abs=1e-4)
+    assert high[2] == pytest.approx(1.0)
+    low,high = clopper_pearson_interval(successes,n,confidence=0.9)
+    assert np.allclose(low,[0,beta.ppf(0.05,3,8),beta.ppf(0.05,10,1)])
+    assert np.allclose(high,[beta.ppf(0.95,1,10),beta.ppf(0.95,4,7),1])
+    low,high = clopper_pearson_interval(np.array([0]),np.array([0]))
+    assert np.isnan(low[0]) and np.isnan(high[0])
+
+    # Bootstrap intervals of several groups and quantities at once
+    rng = np.random.default_rng(0)
+    group_ids = np.repeat([0.5,0.1,1.0],[2000,500,3])
+    quantities = np.column_stack([rng.normal(1.0,2.0,size=len(group_ids)),
+        np.full(len(group_ids),0.25),np.full(len(group_ids),np.nan)])
+    groups,low,high = bootstrap_intervals(group_ids,quantities,
+        n_resamples=500,seed=1,max_elements=10000)
+    assert list(groups) == [0.1,0.5,1.0]
+    assert low.shape == (3,3)
+    for ii,group in enumerate(groups):
+        values = quantities[group_ids == group,0]
+        ste = np.std(values,ddof=1)/np.sqrt(len(values))
+        assert low[ii,0] < np.mean(values) < high[ii,0]
+        if len(values) > 100:
+            assert high[ii,0] - low[ii,0] == pytest.approx(2*1.96*ste,rel=0.15)
+    assert np.allclose(low[:,1],0.25) and np.allclose(high[:,1],0.25)
+    assert np.isnan(low[:,2]).all()
+    # Same seed, same intervals, regardless of the chunk size
+    _,low2,high2 = bootstrap_intervals(group_ids,quantities,
+        n_resamples=500,seed=1)
+    assert np.allclose(low[:,:2],low2[:,:2]) and np.allclose(high[:,:2],high2[:,:2])
+
+    # Intervals in the summary table
+    data_fracs = np.repeat([0.1,1.0],50)
+    gvecs = np.where(np.arange(100) % 10 == 0,0.1,-0.1)
+    df = pd.DataFrame({"data_frac":data_fracs,"trial_i":np.tile(np.arange(50),2),
+        "performance":rng.uniform(size=100),"passed_safety":True,
+        "gvec":[str(np.array([g])) for g in gvecs]})
+    results_dir = tmp_path / "qsa_results"
+    os.makedirs(results_dir)
+    df.to_csv(results_dir / "qsa_results.csv",index=False)
+    summary = compute_summary(str(tmp_path),1)
+    assert np.allclose(summary["failure_rate_high"],
+        summary["failure_rate"]+summary["failure_rate_ste"])
+    summary = compute_summary(str(tmp_path),1,interval="wilson",confidence=0.9)
+    low,high = wilson_interval(np.array([5,5]),np.array([50,50]),confidence=0.9)
+    assert np.allclose(summary["failure_rate_low"],low)
+    assert np.allclose(summary["failure_rate_high"],high)
+    assert np.allclose(summary["solution_rate_high"],1)
+    summary = compute_summary(str(tmp_path),1,interval="bootstrap")
+    assert (summary["performance_low"] < summary["performance_mean"]).all()
+    assert (summary["performance_high"] > summary["performance_mean"]).all()
+    with pytest.raises(NotImplementedError):
+        summarize_results(df,1,interval="bad_interval")
+
+def test_grouped_stats():
+    """ Test that the statistics computed from the sorted
+    segments of each group match pandas groupby """
+    rng = np.random.default_rng(0)
+    group_ids = rng.choice([0.01,0.1,0.5,1.0],size=5000)
+    group_ids[:3] = 0.25
+    quantities = rng.normal(size=(5000,3))
+    quantities[rng.uniform(size=5000) < 0.2,0] = np.nan
+    quantities[group_ids == 0.25,2] = np.nan
+    quantities[np.flatnonzero(group_ids == 0.25)[1:],1] = np.nan
+    expected = pd.DataFrame(quantities).groupby(group_ids).agg(
+        ["count","mean","std"])
+    for ids,values in [(group_ids,quantities),
+        (np.sort(group_ids),quantities[np.argsort(group_ids,kind="stable")])]:
+        groups,count,mean,std = grouped_stats(ids,values)
+        assert np.array_equal(groups,expected.index)
+        assert np.array_equal(count,expected.xs("count",axis=1,level=1))
+        assert np.allclose(mean,expected.xs("mean",axis=1,level=1),equal_nan=True)
+        assert np.allclose(std,expected.xs("std",axis=1,level=1),equal_nan=True)
+    groups,count,mean,std = grouped_stats(np.array([]),np.empty((0,3)))
+    assert len(groups) == 0 and count.shape == (0,3)
+
+def test_load_summary(tmp_path,monkeypatch):
+    """ Test loading the summary of a results directory
+    without the spec and without importing matplotlib """
+    import sys
+    import json
+    import subprocess
+    rng = np.random.default_rng(0)
+    data_fracs = np.repeat([0.1,1.0],10)
+    gvecs = rng.normal(-0.1,0.2,size=(20,2))
+    df = pd.DataFrame({"data_frac":data_fracs,"trial_i":np.tile(np.arange(10),2),
+        "performance":rng.uniform(size=20),"gvec":[str(g) for g in gvecs]})
+    results_dir = str(tmp_path)
+    os.makedirs(tmp_path / "random_classifier_results")
+    df.to_csv(tmp_path / "random_classifier_results" / "random_classifier_results.csv",
+        index=False)
+
+    # Number of constraints read from the results
+    cache_filename = tmp_path / "random_classifier_results" / "random_classifier_summary.pkl"
+    summary = load_summary(results_dir,use_cache=False)
+    assert len(summary) == 4
+    assert not os.path.exists(cache_filename)
+
+    # Results on a read-only mount are summarized in memory
+    def read_only(*args,**kwargs):
+        raise PermissionError("Read-only file system")
+    with monkeypatch.context() as m:
+        m.setattr(os,"replace",read_only)
+        assert load_summary(results_dir).equals(summary)
+    assert not os.path.exists(cache_filename)
+    assert os.listdir(tmp_path / "random_classifier_results") == ["random_classifier_results.csv"]
+
+    summary = load_summary(results_dir)
+    assert os.path.exists(cache_filename)
+    assert len(summary) == 4
+    assert "constraint_str" not in summary
+    assert np.allclose(summary["solution_rate"],1)
+
+    save_run_info(results_dir,"random_classifier",{"data_fracs":[0.1,1.0],
+        "n_trials":10,"n_workers":1,"started":0,
+        "constraint_strs":["g1","g2"],"deltas":[0.05,0.1],"tot_data_size":500})
+    json_filename = os.path.join(results_dir,"summary.json")
+    summary = load_summary(results_dir,json_filename=json_filename)
+    assert list(summary["constraint_str"]) == ["g1","g1","g2","g2"]
+    assert list(summary["delta"]) == [0.05,0.05,0.1,0.1]
+    assert list(summary["data_size"]) == [50,500]*2
+    with open(json_filename,"r") as infile:
+        rows = json.load(infile)
+    assert len(rows) == 4
+    assert rows[3]["model"] == "random_classifier"
+    assert rows[3]["failure_rate"] == pytest.approx(summary["failure_rate"][3])
+
+    # Reading the results does not import the plotting
+    # or deep learning libraries
+    code = (
+        "import sys\n"
+        "from experiments.results import load_summary\n"
+        f"summary = load_summary({results_dir!r})\n"
+        "print(len(summary))\n"
+        "print(','.join(m for m in ['matplotlib','torch','seldonian','sklearn'] "
+        "if m in sys.modules))\n"
+    )
+    output = subprocess.run([sys.executable,"-c",code],capture_output=True,
+        text=True,check=True).stdout.split("\n")
+    assert output[0] == "4"
+    assert output[1] == ""
+
+def test_fairlearn_sweep(gpa_regression_spec,tmp_path):
+    """ Test that a Fairlearn sweep over several values of epsilon
+    writes the same results as separate Fairlearn experiments,
+    and that it only reruns the trials that are missing """
+    import shutil
+    constraint_strs = ['Mean_Squared_Error - 2.0']
+    deltas = [0.05]
+    spec = gpa_regression_spec(constraint_strs,deltas)
+    dataset = spec.dataset
+    # Fairlearn needs a classification dataset
+    labels = (dataset.labels > np.median(dataset.labels)).astype(float)
+    spec.dataset = SupervisedDataSet(
+        features=dataset.features,
+        labels=labels,
+        sensitive_attrs=dataset.sensitive_attrs,
+        num_datapoints=dataset.num_datapoints,
+        meta=dataset.meta)
+    epsilons = [0.1,0.5]
+    fairlearn_kwargs = dict(
+        fairlearn_sensitive_feature_names=["M"],
+        fairlearn_constraint_name="demographic_parity",
+        fairlearn_epsilon_eval=0.05,
+        fairlearn_eval_kwargs={
+            "X":dataset.features,
+            "y":labels,
+            "sensitive_features":dataset.sensitive_attrs[:,[0]],
+            "eval_method":"two-groups"})
+
+    def make_plot_generator(results_dir):
+        return SupervisedPlotGenerator(
+            spec=spec,
+            n_trials=1,
+            data_fracs=[0.1,0.2],
+            datagen_method="resample",
+            perf_eval_fn=probabilistic_accuracy,
+            results_dir=results_dir,
+            n_workers=1,
+            constraint_eval_fns=[],
+            perf_eval_kwargs={'X':dataset.features,'y':labels},
+            constraint_eval_kwargs={})
+
+    np.random.seed(42)
+    sweep_dir = os.path.join(tmp_path,"sweep")
+    make_plot_generator(sweep_dir).run_fairlearn_sweep(
+        fairlearn_epsilons_constraint=epsilons,**fairlearn_kwargs)
+
+    # Separate experiments on the same resampled datasets
+    separate_dir = os.path.join(tmp_path,"separate")
+    shutil.copytree(os.path.join(sweep_dir,"resampled_datasets"),
+        os.path.join(separate_dir,"resampled_datasets"))
+    for epsilon in epsilons:
+        make_plot_generator(separate_dir).run_fairlearn_experiment(
+            fairlearn_epsilon_constraint=epsilon,**fairlearn_kwargs)
+
+    def load_results(results_dir,model_name):
+        df = pd.read_csv(os.path.join(results_dir,f"{model_name}_results",
+            f"{model_name}_results.csv"))
+        return df.sort_values(["data_frac","trial_i"]).reset_index(drop=True)
+
+    model_names = [f"fairlearn_eps{epsilon:.2f}" for epsilon in epsilons]
+    for model_name in model_names:
+        df = load_results(sweep_dir,model_name)
+        assert len(df) == 2
+        pd.testing.assert_frame_equal(df,load_results(separate_dir,model_name))
+
+    # Only the missing trial of one epsilon is run again
+    trial_files = {model_name:os.path.join(sweep_dir,f"{model_name}_results",
+        "trial_data","data_frac_0.2000_trial_0.csv") for model_name in model_names}
+    mtime_kept = os.stat(trial_files[model_names[0]]).st_mtime_ns
+    os.remove(trial_files[model_names[1]])
+    make_plot_generator(sweep_dir).run_fairlearn_sweep(
+        fairlearn_epsilons_constraint=epsilons,**fairlearn_kwargs)
+    assert os.stat(trial_files[model_names[0]]).st_mtime_ns == mtime_kept
+    assert os.path.exists(trial_files[model_names[1]])
+    for model_name in model_names:
+        pd.testing.assert_frame_equal(load_results(sweep_dir,model_name),
+            load_results(separate_dir,model_name))
+
+def test_worker_start_methods(gpa_regression_spec,tmp_path):
+    """ Test that trials give the same results whichever
+    way the worker processes are started """
+    import multiprocessing as mp
+    constraint_strs = ['Mean_Squared_Error - 2.0']
+    deltas = [0.05]
+    spec = gpa_regression_spec(constraint_strs,deltas)
+    dataset = spec.dataset
+    with pytest.raises(ValueError):
+        get_mp_context("bad_method")
+
+    results = {}
+    for start_method in ["fork","forkserver","spawn"]:
+        if start_method not in mp.get_all_start_methods():
+            continue
+        np.random.seed(42)
+        results_dir = str(tmp_path / start_method)
+        spg = SupervisedPlotGenerator(
+            spec=spec,
+            n_trials=2,
+            data_fracs=[0.1,0.5],
+            datagen_method="resample",
+            perf_eval_fn=MSE,
+            results_dir=results_dir,
+            n_workers=2,
+            constraint_eval_fns=[],
+            perf_eval_kwargs={'X':dataset.features,'y':dataset.labels},
+            constraint_eval_kwargs={})
+        set_start_method(start_method)
+        try:
+            assert get_mp_context().get_start_method() == start_method
+            spg.run_baseline_experiment(baseline_model=LinearRegressionBaseline(),verbose=False)
+        finally:
+            set_start_method(None)
+        df = pd.read_csv(os.path.join(results_dir,"linear_regression_results",
+            "linear_regression_results.csv"))
+        results[start_method] = df.sort_values(["data_frac","trial_i"]).reset_index(drop=True)
+    assert "fork" in results and len(results["fork"]) == 4
+    for start_method in results:
+        pd.testing.assert_frame_equal(results[start_method],results["fork"])